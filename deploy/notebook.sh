@@ -1,3 +1,5 @@
 #!/bin/bash
+# each kernel holds at most one shared database connection, closed when idle
+export MICRONS_MANUAL_PROOFREADING_DB_IDLE_TIMEOUT=${MICRONS_MANUAL_PROOFREADING_DB_IDLE_TIMEOUT:-300}
 cd /notebooks
 jupyter lab --ip=0.0.0.0 --allow-root --NotebookApp.token=${JUPYTER_PASSWORD:-} --no-browser
\ No newline at end of file
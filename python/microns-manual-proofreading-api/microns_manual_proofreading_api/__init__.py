@@ -1,13 +1,30 @@
+import os
 from microns_utils import version_utils
 
-__version__ = version_utils.check_package_version(
-    package='microns-manual-proofreading-api', 
-    check_if_latest=True, 
-    check_if_latest_kwargs=dict(
-        owner='cajal', 
-        repo='microns-manual-proofreading', 
-        source='tag', 
+lazy = os.environ.get('MICRONS_MANUAL_PROOFREADING_LAZY', '').lower() in ('1', 'true')
+
+
+def _check_package_version(check_if_latest):
+    return version_utils.check_package_version(
+        package='microns-manual-proofreading-api', 
+        check_if_latest=check_if_latest, 
+        check_if_latest_kwargs=dict(
+            owner='cajal', 
+            repo='microns-manual-proofreading', 
+            source='tag', 
+        )
     )
-)
+
+
+if lazy:
+    # version is resolved on first access and not checked against Github, use check_latest_version_from_github
+    def __getattr__(name):
+        if name == '__version__':
+            global __version__
+            __version__ = _check_package_version(check_if_latest=False)
+            return __version__
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+else:
+    __version__ = _check_package_version(check_if_latest=True)
 
 check_latest_version_from_github = version_utils.latest_github_version_checker(owner='cajal', repo='microns-manual-proofreading')
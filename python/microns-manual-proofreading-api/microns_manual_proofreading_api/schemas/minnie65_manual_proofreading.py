@@ -10,11 +10,13 @@ from microns_utils.misc_utils import classproperty
 from microns_materialization_api.schemas import minnie65_materialization as m65mat
 
 from ..config import minnie65_manual_proofreading_config as config
+from ..utils.connection_utils import shared_conn
+from ..utils.schema_utils import Schema
 
 config.register_externals()
 config.register_adapters(context=locals())
 
-schema = djp.schema(config.schema_name, create_schema=True)
+schema = Schema(config.schema_name, create_schema=True, connection=shared_conn())
 
 
 @schema
@@ -41,6 +43,22 @@ class ImportMethod(djp.Lookup):
         path_to_csv : varchar(1000) # path to csv file
         """
 
+    class ExcelPrfSheetContent(djp.Part):
+        enable_hashing = True
+        hash_name = 'import_method'
+        hashed_attrs = 'version', 'content_hash'
+        definition = """
+        # proofreading sheet identified by its content
+        -> master
+        ---
+        version : int # method version
+        path_to_csv : varchar(1000) # path to csv file when last registered
+        content_hash : char(64) # sha256 of csv file
+        size : bigint unsigned # size of csv file in bytes
+        -> [nullable] master.proj(base_import_method='import_method') # previous content of the sheet at path_to_csv, if any
+        ts_inserted=CURRENT_TIMESTAMP : timestamp # timestamp inserted
+        """
+
     class CAVE(djp.Part):
         enable_hashing = True
         hash_name = 'import_method'
@@ -152,7 +170,7 @@ class PrfNucleusSet(djp.Lookup):
         """
         @classproperty
         def key_source(self):
-            return ImportMethod.ExcelPrfSheet
+            return ImportMethod.ExcelPrfSheet.proj() + ImportMethod.ExcelPrfSheetContent.proj()
 
     class CAVEMaker(djp.Part, dj.Computed):
         enable_hashing = True
@@ -173,6 +191,7 @@ class PrfNucleusSet(djp.Lookup):
     class CAVEProofreadingStatus(djp.Part):
         hash_name = 'prf_nuc_set'
         definition = """
+        # CAVE set stored in full, sets stored as changes are in CAVEDelta
         -> m65mat.Nucleus
         -> master
         ---
@@ -180,6 +199,62 @@ class PrfNucleusSet(djp.Lookup):
         status_axon : varchar(450) # axon proofreading status
         """
 
+    class CAVEDelta(djp.Part):
+        hash_name = 'prf_nuc_set'
+        definition = """
+        # CAVE set stored as changes relative to a base set
+        -> master
+        ---
+        -> master.proj(base_prf_nuc_set='prf_nuc_set')
+        chain_length : smallint unsigned # number of deltas from the nearest full set to this set, including this one
+        n_added : int unsigned # number of nuclei added relative to base set
+        n_removed : int unsigned # number of nuclei removed relative to base set
+        n_changed : int unsigned # number of nuclei with changed status relative to base set
+        ts_inserted=CURRENT_TIMESTAMP : timestamp # timestamp inserted
+        """
+
+    class CAVEProofreadingStatusDelta(djp.Part):
+        hash_name = 'prf_nuc_set'
+        definition = """
+        -> master.CAVEDelta
+        nucleus_id : int unsigned # id of segmented nucleus
+        ---
+        change : enum('added', 'removed', 'changed') # change relative to base set
+        status_dendrite=NULL : varchar(450) # dendrite proofreading status, NULL if removed
+        status_axon=NULL : varchar(450) # axon proofreading status, NULL if removed
+        """
+
+
+@schema
+class PrfThroughput(djp.Computed):
+    definition = """
+    # proofreading throughput of an ExcelPrfSheet set
+    -> PrfNucleusSet
+    ---
+    n_rows : int unsigned # number of sheet rows aggregated
+    ts_inserted=CURRENT_TIMESTAMP : timestamp # timestamp inserted
+    """
+
+    @classproperty
+    def key_source(cls):
+        return PrfNucleusSet & PrfNucleusSet.ExcelPrfSheetMaker.proj()
+
+    class Rollup(djp.Part):
+        definition = """
+        -> master
+        compartment : enum('dendrite', 'axon') # proofread compartment
+        proofreader : varchar(450) # name of proofreader, 'unknown' if missing
+        area : varchar(10) # visual area, 'unknown' if missing
+        -> PrfMethod
+        week : varchar(10) # Monday of week finished (YYYY-MM-DD), 'unknown' if missing
+        ---
+        n_nuclei : int unsigned # number of nuclei with a proofreader or finished
+        n_finished : int unsigned # number of nuclei finished
+        n_timed : int unsigned # number of nuclei with a time to complete
+        time_min_total : double # total time to complete (min)
+        time_hist : longblob # counts of time to complete in fixed-width bins (min), see rollup_utils
+        """
+
 
 @schema
 class ExclusionMethod(djp.Lookup):
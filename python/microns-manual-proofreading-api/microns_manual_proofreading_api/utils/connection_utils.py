@@ -0,0 +1,195 @@
+"""
+Shared, health-checked DataJoint connection.
+"""
+
+import os
+import threading
+import time
+
+import datajoint as dj
+import datajoint_plus as djp
+
+logger = djp.getLogger(__name__)
+
+default_idle_timeout = float(os.environ.get('MICRONS_MANUAL_PROOFREADING_DB_IDLE_TIMEOUT', 600))
+default_health_check_interval = float(os.environ.get('MICRONS_MANUAL_PROOFREADING_DB_HEALTH_CHECK_INTERVAL', 30))
+
+
+class SharedConnection:
+    """
+    DataJoint's process-wide connection (`dj.conn()`) with health checks and idle reaping.
+
+    The schema and every table are bound to this connection, so importing the package and running fill and make methods
+        uses one connection per process. Call the instance to get the connection, like `dj.conn()`.
+
+    The connection is closed by a background thread after `idle_timeout` seconds without queries, so idle notebook kernels
+        hold no connection to the database, and reopens on its next query. After `health_check_interval` seconds without
+        queries it is pinged before being returned and reconnected if the server dropped it.
+    Every query holds `_lock` while it is counted in and out, and the connection is only closed while holding it with no 
+        query in progress, so neither the reaper nor `close` closes it under a running query.
+
+    DataJoint connections are not thread-safe, so threads must not send statements on the socket at the same time. Every 
+        query holds `_query_lock` while it runs, and a transaction holds it from start to commit or rollback, so queries 
+        from other threads wait instead of interleaving with it. Threads of a process therefore take turns on its 
+        connection; use processes to query the database in parallel.
+    """
+    def __init__(self, idle_timeout=None, health_check_interval=None):
+        """
+        :param idle_timeout (float): seconds after which the unused connection is closed, 0 to never close it
+            default (None) -> `default_idle_timeout`, set with env variable MICRONS_MANUAL_PROOFREADING_DB_IDLE_TIMEOUT
+        :param health_check_interval (float): seconds after which the unused connection is pinged before use
+            default (None) -> `default_health_check_interval`, set with env variable MICRONS_MANUAL_PROOFREADING_DB_HEALTH_CHECK_INTERVAL
+        """
+        self.idle_timeout = idle_timeout if idle_timeout is not None else default_idle_timeout
+        self.health_check_interval = health_check_interval if health_check_interval is not None else default_health_check_interval
+        self.n_reconnects = 0
+        self.n_reaped = 0
+        self._reset()
+
+    def _reset(self):
+        self._connection = None
+        self._last_used = time.monotonic() # time of last query
+        self._n_active = 0 # number of queries in progress
+        self._closed = False # True if closed by `reap`
+        self._lock = threading.RLock()
+        self._query_lock = threading.RLock() # held by the thread sending a query or in a transaction
+        self._transaction_thread = None # ident of the thread in a transaction
+        self._idle = threading.Condition(self._lock) # notified when the last query in progress finishes
+        self._reaper = None
+
+    @property
+    def stats(self):
+        return {'n_reconnects': self.n_reconnects, 'n_reaped': self.n_reaped, 'open': self._connection is not None and not self._closed}
+
+    def __call__(self):
+        """
+        Returns DataJoint's process-wide connection, health-checked.
+        """
+        with self._lock:
+            if self._connection is None:
+                self._connection = self._track(dj.conn())
+                self._start_reaper()
+            if self._closed:
+                self._reconnect()
+            elif time.monotonic() - self._last_used > self.health_check_interval and not self._n_active and not self._connection.is_connected:
+                logger.warning('Database connection lost. Reconnecting.')
+                self._reconnect()
+            return self._connection
+
+    def _track(self, connection):
+        """
+        Records the time of each query sent through connection, reopens it if it was reaped and serializes queries and 
+            transactions of different threads.
+        """
+        query = connection.query
+        start_transaction, commit_transaction, cancel_transaction = connection.start_transaction, connection.commit_transaction, connection.cancel_transaction
+
+        def tracked_query(*args, **kwargs):
+            with self._query_lock:
+                with self._lock:
+                    # reconnecting while holding the lock, so concurrent queries and the reaper wait for it
+                    if self._closed:
+                        self._reconnect()
+                    self._n_active += 1
+                    self._last_used = time.monotonic()
+                try:
+                    return query(*args, **kwargs)
+                finally:
+                    with self._lock:
+                        self._n_active -= 1
+                        self._last_used = time.monotonic()
+                        if not self._n_active:
+                            self._idle.notify_all()
+
+        def tracked_start_transaction():
+            self._query_lock.acquire() # released when the transaction ends
+            try:
+                start_transaction()
+            except BaseException:
+                self._query_lock.release()
+                raise
+            self._transaction_thread = threading.get_ident()
+
+        def end_transaction(end):
+            def tracked_end_transaction():
+                try:
+                    end()
+                finally:
+                    if self._transaction_thread == threading.get_ident():
+                        self._transaction_thread = None
+                        self._query_lock.release()
+            return tracked_end_transaction
+
+        connection.query = tracked_query
+        connection.start_transaction = tracked_start_transaction
+        connection.commit_transaction = end_transaction(commit_transaction)
+        connection.cancel_transaction = end_transaction(cancel_transaction)
+        return connection
+
+    def _reconnect(self):
+        self._connection.connect()
+        self._closed = False
+        self.n_reconnects += 1
+
+    def reap(self, idle_timeout=None):
+        """
+        Closes the connection if unused for idle_timeout seconds and not in a query or a transaction.
+
+        :param idle_timeout (float): seconds
+            default (None) -> `idle_timeout`
+        :returns (bool): True if the connection was closed
+        """
+        idle_timeout = self.idle_timeout if idle_timeout is None else idle_timeout
+        with self._lock:
+            connection = self._connection
+            if connection is None or self._closed or self._n_active or getattr(connection, '_in_transaction', False):
+                return False
+            if time.monotonic() - self._last_used < idle_timeout:
+                return False
+            try:
+                connection.close()
+            except Exception:
+                pass
+            self._closed = True
+            self.n_reaped += 1
+        logger.info('Closed idle database connection.')
+        return True
+
+    def _start_reaper(self):
+        if self.idle_timeout and (self._reaper is None or not self._reaper.is_alive()):
+            self._reaper = threading.Thread(target=self._reap_forever, name='microns-manual-proofreading-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(max(self.idle_timeout / 4, 1))
+            try:
+                self.reap()
+            except Exception:
+                logger.exception('Could not reap idle database connection.')
+
+    def after_fork(self):
+        """
+        Opens a new connection in a child process, which must not use the socket of the parent.
+        """
+        connection = self._connection
+        self._reset()
+        if connection is not None:
+            connection.connect()
+            self._connection = connection
+            self._start_reaper()
+
+    def close(self, timeout=None):
+        """
+        Closes the connection once the queries in progress finish, unless it is in a transaction. It reopens on its next query.
+
+        :param timeout (float): seconds to wait for queries in progress
+            default (None) -> waits until they finish
+        :returns (bool): True if the connection was closed
+        """
+        with self._idle:
+            self._idle.wait_for(lambda: not self._n_active, timeout=timeout)
+            return self.reap(idle_timeout=0)
+
+
+shared_conn = SharedConnection()
@@ -0,0 +1,72 @@
+"""
+DataJoint schema that looks up its existing tables in one query.
+"""
+
+import datajoint as dj
+import datajoint_plus as djp
+
+logger = djp.getLogger(__name__)
+
+# Schema answers DataJoint's `Schema.exists` and `Table.is_declared` checks from its lookup. They are internals, not 
+#   public API, so the lookup is only used with the DataJoint versions it was written for, checked by microns-manual-proofreading/tests/test_schema_utils.py.
+supported_datajoint_versions = ('0.12',)
+lookup_supported = '.'.join(dj.__version__.split('.')[:2]) in supported_datajoint_versions
+
+
+def existing_tables(schema_name, connection):
+    """
+    Returns the tables of a schema, in one query to information_schema.
+
+    :param schema_name (str): name of schema
+    :param connection (dj.Connection): connection to the database server
+    :returns (set): table names, None if the schema does not exist
+    """
+    rows = connection.query(
+        """
+        SELECT t.table_name FROM information_schema.schemata s
+        LEFT JOIN information_schema.tables t ON t.table_schema = s.schema_name
+        WHERE s.schema_name = %s
+        """,
+        args=(schema_name,)
+    ).fetchall()
+    return {row[0] for row in rows if row[0] is not None} if rows else None
+
+
+class Schema(djp.Schema):
+    """
+    djp.schema that looks up which of its tables exist when it is activated, in one query, instead of checking each
+        table as it is decorated.
+
+    Tables that exist are bound without declaring them or checking that they are declared. The schema and tables that
+        do not exist yet are declared as usual. The lookup is repeated on every activation, so it cannot go stale when
+        the schema or the database is recreated. With a DataJoint version not in `supported_datajoint_versions`, the
+        lookup is skipped and the schema behaves as djp.schema.
+    """
+    def __init__(self, schema_name, context=None, *, connection=None, **kwargs):
+        """
+        :param kwargs: passed to djp.schema
+        """
+        connection = connection if connection is not None else dj.conn()
+        if not lookup_supported:
+            logger.warning(f'Table lookup is not supported with DataJoint {dj.__version__}, checking each table instead.')
+        self.existing_tables = existing_tables(schema_name, connection) if lookup_supported else None
+        self._activating = lookup_supported
+        try:
+            super().__init__(schema_name, context, connection=connection, **kwargs)
+        finally:
+            self._activating = False
+
+    @property
+    def exists(self):
+        if self._activating: # answered by the lookup in __init__
+            return self.existing_tables is not None
+        return super().exists
+
+    def process_table_class(self, table_class, context, assert_declared=False):
+        if self.existing_tables is None or table_class.table_name not in self.existing_tables:
+            return super().process_table_class(table_class, context, assert_declared=assert_declared)
+        table_class.is_declared = True # shadows the SHOW TABLES query of dj.Table.is_declared while the class is bound
+        try:
+            super().process_table_class(table_class, context, assert_declared=assert_declared)
+        finally:
+            del table_class.is_declared
@@ -1,4 +1,13 @@
-import datajoint_plus as djp
-from . import minnie65_manual_proofreading
+import importlib
+from .. import lazy
 
-djp.reassign_master_attribute(minnie65_manual_proofreading)
+_modules = ['minnie65_manual_proofreading']
+
+if lazy:
+    # schema modules are imported, and their schemas bound, on first access
+    def __getattr__(name):
+        if name in _modules:
+            return importlib.import_module(f'.{name}', __name__)
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+else:
+    from . import minnie65_manual_proofreading
@@ -3,22 +3,398 @@ Methods for filling DataJoint tables in minnie65_manual_proofreading.
 """
 
 import datajoint_plus as djp
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import re 
+import hashlib
+import sys
 from datetime import datetime
-import microns_utils.ap_utils as apu
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from microns_utils.datetime_utils import current_timestamp
+from microns_utils.misc_utils import classproperty, unwrap
 from microns_manual_proofreading_api.schemas import minnie65_manual_proofreading as m65mprf
+from microns_manual_proofreading_api.utils.connection_utils import shared_conn
+from ..utils.cache_utils import TableCache
+from ..utils.cave_utils import AsyncCAVEFetcher
+from ..utils.export_utils import SetStore
+from ..utils.hash_utils import hash_set, set_hasher
+from ..utils.index_utils import NucleusIndex, RootIdIndex, StatusIndex, default_index_dir
+from ..utils.insert_utils import batch_insert
+from ..utils.lookup_utils import LookupCache
+from ..utils.instrument_utils import instrumented, stage
+from ..utils.populate_utils import populate_keys
+from ..utils import rollup_utils
+from ..utils.selection_utils import ProtocolSelector
 
 schema = m65mprf.schema
 config = m65mprf.config
 
 logger = djp.getLogger(__name__)
 
+lookups = LookupCache() # small Lookup tables, method hashes and package versions used in make and fill
+nucleus_id_chunksize = 10000 # maximum number of nucleus_ids in one IN (...) restriction, see `fetch_nucleus_ids`
+
+
+def nucleus_id_restr(nucleus_ids):
+    """
+    Returns a restriction matching any of nucleus_ids.
+    """
+    nucleus_ids = np.atleast_1d(nucleus_ids)
+    return f'nucleus_id in ({",".join(map(str, nucleus_ids))})' if len(nucleus_ids) else 'FALSE'
+
+
+def fetch_nucleus_ids(relation, nucleus_ids, chunksize=None):
+    """
+    Returns the unique nucleus_ids of relation among nucleus_ids, restricting by at most chunksize nucleus_ids per query 
+        so statements stay well under max_allowed_packet.
+
+    :param relation (dj relation): relation with a nucleus_id attribute
+    :param nucleus_ids (array-like): nucleus_ids
+    :param chunksize (int): maximum number of nucleus_ids per query
+        default (None) -> `nucleus_id_chunksize`
+    :returns (np.ndarray): nucleus_ids found
+    """
+    chunksize = chunksize if chunksize is not None else nucleus_id_chunksize
+    nucleus_ids = np.unique(np.asarray(nucleus_ids, dtype=np.int64))
+    found = [(relation & nucleus_id_restr(nucleus_ids[i:i + chunksize])).fetch('nucleus_id') for i in range(0, len(nucleus_ids), chunksize)]
+    return np.unique(np.concatenate(found)) if found else np.array([], dtype=np.int64)
+
+
+def iter_nucleus_id_batches(relation, *attrs, chunksize=None):
+    """
+    Yields the rows of relation in batches of at most chunksize rows, ordered by nucleus_id. Each batch is fetched by
+        restricting to nucleus_ids greater than the last one fetched, so no more than one batch is held at a time.
+
+    :param relation (dj relation): relation whose rows are identified by nucleus_id
+    :param attrs (str): attributes to fetch, in addition to nucleus_id
+    :param chunksize (int): maximum number of rows per batch
+        default (None) -> `nucleus_id_chunksize`
+    :yields (pd.DataFrame): batch with columns nucleus_id and attrs
+    """
+    chunksize = chunksize if chunksize is not None else nucleus_id_chunksize
+    columns = ['nucleus_id', *attrs]
+    restr = {}
+    while True:
+        batch = pd.DataFrame((relation & restr).fetch(*columns, as_dict=True, order_by='nucleus_id', limit=chunksize), columns=columns)
+        if batch.empty:
+            return
+        yield batch
+        if len(batch) < chunksize:
+            return
+        restr = f'nucleus_id > {batch.nucleus_id.iloc[-1]}'
+
+
+def validate_nucleus_ids(nucleus_ids):
+    """
+    Checks that every nucleus_id exists in m65mat.Nucleus, in queries of at most `nucleus_id_chunksize` nucleus_ids.
+
+    :param nucleus_ids (array-like, pd.DataFrame): nucleus_ids, or rows with a nucleus_id column
+    :returns (np.ndarray): unique nucleus_ids
+    :raises ValueError: if any nucleus_id is not in m65mat.Nucleus
+    """
+    if isinstance(nucleus_ids, pd.DataFrame):
+        nucleus_ids = nucleus_ids.nucleus_id
+    nucleus_ids = np.unique(np.asarray(nucleus_ids, dtype=np.int64))
+    found = fetch_nucleus_ids(m65mprf.m65mat.Nucleus, nucleus_ids)
+    missing = np.setdiff1d(nucleus_ids, found)
+    if len(missing):
+        raise ValueError(f'{len(missing)} nucleus_ids not found in m65mat.Nucleus, e.g.: {missing[:10].tolist()}')
+    return nucleus_ids
+
 
 class Tag(m65mprf.Tag):
-    pass
+    @classproperty
+    def version(cls):
+        return lookups.version(m65mprf.Tag)
+
+
+class ExcelPrfSheetReader:
+    """
+    Reads and validates proofreading sheets for the ExcelPrfSheet import methods. Defines no table, so the import method 
+        tables that share it resolve their DataJoint attributes from their own table class only.
+    """
+    chunksize = 50000 # rows per chunk read from the csv (version 2)
+    column_map = {
+        'proofreader': 'proofreader_den',
+        'date_finished_den_ctrl': 'date_finished_den', 
+        'notes':'notes_den',
+        'notes1': 'notes_ax',
+        'proofreader1': 'proofreader_ax',
+        'date_finished_ax_ctrl': 'date_finished_ax', 
+        'description': 'area'
+    }
+    column_dtypes = {
+        'excel_id': 'float64',
+        'nucleus_id': 'float64',
+        'area': str,
+        'proofreader_den': str,
+        'time_min_den': 'float64',
+        'notes_den': str,
+        'finished_den': str,
+        'date_finished_den': str,
+        'proofreader_ax': str,
+        'time_min_ax': 'float64',
+        'notes_ax': str,
+        'finished_ax': str,
+        'date_finished_ax': str,
+        'axon_in_white_matter': str,
+    }
+    bool_columns = ['finished_den', 'finished_ax', 'axon_in_white_matter']
+    bool_map = {'true': 1, 'false': 0, '1': 1, '0': 0, '1.0': 1, '0.0': 0}
+    integer_columns = ['excel_id', 'nucleus_id']
+    required_columns = ['excel_id', 'nucleus_id', 'area', 'finished_den', 'finished_ax']
+    max_lengths = {'area': 10, 'proofreader_den': 450, 'notes_den': 1000, 'date_finished_den': 48, 'proofreader_ax': 450, 'notes_ax': 1000, 'date_finished_ax': 48}
+    on_invalid = 'raise' # version 3: "raise" rejects the sheet if any row is invalid, "drop" imports only the valid rows
+
+    @instrumented('run')
+    def run(self, **kwargs):
+        params = self.fetch1()
+        if params['version'] == 1:
+            csv_path = self._csv_path(params)
+
+            df = pd.read_csv(csv_path)
+            df = df.rename(columns={'#': 'excel_id'})
+            renamed_columns = [re.sub(r'\W+', '', s.lower().replace(' ', '_')).strip('_') for s in df.columns]
+            df = df.rename(columns = {a: r for a, r in zip(df.columns, renamed_columns)})
+            df = df.merge(df.nucleus_id.dropna(), how='right').drop_duplicates()
+            df = df.loc[:, :'axon_in_white_matter']
+            df = df.rename(columns={'proofreader': 'proofreader_den',
+                                'date_finished_den_ctrl': 'date_finished_den', 
+                                    'notes':'notes_den',
+                                    'notes1': 'notes_ax',
+                                    'proofreader1': 'proofreader_ax',
+                                'date_finished_ax_ctrl': 'date_finished_ax', 'description': 'area'})
+            df = df[[
+                'excel_id',
+                'nucleus_id', 
+                'area', 
+                'proofreader_den', 
+                'time_min_den', 
+                'notes_den', 
+                'finished_den', 
+                'date_finished_den', 
+                'proofreader_ax', 
+                'time_min_ax', 
+                'notes_ax', 
+                'finished_ax', 
+                'date_finished_ax', 
+                'axon_in_white_matter'
+            ]]
+            df.loc[:, 'finished_ax'] = df.finished_ax.apply(lambda x: 1*eval(x.title()))
+            df.loc[:, 'finished_den'] = df.finished_den.apply(lambda x: 1*x)
+            df.loc[:, 'axon_in_white_matter'] = df.axon_in_white_matter.apply(lambda x: 1*x)
+            df.loc[:75, 'prf_method'] = lookups.hash1(PrfMethod, {'prf_method_name': 'whole_cell'})
+            df.loc[76:145, 'prf_method'] = lookups.hash1(PrfMethod, {'prf_method_name': 'projection_only'})
+            df.loc[146:, 'prf_method'] = lookups.hash1(PrfMethod, {'prf_method_name': 'whole_cell'})
+            df = df.query('finished_den == True and finished_ax == True')
+            df = df.where(pd.notnull(df), None)
+            df['ts_inserted'] = str(current_timestamp('US/Central'))
+            df['import_method'] = params['import_method']
+            return {'df': df}
+
+        elif params['version'] == 2:
+            csv_path = self._csv_path(params)
+
+            df = pd.concat(self.read_csv_chunks(csv_path), ignore_index=True).drop_duplicates()
+            df = df.astype(object).where(pd.notnull(df), None)
+            df['ts_inserted'] = str(current_timestamp('US/Central'))
+            df['import_method'] = params['import_method']
+            return {'df': df}
+
+        elif params['version'] == 3:
+            csv_path = self._csv_path(params)
+
+            df, rejected, unfinished = self.read_validated(csv_path)
+            if len(unfinished):
+                self.Log('warning', f'{unfinished.row.nunique()} invalid unfinished rows in {csv_path}, not imported, e.g.: {unfinished.head(5).to_dict("records")}.')
+            if len(rejected):
+                report_path = csv_path.with_name(f'{csv_path.stem}_rejected_rows.csv')
+                try:
+                    rejected.to_csv(report_path, index=False)
+                except OSError:
+                    report_path = None
+                msg = f'{rejected.row.nunique()} invalid rows in {csv_path}, e.g.: {rejected.head(5).to_dict("records")}. Rejected rows report: {report_path}.'
+                if self.on_invalid == 'raise':
+                    self.Log('error', msg)
+                    raise ValueError(msg)
+                self.Log('warning', msg)
+            df = df[~df.row.isin(rejected.row) & (df.finished_den == 1) & (df.finished_ax == 1)].drop(columns='row')
+            df = df.astype({'excel_id': 'int64', 'nucleus_id': 'int64', 'finished_den': 'int64', 'finished_ax': 'int64'})
+            df = df.astype(object).where(pd.notnull(df), None)
+            df['ts_inserted'] = str(current_timestamp('US/Central'))
+            df['import_method'] = params['import_method']
+            return {'df': df}
+
+    @classmethod
+    def format_column_name(cls, name):
+        """
+        Formats a raw spreadsheet header into its column name, e.g. "Date Finished Den (Ctrl+;)" --> "date_finished_den".
+        """
+        name = 'excel_id' if name == '#' else re.sub(r'\W+', '', name.lower().replace(' ', '_')).strip('_')
+        return cls.column_map.get(name, name)
+
+    def _csv_path(self, params):
+        """
+        Returns the path to the csv file of params, logging and raising FileNotFoundError if it does not exist.
+        """
+        csv_path = Path(params['path_to_csv'])
+        if not csv_path.exists():
+            msg = f'csv file does not exist at path: {str(csv_path)}.'
+            self.Log('error', msg)
+            raise FileNotFoundError(msg)
+        return csv_path
+
+    def _column_map(self, csv_path):
+        """
+        Maps the raw headers of the csv file to the columns in `column_dtypes`, keeping the first header of each column.
+
+        :param csv_path (Path): path to csv file
+        :returns (dict): raw header: column name
+        :raises ValueError: if any column in `column_dtypes` is missing
+        """
+        columns = {}
+        for raw in pd.read_csv(csv_path, nrows=0).columns:
+            name = self.format_column_name(raw)
+            if name in self.column_dtypes and name not in columns.values():
+                columns[raw] = name
+        missing = set(self.column_dtypes) - set(columns.values())
+        if missing:
+            msg = f'csv file is missing columns: {sorted(missing)}.'
+            self.Log('error', msg)
+            raise ValueError(msg)
+        return columns
+
+    @staticmethod
+    def prf_method(position):
+        """
+        Returns the prf_method of rows at position (see `positions`): projection_only for positions 76 to 145, whole_cell otherwise.
+        """
+        whole_cell = lookups.hash1(PrfMethod, {'prf_method_name': 'whole_cell'})
+        projection_only = lookups.hash1(PrfMethod, {'prf_method_name': 'projection_only'})
+        return np.where((position >= 76) & (position <= 145), projection_only, whole_cell)
+
+    def positions(self, csv_path):
+        """
+        Returns the position of each row with a nucleus_id that its prf_method is assigned by, numbered as in version 1, 
+            which merges the sheet with its own nucleus_ids before assigning prf_method by index label. A nucleus_id that 
+            appears n times expands into its n rows at each appearance, so rows are numbered within the expanded sheet 
+            and identical rows share the position of their first copy. Without duplicate nucleus_ids, rows are numbered 
+            0, 1, 2, ... and only the nucleus_id column is read.
+
+        :param csv_path (Path): path to csv file
+        :returns (pd.Series): position, indexed by row of the csv (after the header)
+        """
+        column = next(raw for raw, name in self._column_map(csv_path).items() if name == 'nucleus_id')
+        ids = [chunk[column] for chunk in pd.read_csv(csv_path, usecols=[column], dtype=str, chunksize=self.chunksize)]
+        ids = pd.concat(ids).dropna() if ids else pd.Series(dtype=object)
+        key = pd.to_numeric(ids.str.strip(), errors='coerce').astype(object).where(lambda k: k.notna(), ids) # compared as numbers, like version 1
+        if not key.duplicated().any():
+            return pd.Series(np.arange(len(key)), index=key.index)
+
+        counts = key.map(key.value_counts())
+        position = (counts.cumsum() - counts).groupby(key).transform('first') + key.groupby(key).cumcount()
+        is_duplicate = key.duplicated(keep=False)
+        rows = pd.concat([chunk[chunk.index.isin(key.index[is_duplicate])] for chunk in pd.read_csv(csv_path, dtype=str, chunksize=self.chunksize)])
+        position[is_duplicate] = position[is_duplicate].groupby(pd.util.hash_pandas_object(rows, index=False)).transform('first')
+        return position
+
+    def read_csv_chunks(self, csv_path):
+        """
+        Reads the proofreading sheet in chunks of `chunksize` rows with explicit dtypes and vectorized parsing.
+
+        Only the columns in `column_dtypes` are read and only finished rows are kept, so memory 
+            scales with the number of finished rows rather than the size of the sheet.
+
+        :param csv_path (Path): path to csv file
+
+        :yields (pd.DataFrame): parsed rows of each chunk
+        """
+        columns = self._column_map(csv_path)
+        
+        positions = self.positions(csv_path)
+        reader = pd.read_csv(
+            csv_path, 
+            usecols=list(columns), 
+            dtype={raw: self.column_dtypes[name] for raw, name in columns.items()}, 
+            chunksize=self.chunksize
+        )
+        for chunk in reader:
+            chunk = chunk.rename(columns=columns)[list(self.column_dtypes)]
+            chunk = chunk[chunk.nucleus_id.notna()].copy() # copied so parsed columns are set on the chunk, not on a view of it
+            for col in self.bool_columns:
+                chunk[col] = chunk[col].str.strip().str.lower().map(self.bool_map)
+            chunk['prf_method'] = self.prf_method(positions[chunk.index])
+            chunk = chunk[(chunk.finished_den == 1) & (chunk.finished_ax == 1)]
+            chunk = chunk.astype({'excel_id': 'int64', 'nucleus_id': 'int64', 'finished_den': 'int64', 'finished_ax': 'int64'})
+            yield chunk
+
+    def read_validated(self, csv_path):
+        """
+        Reads and validates the proofreading sheet in one vectorized pass over chunks of `chunksize` rows.
+
+        Rows without a nucleus_id are skipped. Every other row is checked for missing required values, non-numeric or 
+            non-integer numbers, unparseable booleans and values longer than their column. Finished rows, which are the 
+            only rows imported, are also checked for duplicate nucleus_ids and nucleus_ids not in m65mat.Nucleus 
+            (checked with `fetch_nucleus_ids`). Only invalid finished rows are rejected, invalid values of rows that are 
+            not finished are returned separately so they can be reported without rejecting the sheet. A row is not 
+            finished only if finished_den or finished_ax is false, so a row with a missing or misspelled finished flag 
+            is rejected rather than silently left out.
+
+        :param csv_path (Path): path to csv file
+        :returns: 
+            pd.DataFrame of parsed rows with the csv line number in "row"
+            pd.DataFrame of rejected values of finished rows with row, excel_id, nucleus_id, column, value and reason
+            pd.DataFrame of invalid values of unfinished rows, with the same columns
+        """
+        columns = self._column_map(csv_path)
+
+        chunks, rejected, unfinished = [], [], []
+        positions = self.positions(csv_path)
+        for raw in pd.read_csv(csv_path, usecols=list(columns), dtype=str, chunksize=self.chunksize):
+            raw = raw.rename(columns=columns)[list(self.column_dtypes)]
+            raw = raw[raw.nucleus_id.notna()]
+            chunk = raw.copy()
+            chunk.insert(0, 'row', raw.index + 2) # line number in csv, after header
+            
+            for col in self.bool_columns:
+                chunk[col] = raw[col].str.strip().str.lower().map(self.bool_map)
+            finished = (chunk.finished_den != 0) & (chunk.finished_ax != 0) # a missing or misspelled flag may be a finished row
+
+            def reject(mask, column, reason):
+                for problems, rows in [(rejected, mask & finished), (unfinished, mask & ~finished)]:
+                    if rows.any():
+                        problems.append(pd.DataFrame({'row': chunk.row[rows], 'excel_id': raw.excel_id[rows], 'nucleus_id': raw.nucleus_id[rows], 'column': column, 'value': raw[column][rows], 'reason': reason}))
+
+            for col, dtype in self.column_dtypes.items():
+                if dtype == 'float64':
+                    chunk[col] = pd.to_numeric(raw[col].str.strip(), errors='coerce')
+                    reject(raw[col].notna() & chunk[col].isna(), col, 'not a number')
+            for col in self.integer_columns:
+                reject(chunk[col].notna() & (chunk[col] % 1 != 0), col, 'not an integer')
+            for col in self.bool_columns:
+                reject(raw[col].notna() & chunk[col].isna(), col, 'not a boolean')
+            for col in self.required_columns:
+                reject(raw[col].isna(), col, 'missing value')
+            for col, max_length in self.max_lengths.items():
+                reject(raw[col].str.len() > max_length, col, f'longer than {max_length} characters')
+            chunk['prf_method'] = self.prf_method(positions[chunk.index])
+            chunks.append(chunk)
+
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=['row', *self.column_dtypes, 'prf_method'])
+        df = df[~df.drop(columns='row').duplicated()] # identical rows are imported once
+        finished = (df.finished_den != 0) & (df.finished_ax != 0)
+        is_duplicate = finished & df.nucleus_id.notna() & df.nucleus_id.where(finished).duplicated(keep=False)
+        is_valid_id = finished & df.nucleus_id.notna() & (df.nucleus_id % 1 == 0)
+        found = fetch_nucleus_ids(m65mprf.m65mat.Nucleus, df.nucleus_id[is_valid_id].astype('int64').unique())
+        not_found = is_valid_id & ~df.nucleus_id.isin(found)
+        for mask, reason in [(is_duplicate, 'duplicate nucleus_id'), (not_found, 'not in m65mat.Nucleus')]:
+            if mask.any():
+                rejected.append(pd.DataFrame({'row': df.row[mask], 'excel_id': df.excel_id[mask], 'nucleus_id': df.nucleus_id[mask], 'column': 'nucleus_id', 'value': df.nucleus_id[mask].astype(str), 'reason': reason}))
+        
+        columns = ['row', 'excel_id', 'nucleus_id', 'column', 'value', 'reason']
+        rejected, unfinished = [pd.concat(problems, ignore_index=True).sort_values('row', kind='stable')[columns].reset_index(drop=True) if problems else pd.DataFrame(columns=columns) for problems in [rejected, unfinished]]
+        return df.reset_index(drop=True), rejected, unfinished
 
 
 class ImportMethod(m65mprf.ImportMethod):
@@ -26,135 +402,999 @@ class ImportMethod(m65mprf.ImportMethod):
     def run(cls, key):
         return cls.r1p(key).run(**key)
 
-    class ExcelPrfSheet(m65mprf.ImportMethod.ExcelPrfSheet):
+    class ExcelPrfSheet(ExcelPrfSheetReader, m65mprf.ImportMethod.ExcelPrfSheet):
+        pass
+
+    class ExcelPrfSheetContent(ExcelPrfSheetReader, m65mprf.ImportMethod.ExcelPrfSheetContent):
+        """
+        Proofreading sheet registered by content, parsed like ExcelPrfSheet.
+        """
+        fingerprint_chunk_size = 2**20 # bytes read at a time when hashing csv files
+
+        @classmethod
+        def fingerprint(cls, path):
+            """
+            Streams a file through sha256 in chunks of `fingerprint_chunk_size` bytes.
+
+            :param path (str, Path): path to file
+            :returns (dict): content_hash, size
+            """
+            path = Path(path)
+            size = path.stat().st_size
+            sha = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(cls.fingerprint_chunk_size), b''):
+                    sha.update(chunk)
+            return {'content_hash': sha.hexdigest(), 'size': size}
+
+        @classmethod
+        @instrumented('fill')
+        def fill(cls, path_to_csv, version=3):
+            """
+            Registers a proofreading sheet unless a sheet with the same content is already registered.
+
+            The file is hashed without parsing and matched on its content hash and size, so an edited sheet gets a new 
+                import method and the same sheet at a new path does not. Instead, the stored path of the registered sheet 
+                is updated, so it is read from the new path.
+            An edited sheet records the most recent content registered at its path as its base, so that only the rows that 
+                differ from the set imported from the base are sent to the database, see `PrfNucleusSet.ExcelPrfSheetMaker`.
+
+            :param path_to_csv (str): path to csv file
+            :param version (int): ExcelPrfSheet method version used to parse the sheet
+            :returns (str): import_method of the sheet
+            """
+            path = Path(path_to_csv)
+            if not path.exists():
+                msg = f'csv file does not exist at path: {str(path)}.'
+                cls.Log('error', msg)
+                raise FileNotFoundError(msg)
+            row = {'version': version, 'path_to_csv': str(path), **cls.fingerprint(path)}
+            registered = cls & {'version': version, 'content_hash': row['content_hash'], 'size': row['size']}
+            if registered:
+                import_method, registered_path = registered.fetch1('import_method', 'path_to_csv')
+                if registered_path == row['path_to_csv']:
+                    logger.info(f'{path} is unchanged since registered. Skipping.')
+                else:
+                    logger.info(f'Content of {path} is already registered from {registered_path}. Updating path.')
+                    (cls & {'import_method': import_method})._update('path_to_csv', row['path_to_csv'])
+                return import_method
+            previous = cls & {'version': version, 'path_to_csv': row['path_to_csv']}
+            if previous:
+                row['base_import_method'] = previous.fetch('import_method', order_by='ts_inserted DESC', limit=1)[0]
+            cls.insert1(row, insert_to_master=True)
+            return cls.hash1(row)
+
+        @classmethod
+        def base_set(cls, import_method):
+            """
+            Returns the prf_nuc_set imported from the previous content of the sheet registered as import_method, None if 
+                the sheet has no previous content, the previous content was not imported or import_method is not registered by content.
+            """
+            base_import_method = (cls & {'import_method': import_method}).fetch('base_import_method')
+            if len(base_import_method) == 0 or pd.isnull(base_import_method[0]):
+                return
+            prf_nuc_sets = (PrfNucleusSet.ExcelPrfSheetMaker & {'import_method': base_import_method[0]}).fetch('prf_nuc_set', limit=1)
+            return prf_nuc_sets[0] if len(prf_nuc_sets) else None
+
         def run(self, **kwargs):
             params = self.fetch1()
-            if params['version'] == 1:
-                csv_path = Path(params['path_to_csv'])
-                if not csv_path.exists():
-                    msg = f'csv file does not exist at path: {str(csv_path)}.'
-                    self.Log('error', msg)
-                    raise FileNotFoundError(msg)
-
-                df = pd.read_csv(csv_path)
-                df = df.rename(columns={'#': 'excel_id'})
-                renamed_columns = [re.sub(r'\W+', '', s.lower().replace(' ', '_')).strip('_') for s in df.columns]
-                df = df.rename(columns = {a: r for a, r in zip(df.columns, renamed_columns)})
-                df = df.merge(df.nucleus_id.dropna(), how='right').drop_duplicates()
-                df = df.loc[:, :'axon_in_white_matter']
-                df = df.rename(columns={'proofreader': 'proofreader_den',
-                                    'date_finished_den_ctrl': 'date_finished_den', 
-                                        'notes':'notes_den',
-                                        'notes1': 'notes_ax',
-                                        'proofreader1': 'proofreader_ax',
-                                    'date_finished_ax_ctrl': 'date_finished_ax', 'description': 'area'})
-                df = df[[
-                    'excel_id',
-                    'nucleus_id', 
-                    'area', 
-                    'proofreader_den', 
-                    'time_min_den', 
-                    'notes_den', 
-                    'finished_den', 
-                    'date_finished_den', 
-                    'proofreader_ax', 
-                    'time_min_ax', 
-                    'notes_ax', 
-                    'finished_ax', 
-                    'date_finished_ax', 
-                    'axon_in_white_matter'
-                ]]
-                df.loc[:, 'finished_ax'] = df.finished_ax.apply(lambda x: 1*eval(x.title()))
-                df.loc[:, 'finished_den'] = df.finished_den.apply(lambda x: 1*x)
-                df.loc[:, 'axon_in_white_matter'] = df.axon_in_white_matter.apply(lambda x: 1*x)
-                df.loc[:75, 'prf_method'] = PrfMethod.hash1({'prf_method_name': 'whole_cell'})
-                df.loc[76:145, 'prf_method'] = PrfMethod.hash1({'prf_method_name': 'projection_only'})
-                df.loc[146:, 'prf_method'] = PrfMethod.hash1({'prf_method_name': 'whole_cell'})
-                df = df.query('finished_den == True and finished_ax == True')
-                df = df.where(pd.notnull(df), None)
-                df['ts_inserted'] = str(current_timestamp('US/Central'))
-                df['import_method'] = params['import_method']
-                return {'df': df}
+            path = Path(params['path_to_csv'])
+            if path.exists() and (path.stat().st_size != params['size'] or self.fingerprint(path)['content_hash'] != params['content_hash']):
+                msg = f'csv file at path {str(path)} changed since it was registered. Register it again with fill.'
+                self.Log('error', msg)
+                raise ValueError(msg)
+            return super().run(**kwargs)
+
+    class CAVE(m65mprf.ImportMethod.CAVE):
+        cache = TableCache() # set to None to disable the local disk cache
+        fetcher = AsyncCAVEFetcher() # one client per materialization version of `fetcher.datastack`, reused across runs
+        index_dir = default_index_dir # set to None to keep root_id indexes in memory only
+        nucleus_query = ('nucleus_detection_v0', dict(select_columns=['id', 'pt_root_id']))
+        _root_indexes = {} # (datastack, ver): RootIdIndex
 
-    class CAVE(m65mprf.ImportMethod.CAVE, apu.CAVEClient):
         @classmethod
+        @instrumented('fill')
         def fill(cls, table_name, ver=None):
             """
             table_name (str) - name of CAVE table
-            ver (int) - ver to pass to apu.CAVEClient; None --> latest
+            ver (int) - materialization version; None --> latest
             """
-            cls.set_client(ver=ver)
-            assert table_name in cls.client.materialize.get_tables(), f'Table {table_name} not found in CAVEclient'
-            cls.insert1({'table_name': table_name, 'ver': cls.client.materialize.version, 'tag': Tag.version}, insert_to_master=True)
+            client = cls.fetcher.client(ver)
+            assert table_name in client.materialize.get_tables(), f'Table {table_name} not found in CAVEclient'
+            cls.insert1({'table_name': table_name, 'ver': client.materialize.version, 'tag': Tag.version}, insert_to_master=True)
 
+        @instrumented('run')
         def run(self, **kwargs):
             params = self.fetch1()
             ver = int(params.get('ver'))
             assert Tag.version == params.get('tag'), 'Package version mismatch. Update Import Method.'
-            self.set_client(ver=ver)
-            assert self.client_ver == ver, f'Materialization version mismatch. Method requires {ver}. Client version: {self.client_ver}'
-            nuc_df = self.client.materialize.query_table('nucleus_detection_v0')
-            prf_status_df = self.client.materialize.query_table(params.get('table_name')).query('valid=="t"')
-            merge_df = prf_status_df.merge(nuc_df, on='pt_root_id')
-            df = merge_df.rename(columns=dict(id_y='nucleus_id'))[['nucleus_id', 'status_dendrite', 'status_axon']]
-            df['import_method'] = params['import_method']
+            with stage(self, 'query') as record:
+                index = self.load_root_index(ver)
+                queries = self.table_queries(params.get('table_name')) + ([self.nucleus_query] if index is None else [])
+                dfs = self.query_tables(queries, ver)
+                prf_status_df = dfs[0]
+                index = index if index is not None else self.root_index(ver, nuc_df=dfs[1])
+                record['n_rows'] = len(prf_status_df)
+            with stage(self, 'merge') as record:
+                positions, nucleus_ids = index.join_root_ids(prf_status_df.pt_root_id.to_numpy())
+                df = prf_status_df.iloc[positions][['status_dendrite', 'status_axon']].reset_index(drop=True)
+                df.insert(0, 'nucleus_id', nucleus_ids.astype(np.int64))
+                df['import_method'] = params['import_method']
+                record['n_rows'] = len(df)
             return {'df': df}
 
+        @classmethod
+        def load_root_index(cls, ver):
+            """
+            Returns the nucleus_id <-> root_id index of materialization version ver of `fetcher.datastack` if built in this process or saved in `index_dir`, otherwise None.
+            """
+            key = (cls.fetcher.datastack, int(ver))
+            if key not in cls._root_indexes and cls.index_dir is not None:
+                index = RootIdIndex.load(RootIdIndex.path(*key, index_dir=cls.index_dir))
+                if index is not None:
+                    cls._root_indexes[key] = index
+            return cls._root_indexes.get(key)
+
+        @classmethod
+        def root_index(cls, ver, nuc_df=None):
+            """
+            Returns the nucleus_id <-> root_id index of materialization version ver of `fetcher.datastack`, building and saving it on first use. 
+            
+            For use by any import method joining CAVE tables to nuclei by root_id.
+
+            :param ver (int): materialization version
+            :param nuc_df (pd.DataFrame): id, pt_root_id of the nucleus table at ver, if already queried
+                default (None) -> queried with `nucleus_query`
+            :returns (RootIdIndex): index
+            """
+            index = cls.load_root_index(ver)
+            if index is None:
+                nuc_df = nuc_df if nuc_df is not None else cls.query_table(cls.nucleus_query[0], ver, **cls.nucleus_query[1])
+                index = RootIdIndex(nuc_df.id, nuc_df.pt_root_id)
+                if cls.index_dir is not None:
+                    index.save(RootIdIndex.path(cls.fetcher.datastack, ver, index_dir=cls.index_dir))
+                cls._root_indexes[(cls.fetcher.datastack, int(ver))] = index
+            return index
+
+        @classmethod
+        def query_table(cls, table_name, ver, select_columns=None, filter_equal_dict=None):
+            """
+            Queries a CAVE table at materialization version ver. 
+
+            Column selection and filters are applied by the materialization service, so only the requested rows and columns are transferred.
+            Tables are read from `cache` when available, in which case no network calls are made. 
+
+            :param table_name (str): name of CAVE table
+            :param ver (int): materialization version
+            :param select_columns (list): columns to return
+                default (None) -> all columns
+            :param filter_equal_dict (dict): column: value pairs rows must equal 
+            :returns (pd.DataFrame): table
+            """
+            query_kws = {k: v for k, v in dict(select_columns=select_columns, filter_equal_dict=filter_equal_dict).items() if v is not None}
+            return cls.query_tables([(table_name, query_kws)], ver)[0]
+
+        @classmethod
+        def query_tables(cls, queries, ver):
+            """
+            Queries CAVE tables of `fetcher.datastack` at materialization version ver, reading them from `cache` when available and fetching the rest concurrently with `fetcher`.
+
+            :param queries (list): (table_name, query kwargs) of each table, see `query_table`
+            :param ver (int): materialization version
+            :returns (list): pd.DataFrame of each query
+            """
+            if cls.cache is None:
+                return cls.fetcher.fetch(queries, ver)
+            return cls.cache.fetch_many(cls.fetcher.datastack, queries, ver, cls.fetcher.fetch)
+
+        @classmethod
+        def table_queries(cls, table_name):
+            """
+            Returns the (table_name, query kwargs) of the status table queried by `run`. 
+            
+            The nucleus table (`nucleus_query`) is only queried to build the root_id index of a version, see `root_index`.
+            `valid` is a boolean column of CAVE tables, so it is filtered on True (not the "t" it was rendered as client side).
+
+            :param table_name (str): name of CAVE status table
+            """
+            return [
+                (table_name, dict(select_columns=['pt_root_id', 'status_dendrite', 'status_axon'], filter_equal_dict={'valid': True}))
+            ]
+
+        @classmethod
+        def prefetch(cls, table_name, ver):
+            """
+            Downloads the tables queried by `run` into `cache` and builds the root_id index of the version. 
+
+            Makes no database calls, so it is safe to run concurrently for several versions.
+
+            :param table_name (str): name of CAVE status table
+            :param ver (int): materialization version
+            :returns (int): number of tables downloaded
+            """
+            if cls.cache is None:
+                return 0
+            queries = cls.table_queries(table_name) + ([cls.nucleus_query] if cls.load_root_index(ver) is None else [])
+            missing = [(name, query_kws) for name, query_kws in queries if not cls.cache.contains(cls.fetcher.datastack, name, ver, **query_kws)]
+            if missing:
+                cls.cache.fetch_many(cls.fetcher.datastack, missing, ver, cls.fetcher.fetch)
+            if cls.load_root_index(ver) is None:
+                cls.root_index(ver)
+            return len(missing)
+
 
 class PrfMethod(m65mprf.PrfMethod):
     pass
 
 
 class PrfNucleusSet(m65mprf.PrfNucleusSet):
+    status_attrs = ['status_dendrite', 'status_axon']
+    store = SetStore() # set to None to disable local export of sets
+
+    @classmethod
+    def populate_makers(cls, max_workers=4, processes=1, **populate_kws):
+        """
+        Populates the pending keys of every maker.
+
+        Tables of pending ImportMethod.CAVE keys are first downloaded into the disk cache concurrently with a thread pool. 
+        Keys are then populated with job reservation, so several workers or nodes can run this at once without duplicating work. 
+        Finally the throughput of new ExcelPrfSheet sets is rolled up into PrfThroughput.
+
+        :param max_workers (int): number of threads downloading CAVE tables
+        :param processes (int): number of processes populating keys, see `populate_utils.populate_keys`
+        :param populate_kws: kwargs to pass to populate
+        :returns (pd.DataFrame): maker, key, seconds, status and error of each populated key
+        """
+        cave_params = (cls.CAVEMaker.key_source - cls.CAVEMaker).fetch('table_name', 'ver', as_dict=True)
+        with ThreadPoolExecutor(max_workers) as executor:
+            futures = {executor.submit(ImportMethod.CAVE.prefetch, p['table_name'], p['ver']): p for p in cave_params}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception:
+                    logger.exception(f'Could not prefetch CAVE tables for {futures[future]}.')
+        
+        results = [populate_keys(maker, (maker.key_source - maker).fetch('KEY'), processes=processes, **populate_kws) for maker in cls.makers]
+        results.append(populate_keys(PrfThroughput, (PrfThroughput.key_source - PrfThroughput).fetch('KEY'), processes=processes, **populate_kws))
+        return pd.concat(results, ignore_index=True)
+
+    @classmethod
+    def fetch_cave_status(cls, prf_nuc_set):
+        """
+        Fetches the CAVE proofreading status of every nucleus in a set, reconstructing sets stored as changes relative to a base set.
+            Sets stored as changes have no rows in CAVEProofreadingStatus, so read CAVE sets with this rather than querying it.
+
+        :param prf_nuc_set (str): set hash
+        :returns (pd.DataFrame): nucleus_id, status_dendrite, status_axon sorted by nucleus_id
+        """
+        chain = [] # delta sets from prf_nuc_set back to the full set, at most CAVEMaker.max_chain_length long
+        while True:
+            base = (cls.CAVEDelta & {'prf_nuc_set': prf_nuc_set}).fetch('base_prf_nuc_set')
+            if not len(base):
+                break
+            chain.append(prf_nuc_set)
+            prf_nuc_set = base[0]
+        
+        columns = ['nucleus_id', *cls.status_attrs]
+        df = pd.DataFrame((cls.CAVEProofreadingStatus & {'prf_nuc_set': prf_nuc_set}).fetch(*columns, as_dict=True), columns=columns)
+        if chain:
+            deltas = pd.DataFrame((cls.CAVEProofreadingStatusDelta & [{'prf_nuc_set': h} for h in chain]).fetch('prf_nuc_set', 'change', *columns, as_dict=True), columns=['prf_nuc_set', 'change', *columns])
+            for prf_nuc_set in reversed(chain):
+                df = cls.apply_cave_delta(df, deltas[deltas.prf_nuc_set == prf_nuc_set])
+        return df.sort_values('nucleus_id').reset_index(drop=True)
+
+    @classmethod
+    def diff_cave_status(cls, base, df):
+        """
+        Computes the changes in CAVE proofreading status from base to df.
+
+        :param base (pd.DataFrame): nucleus_id, status_dendrite, status_axon of base set
+        :param df (pd.DataFrame): nucleus_id, status_dendrite, status_axon of new set
+        :returns (pd.DataFrame): nucleus_id, change, status_dendrite, status_axon of every added, removed or changed nucleus
+        """
+        base = base.drop_duplicates('nucleus_id').set_index('nucleus_id')[cls.status_attrs]
+        df = df.drop_duplicates('nucleus_id').set_index('nucleus_id')[cls.status_attrs]
+        common = df.index.intersection(base.index)
+        is_changed = (df.loc[common].fillna('') != base.loc[common].fillna('')).any(axis=1).values
+        delta = pd.concat([
+            df.loc[df.index.difference(base.index)].assign(change='added'),
+            base.loc[base.index.difference(df.index)].assign(change='removed', status_dendrite=None, status_axon=None),
+            df.loc[common[is_changed]].assign(change='changed')
+        ])
+        return delta.rename_axis('nucleus_id').reset_index()[['nucleus_id', 'change', *cls.status_attrs]]
+
+    @classmethod
+    def apply_cave_delta(cls, base, delta):
+        """
+        Applies changes computed by `diff_cave_status` to base.
+
+        :param base (pd.DataFrame): nucleus_id, status_dendrite, status_axon of base set
+        :param delta (pd.DataFrame): nucleus_id, change, status_dendrite, status_axon of every added, removed or changed nucleus
+        :returns (pd.DataFrame): nucleus_id, status_dendrite, status_axon of new set
+        """
+        columns = ['nucleus_id', *cls.status_attrs]
+        return pd.concat([base.loc[~base.nucleus_id.isin(delta.nucleus_id), columns], delta.loc[delta.change != 'removed', columns]], ignore_index=True)
+
+    @classmethod
+    def fetch_set(cls, prf_nuc_set):
+        """
+        Fetches the rows of a set from the database, reconstructing CAVE sets stored as changes relative to a base set.
+
+        :param prf_nuc_set (str): set hash
+        :returns: name of the store table of the set, pd.DataFrame of rows
+        """
+        restr = {'prf_nuc_set': prf_nuc_set}
+        if (cls.CAVEProofreadingStatus & restr) or (cls.CAVEDelta & restr):
+            return cls.CAVEProofreadingStatus.__qualname__, cls.fetch_cave_status(prf_nuc_set)
+        part = cls.r1swh(prf_nuc_set)
+        return type(part).__qualname__, pd.DataFrame(part.fetch(as_dict=True), columns=part.heading.names).drop(columns='prf_nuc_set')
+
+    @classmethod
+    def export(cls, prf_nuc_set):
+        """
+        Exports a set to `store`.
+
+        :param prf_nuc_set (str): set hash
+        :returns (Path): path to exported set
+        """
+        path = cls.store.find(cls.hash_name, prf_nuc_set)
+        if path is None:
+            table_name, df = cls.fetch_set(prf_nuc_set)
+            path = cls.store.write(table_name, cls.hash_name, prf_nuc_set, df)
+        return path
+
+    @classmethod
+    def export_all(cls):
+        """
+        Exports every set not yet in `store`.
+
+        :returns (list): paths to newly exported sets
+        """
+        return [cls.export(h) for h in cls.fetch(cls.hash_name) if not cls.store.contains(cls.hash_name, h)]
+
+    @classmethod
+    def load(cls, prf_nuc_set, columns=None, as_table=False):
+        """
+        Loads a set from `store`, exporting it first if needed. If `store` is None, fetches it from the database.
+
+        :param prf_nuc_set (str): set hash
+        :param columns (list): columns to return
+            default (None) -> all columns
+        :param as_table (bool): If True, returns the memory-mapped pa.Table instead of a pd.DataFrame
+        """
+        if cls.store is None:
+            df = cls.fetch_set(prf_nuc_set)[1]
+            return df if columns is None else df[columns]
+        cls.export(prf_nuc_set)
+        table = cls.store.read(cls.hash_name, prf_nuc_set, columns=columns)
+        return table if as_table else table.to_pandas()
+
+    @classmethod
+    def status_arrays(cls, prf_nuc_set, attrs=None):
+        """
+        Loads the nucleus_ids and statuses of a set as arrays sorted by nucleus_id.
+
+        :param prf_nuc_set (str): set hash
+        :param attrs (list): status attributes to load
+            default (None) -> `status_attrs`
+        :returns: nucleus_ids (np.ndarray), dict of attr: np.ndarray of statuses with missing statuses as ''
+        """
+        attrs = cls.status_attrs if attrs is None else list(attrs)
+        df = cls.load(prf_nuc_set, columns=['nucleus_id', *attrs])
+        df = df.drop_duplicates('nucleus_id').sort_values('nucleus_id')
+        return df.nucleus_id.to_numpy(dtype=np.int64), {attr: df[attr].fillna('').to_numpy(dtype=str) for attr in attrs}
+
+    @classmethod
+    def status_index(cls, prf_nuc_set):
+        """
+        Returns a compact index of the statuses of a CAVE set.
+
+        :param prf_nuc_set (str): set hash
+        :returns (StatusIndex): index supporting e.g. `index.select(status_axon='extended', status_dendrite='clean')`
+        """
+        df = cls.load(prf_nuc_set, columns=['nucleus_id', *cls.status_attrs]).drop_duplicates('nucleus_id')
+        return StatusIndex.from_frame(df, cls.status_attrs)
+
+    @classmethod
+    def compare(cls, prf_nuc_set_a, prf_nuc_set_b, attrs=None, _arrays=None):
+        """
+        Compares two sets with sorted-array set operations.
+
+        :param prf_nuc_set_a (str): hash of earlier set
+        :param prf_nuc_set_b (str): hash of later set
+        :param attrs (list): status attributes to compare
+            default (None) -> `status_attrs`
+        :returns (dict): 
+            added (np.ndarray): nucleus_ids in b but not a
+            removed (np.ndarray): nucleus_ids in a but not b
+            transitions (pd.DataFrame): nucleus_id and <attr>_a, <attr>_b of every nucleus in both sets with a changed status
+        """
+        _arrays = {} if _arrays is None else _arrays
+        for h in [prf_nuc_set_a, prf_nuc_set_b]:
+            if h not in _arrays:
+                _arrays[h] = cls.status_arrays(h, attrs=attrs)
+        (ids_a, status_a), (ids_b, status_b) = _arrays[prf_nuc_set_a], _arrays[prf_nuc_set_b]
+        common, ia, ib = np.intersect1d(ids_a, ids_b, assume_unique=True, return_indices=True)
+        changed = np.zeros(len(common), dtype=bool)
+        for attr in status_a:
+            changed |= status_a[attr][ia] != status_b[attr][ib]
+        transitions = pd.DataFrame({'nucleus_id': common[changed]})
+        for attr in status_a:
+            for suffix, status, i in [('a', status_a, ia), ('b', status_b, ib)]:
+                values = status[attr][i[changed]]
+                transitions[f'{attr}_{suffix}'] = np.where(values == '', None, values)
+        return {
+            'added': np.setdiff1d(ids_b, ids_a, assume_unique=True),
+            'removed': np.setdiff1d(ids_a, ids_b, assume_unique=True),
+            'transitions': transitions,
+        }
+
+    @classmethod
+    def compare_series(cls, prf_nuc_sets, attrs=None):
+        """
+        Compares each set in a time series to the previous one. Each set is loaded once.
+
+        :param prf_nuc_sets (list): set hashes in order
+        :param attrs (list): status attributes to compare
+            default (None) -> `status_attrs`
+        :returns (pd.DataFrame): prf_nuc_set_a, prf_nuc_set_b, n_added, n_removed and n_changed_<attr> of each consecutive pair
+        """
+        arrays = {}
+        rows = []
+        for a, b in zip(prf_nuc_sets[:-1], prf_nuc_sets[1:]):
+            diff = cls.compare(a, b, attrs=attrs, _arrays=arrays)
+            row = {'prf_nuc_set_a': a, 'prf_nuc_set_b': b, 'n_added': len(diff['added']), 'n_removed': len(diff['removed'])}
+            for attr in arrays[a][1]:
+                row[f'n_changed_{attr}'] = int((diff['transitions'][f'{attr}_a'].fillna('') != diff['transitions'][f'{attr}_b'].fillna('')).sum())
+            rows.append(row)
+            arrays.pop(a) # only the previous set is needed for the next comparison
+        return pd.DataFrame(rows)
 
     class ExcelPrfSheet(m65mprf.PrfNucleusSet.ExcelPrfSheet):
         pass
 
     class ExcelPrfSheetMaker(m65mprf.PrfNucleusSet.ExcelPrfSheetMaker):
+        @instrumented('make')
         def make(self, key):
             df = ImportMethod.run(key)['df']
-            df['prf_nuc_set'] = self.hash1(df, unique=True)
-            self.master.ExcelPrfSheet.insert(df, ignore_extra_fields=True, insert_to_master=True, insert_to_master_kws={'ignore_extra_fields': True, 'skip_duplicates': True})
-            self.insert(df, ignore_extra_fields=True, skip_hashing=True)
+            with stage(self, 'hash') as record:
+                df['prf_nuc_set'] = hash_set(self, df)
+                record['n_rows'] = len(df)
+            base_prf_nuc_set = ImportMethod.ExcelPrfSheetContent.base_set(key['import_method'])
+            with stage(self, 'insert') as record:
+                if base_prf_nuc_set is None:
+                    batch_insert(self.master.ExcelPrfSheet, df, ignore_extra_fields=True, insert_to_master=True, insert_to_master_kws={'ignore_extra_fields': True, 'skip_duplicates': True})
+                else:
+                    self.insert_changed(df, base_prf_nuc_set)
+                batch_insert(self, df, ignore_extra_fields=True, skip_hashing=True)
+                record['n_rows'] = len(df)
+
+        @classmethod
+        def unchanged_nucleus_ids(cls, df, base_prf_nuc_set):
+            """
+            Returns the nucleus_ids of rows of df identical to their row in set base_prf_nuc_set, compared as stored in 
+                PrfNucleusSet.ExcelPrfSheet, e.g. time_min as single precision floats.
+
+            :param df (pd.DataFrame): rows of a sheet, as returned by `ImportMethod.ExcelPrfSheetContent.run`
+            :param base_prf_nuc_set (str): set imported from an earlier content of the sheet
+            :returns (np.ndarray): nucleus_ids
+            """
+            table = cls.master.ExcelPrfSheet
+            attrs = [attr for attr in table.heading.names if attr != 'prf_nuc_set']
+            base = pd.DataFrame((table & {'prf_nuc_set': base_prf_nuc_set}).fetch(*attrs, as_dict=True), columns=attrs)
+
+            def normalize(rows):
+                rows = rows[attrs].copy()
+                for attr in attrs:
+                    heading = table.heading.attributes[attr]
+                    if heading.numeric:
+                        rows[attr] = pd.to_numeric(rows[attr]).astype(np.float32 if heading.type.startswith('float') else np.float64)
+                    else:
+                        rows[attr] = rows[attr].astype(object).where(rows[attr].notnull(), None)
+                return rows
+
+            return normalize(df).merge(normalize(base), on=attrs).nucleus_id.astype(np.int64).to_numpy()
+
+        @classmethod
+        def insert_changed(cls, df, base_prf_nuc_set):
+            """
+            Inserts the rows of df, a set imported from an edited sheet, to PrfNucleusSet.ExcelPrfSheet. Rows unchanged 
+                since set base_prf_nuc_set are copied from it with INSERT ... SELECT, in queries of at most `nucleus_id_chunksize` 
+                nucleus_ids, and only the changed rows are sent to the database.
+
+            :param df (pd.DataFrame): rows of the set, with prf_nuc_set
+            :param base_prf_nuc_set (str): set imported from the previous content of the sheet
+            :returns (int): number of changed rows sent
+            """
+            table = cls.master.ExcelPrfSheet
+            prf_nuc_set = df.prf_nuc_set.iloc[0]
+            unchanged = cls.unchanged_nucleus_ids(df, base_prf_nuc_set)
+            cls.master.insert1({'prf_nuc_set': prf_nuc_set}, skip_duplicates=True)
+            for i in range(0, len(unchanged), nucleus_id_chunksize):
+                rows = table & {'prf_nuc_set': base_prf_nuc_set} & nucleus_id_restr(unchanged[i:i + nucleus_id_chunksize])
+                table.insert(rows.proj(..., base_prf_nuc_set='prf_nuc_set', prf_nuc_set=f'"{prf_nuc_set}"'), ignore_extra_fields=True)
+            changed = df[~df.nucleus_id.isin(unchanged)]
+            if len(changed):
+                batch_insert(table, changed, ignore_extra_fields=True)
+            logger.info(f'Copied {len(unchanged)} unchanged rows of set {prf_nuc_set} from set {base_prf_nuc_set} and inserted {len(changed)} changed rows.')
+            return len(changed)
     
     class CAVEMaker(m65mprf.PrfNucleusSet.CAVEMaker):
+        incremental = False # if True, sets are stored as changes relative to the most recent CAVE set of the same table, and read with `PrfNucleusSet.fetch_cave_status`
+        max_chain_length = 10 # with incremental, a full set is stored instead once the base set is this many deltas from a full set
+
+        @instrumented('make')
         def make(self, key):
             df = ImportMethod.run(key)['df']
-            df['prf_nuc_set'] = self.hash1(df, unique=True)
-            self.master.CAVEProofreadingStatus.insert(df, ignore_extra_fields=True, skip_duplicates=True, insert_to_master=True, insert_to_master_kws={'ignore_extra_fields': True, 'skip_duplicates': True})
-            self.insert(df, ignore_extra_fields=True, skip_duplicates=True, skip_hashing=True)
+            with stage(self, 'hash') as record:
+                df['prf_nuc_set'] = hash_set(self, df)
+                record['n_rows'] = len(df)
+            base_prf_nuc_set = self.base_set(key) if self.incremental else None
+            if base_prf_nuc_set is not None and self.master.CAVEDelta.chain_length(base_prf_nuc_set) >= self.max_chain_length:
+                base_prf_nuc_set = None # start a new chain, so reconstructing a set never walks more than max_chain_length deltas
+            with stage(self, 'insert') as record:
+                if base_prf_nuc_set is None:
+                    batch_insert(self.master.CAVEProofreadingStatus, df, ignore_extra_fields=True, skip_duplicates=True, insert_to_master=True, insert_to_master_kws={'ignore_extra_fields': True, 'skip_duplicates': True})
+                else:
+                    self.master.CAVEDelta.fill(df, base_prf_nuc_set)
+                batch_insert(self, df, ignore_extra_fields=True, skip_duplicates=True, skip_hashing=True)
+                record['n_rows'] = len(df)
+
+        @classmethod
+        def base_set(cls, key):
+            """
+            Returns the hash of the set made from the most recent earlier version of the same CAVE table, or None if there is none.
+
+            :param key (dict): ImportMethod.CAVE key
+            """
+            params = (ImportMethod.CAVE & key).fetch1()
+            sets = (cls.proj() * ImportMethod.CAVE.proj('table_name', 'ver')) & {'table_name': params['table_name']} & f'ver < {params["ver"]}'
+            if not sets:
+                return
+            return sets.fetch('prf_nuc_set', order_by='ver DESC', limit=1)[0]
+
+        @classmethod
+        def backfill_plan(cls, table_name, ver_start, ver_end=None):
+            """
+            Returns the state of a CAVE table for every materialization version in a range.
+
+            :param table_name (str): name of CAVE status table
+            :param ver_start (int): first materialization version
+            :param ver_end (int): last materialization version (inclusive)
+                default (None) -> latest version in m65mat.Materialization
+            :returns (pd.DataFrame): ver, import_method (None if not yet imported) and done (True if already populated)
+            """
+            restr = f'ver >= {int(ver_start)}' + ('' if ver_end is None else f' AND ver <= {int(ver_end)}')
+            vers = np.unique((m65mprf.m65mat.Materialization & restr).fetch('ver')).astype(int)
+            imported = pd.DataFrame((ImportMethod.CAVE & {'table_name': table_name, 'tag': Tag.version} & restr).fetch('ver', 'import_method', as_dict=True), columns=['ver', 'import_method'])
+            done = (cls & (ImportMethod.CAVE & {'table_name': table_name, 'tag': Tag.version} & restr)).fetch('import_method')
+            plan = pd.DataFrame({'ver': vers}).merge(imported.astype({'ver': int}), on='ver', how='left')
+            plan['import_method'] = plan.import_method.astype(object).where(plan.import_method.notnull(), None)
+            plan['done'] = plan.import_method.isin(done)
+            return plan
+
+        @classmethod
+        def backfill(cls, table_name, ver_start, ver_end=None, max_workers=4, processes=1, **populate_kws):
+            """
+            Imports and populates a CAVE table for every materialization version in a range.
+
+            Versions already populated are skipped, so rerunning after a failure resumes where it stopped. 
+            Pending versions are imported, their tables are downloaded into the disk cache concurrently, then each version is 
+                populated with job reservation. Each make runs in its own transaction, so a failed version leaves no partial set.
+
+            :param table_name (str): name of CAVE status table
+            :param ver_start (int): first materialization version
+            :param ver_end (int): last materialization version (inclusive)
+                default (None) -> latest version in m65mat.Materialization
+            :param max_workers (int): number of threads downloading CAVE tables
+            :param processes (int): number of processes populating versions, see `populate_utils.populate_keys`
+            :param populate_kws: kwargs to pass to populate
+            :returns (pd.DataFrame): ver, import_method, status ("done", "success", "reserved" or "error"), seconds and error of each version
+            """
+            plan = cls.backfill_plan(table_name, ver_start, ver_end)
+            pending = plan[~plan.done]
+            logger.info(f'Backfilling {table_name}: {len(pending)} of {len(plan)} versions pending.')
+            errors = {}
+            for ver in pending.ver[pending.import_method.isnull()]:
+                try:
+                    ImportMethod.CAVE.fill(table_name, ver=int(ver))
+                except Exception as e:
+                    errors[ver] = repr(e)
+                    logger.exception(f'Could not import {table_name} (ver {ver}).')
+            
+            vers = [v for v in pending.ver if v not in errors]
+            with ThreadPoolExecutor(max_workers) as executor:
+                futures = {executor.submit(ImportMethod.CAVE.prefetch, table_name, ver): ver for ver in vers}
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception:
+                        logger.exception(f'Could not prefetch CAVE tables for {table_name} (ver {futures[future]}).')
+
+            ver_restr = f'ver in ({",".join(map(str, vers))})' if vers else 'FALSE'
+            keys = (ImportMethod.CAVE & {'table_name': table_name, 'tag': Tag.version} & ver_restr).fetch('KEY', order_by='ver')
+            results = {r['key']['import_method']: r for r in populate_keys(cls, keys, processes=processes, **populate_kws).to_dict('records')}
+            
+            report = []
+            for row in cls.backfill_plan(table_name, ver_start, ver_end).itertuples():
+                if row.ver not in pending.ver.values:
+                    status, seconds, error = 'done', None, None
+                elif row.ver in errors:
+                    status, seconds, error = 'error', None, errors[row.ver]
+                elif row.import_method in results:
+                    status, seconds, error = [results[row.import_method][k] for k in ['status', 'seconds', 'error']]
+                else:
+                    status, seconds, error = 'error', None, 'not populated'
+                report.append({'ver': row.ver, 'import_method': row.import_method, 'status': status, 'seconds': seconds, 'error': error})
+            report = pd.DataFrame(report, columns=['ver', 'import_method', 'status', 'seconds', 'error'])
+            logger.info(f'Backfilled {table_name}: {report.status.value_counts().to_dict()}.')
+            return report
 
     class CAVEProofreadingStatus(m65mprf.PrfNucleusSet.CAVEProofreadingStatus):
+        """
+        Rows of the CAVE sets stored in full. Sets made with `CAVEMaker.incremental` are stored as changes in CAVEDelta and 
+            CAVEProofreadingStatusDelta and have no rows here. Read any CAVE set with `PrfNucleusSet.fetch_cave_status`, 
+            or restrict with `of_set` to query or join in the database.
+        """
+        @classmethod
+        def of_set(cls, prf_nuc_set):
+            """
+            Returns the rows of a CAVE set, for queries and joins in the database.
+
+            :param prf_nuc_set (str): set hash
+            :returns (dj relation): rows of the set
+            :raises ValueError: if the set is stored as changes relative to a base set, use `PrfNucleusSet.fetch_cave_status`
+            """
+            restr = {'prf_nuc_set': prf_nuc_set}
+            if cls.master.CAVEDelta & restr:
+                raise ValueError(f'Set {prf_nuc_set} is stored as changes relative to a base set. Use PrfNucleusSet.fetch_cave_status to read it.')
+            return cls & restr
+
+    class CAVEDelta(m65mprf.PrfNucleusSet.CAVEDelta):
+        @classmethod
+        @instrumented('fill')
+        def fill(cls, df, base_prf_nuc_set):
+            """
+            Stores a CAVE set as the changes in proofreading status relative to a base set.
+
+            :param df (pd.DataFrame): nucleus_id, status_dendrite, status_axon, prf_nuc_set of the new set
+            :param base_prf_nuc_set (str): hash of the base set
+            """
+            prf_nuc_set = unwrap(df.prf_nuc_set.unique().tolist(), enforce_one_item=True)
+            chain_length = cls.chain_length(base_prf_nuc_set) + 1
+            with stage(cls, 'diff') as record:
+                delta = cls.master.diff_cave_status(cls.master.fetch_cave_status(base_prf_nuc_set), df)
+                record['n_rows'] = len(delta)
+            counts = delta.change.value_counts()
+            cls.insert1(
+                {
+                    'prf_nuc_set': prf_nuc_set, 
+                    'base_prf_nuc_set': base_prf_nuc_set, 
+                    'chain_length': chain_length,
+                    **{f'n_{change}': int(counts.get(change, 0)) for change in ['added', 'removed', 'changed']}
+                }, 
+                skip_duplicates=True, 
+                insert_to_master=True
+            )
+            batch_insert(cls.master.CAVEProofreadingStatusDelta, delta, constant_attrs={'prf_nuc_set': prf_nuc_set}, skip_duplicates=True)
+            logger.info(f'Stored set {prf_nuc_set} as {len(delta)} changes relative to set {base_prf_nuc_set}.')
+
+        @classmethod
+        def chain_length(cls, prf_nuc_set):
+            """
+            Returns the number of deltas from the nearest full set to a set, 0 if the set is stored in full.
+            """
+            chain_length = (cls & {'prf_nuc_set': prf_nuc_set}).fetch('chain_length')
+            return int(chain_length[0]) if len(chain_length) else 0
+
+    class CAVEProofreadingStatusDelta(m65mprf.PrfNucleusSet.CAVEProofreadingStatusDelta):
+        pass
+
+
+class PrfThroughput(m65mprf.PrfThroughput):
+    columns = ['area', 'prf_method', *[f'{attr}_{suffix}' for suffix in rollup_utils.compartments.values() for attr in ['proofreader', 'time_min', 'finished', 'date_finished']]]
+    _rollups = {} # prf_nuc_set: rollup rows, sets never change once populated
+
+    @instrumented('make')
+    def make(self, key):
+        with stage(self, 'fetch') as record:
+            df = pd.DataFrame((PrfNucleusSet.ExcelPrfSheet & key).fetch(*self.columns, as_dict=True), columns=self.columns)
+            record['n_rows'] = len(df)
+        with stage(self, 'aggregate') as record:
+            rollups = rollup_utils.throughput(df)
+            record['n_rows'] = len(rollups)
+        with stage(self, 'insert') as record:
+            self.insert1({**key, 'n_rows': len(df)}, ignore_extra_fields=True)
+            self.Rollup.insert(rollups.assign(**key).to_dict('records'), ignore_extra_fields=True)
+            record['n_rows'] = len(rollups)
+
+    @classmethod
+    def latest(cls):
+        """
+        Returns the hash of the most recently imported ExcelPrfSheet set with a rollup, or None if there is none.
+        """
+        sets = (PrfNucleusSet.ExcelPrfSheetMaker & cls.proj()).fetch('prf_nuc_set', 'ts_inserted', order_by='ts_inserted DESC', limit=1)
+        return sets[0][0] if len(sets[0]) else None
+
+    @classmethod
+    def rollups(cls, prf_nuc_sets):
+        """
+        Fetches the rollup rows of sets, caching them in memory.
+
+        :param prf_nuc_sets (list): set hashes
+        :returns (pd.DataFrame): prf_nuc_set, `rollup_utils.group_attrs`, totals and time_hist of each rollup row
+        """
+        missing = [h for h in prf_nuc_sets if h not in cls._rollups]
+        if missing:
+            attrs = [*cls.Rollup.heading.names]
+            df = pd.DataFrame((cls.Rollup & [{'prf_nuc_set': h} for h in missing]).fetch(*attrs, as_dict=True), columns=attrs)
+            for h in missing:
+                if cls & {'prf_nuc_set': h}:
+                    cls._rollups[h] = df[df.prf_nuc_set == h].reset_index(drop=True)
+        return pd.concat([cls._rollups[h] for h in prf_nuc_sets if h in cls._rollups] or [pd.DataFrame(columns=cls.Rollup.heading.names)], ignore_index=True)
+
+    @classmethod
+    def rollup(cls, prf_nuc_sets=None, by=('proofreader',), percentiles=(50, 90), **restr):
+        """
+        Returns proofreading totals and time percentiles per group, computed from the pre-aggregated rollup rows.
+
+        Sheets are usually cumulative, so by default only the most recent sheet is summarized. Rows of several sets are 
+            summed, so pass several sets only if they do not overlap.
+
+        :param prf_nuc_sets (str, list): set hash or hashes
+            default (None) -> `latest`
+        :param by (list): attributes to group by, any of 'compartment', 'proofreader', 'area', 'prf_method', 'week'
+        :param percentiles (list): percentiles of time to complete (min) to compute
+        :param restr: attribute: value or list of values to restrict rollup rows to, e.g. area='V1'. Proofreader names and 
+            areas are matched like they are stored, see `rollup_utils.normalize`.
+        :returns (pd.DataFrame): by, n_nuclei, n_finished, n_timed, time_min_total, time_min_mean and time_min_p<q> of each group
+        """
+        prf_nuc_sets = [cls.latest()] if prf_nuc_sets is None else np.atleast_1d(prf_nuc_sets).tolist()
+        df = cls.rollups([h for h in prf_nuc_sets if h is not None])
+        for attr, values in restr.items():
+            values = np.atleast_1d(values)
+            if attr in ['proofreader', 'area']:
+                values = rollup_utils.normalize(values, upper=attr == 'area')
+            df = df[df[attr].isin(values)]
+        return rollup_utils.combine(df, by=by, percentiles=percentiles)
+
+    class Rollup(m65mprf.PrfThroughput.Rollup):
         pass
 
 
 class ExclusionMethod(m65mprf.ExclusionMethod):
 
     class Manual(m65mprf.ExclusionMethod.Manual):
-        pass
+        @classmethod
+        def update_method(cls, exclusion_method_name, exclusion_method_desc=None):
+            super().update_method(exclusion_method_name, exclusion_method_desc=exclusion_method_desc)
+            lookups.invalidate(cls)
+
+        @classmethod
+        def method_id(cls, exclusion_method_name):
+            """
+            Returns the exclusion_method_id of a manual exclusion method by name. 
+            
+            `update_method` adds a row for each new description of a name, so the most recently inserted row is used.
+            """
+            rows = lookups.lookup(cls, exclusion_method_name=exclusion_method_name)
+            assert rows, f'No manual exclusion method named {exclusion_method_name}.'
+            return max(rows, key=lambda r: r['exclusion_method_ts'])['exclusion_method_id']
 
 
 class PrfNucleusExclude(m65mprf.PrfNucleusExclude):
-    pass
+    @classmethod
+    def exclude(cls, key, exclusion_method_id, exclude_user_id):
+        super().exclude(key, exclusion_method_id, exclude_user_id)
+        PrfNucleusIncludeSet.update_current(key['nucleus_id'])
+
+    @classmethod
+    def exclude_many(cls, nucleus_ids, exclusion_method_id, exclude_user_id):
+        """
+        Excludes many nuclei with a shared exclusion method and user. 
+        
+        All nucleus_ids are validated against m65mat.Nucleus with `validate_nucleus_ids` and inserted in one transaction.
+
+        :param nucleus_ids (array-like, pd.DataFrame): nucleus_ids to exclude, or rows with a nucleus_id column
+        :param exclusion_method_id (str): id of exclusion method
+        :param exclude_user_id (str): user performing exclusion
+        :returns (dict): n_inserted, n_skipped (already excluded with this method)
+        """
+        nucleus_ids = validate_nucleus_ids(nucleus_ids)
+        existing = fetch_nucleus_ids(cls & {'exclusion_method_id': exclusion_method_id}, nucleus_ids)
+        new = np.setdiff1d(nucleus_ids, existing)
+        if len(new):
+            batch_insert(
+                cls, 
+                pd.DataFrame({'nucleus_id': new}), 
+                constant_attrs=dict(exclusion_method_id=exclusion_method_id, exclude_user_id=exclude_user_id), 
+                allow_direct_insert=True, 
+                skip_duplicates=True
+            )
+            PrfNucleusIncludeSet.update_current(new)
+        return {'n_inserted': len(new), 'n_skipped': len(nucleus_ids) - len(new)}
 
 
 class PrfNucleusReInclude(m65mprf.PrfNucleusReInclude):
-    pass
+    @classmethod
+    def reinclude(cls, key, reinclude_user_id, description=None):
+        super().reinclude(key, reinclude_user_id, description=description)
+        PrfNucleusIncludeSet.update_current(key['nucleus_id'])
+
+    @classmethod
+    def reinclude_many(cls, nucleus_ids, reinclude_user_id, description=None):
+        """
+        Reincludes many nuclei with a shared user and description.
+        
+        All nucleus_ids are validated against m65mat.Nucleus with `validate_nucleus_ids` and inserted in one transaction.
+
+        :param nucleus_ids (array-like, pd.DataFrame): nucleus_ids to reinclude, or rows with a nucleus_id column
+        :param reinclude_user_id (str): user performing reinclusion
+        :param description (str): description of reinclusion
+        :returns (dict): n_inserted, n_skipped (already reincluded)
+        """
+        nucleus_ids = validate_nucleus_ids(nucleus_ids)
+        existing = fetch_nucleus_ids(cls, nucleus_ids)
+        new = np.setdiff1d(nucleus_ids, existing)
+        if len(new):
+            batch_insert(
+                cls, 
+                pd.DataFrame({'nucleus_id': new}), 
+                constant_attrs=dict(reinclude_user_id=reinclude_user_id, description=description), 
+                allow_direct_insert=True, 
+                skip_duplicates=True
+            )
+            PrfNucleusIncludeSet.update_current(new)
+        return {'n_inserted': len(new), 'n_skipped': len(nucleus_ids) - len(new)}
 
 
 class PrfNucleusIncludeSet(m65mprf.PrfNucleusIncludeSet):
+    _current = None
+    store = SetStore() # set to None to disable local export of sets
+
+    @classmethod
+    def recommended(cls):
+        """
+        Returns the hash of the most recent recommended include set.
+        """
+        prf_nuc_include_set = PrfNucleusIncludeSetRecommended.fetch('prf_nuc_include_set', order_by='timestamp DESC', limit=1)
+        assert len(prf_nuc_include_set) == 1, 'No recommended include set found.'
+        return prf_nuc_include_set[0]
+
+    @classmethod
+    def export(cls, prf_nuc_include_set):
+        """
+        Exports the members of an include set to `store`.
+
+        :param prf_nuc_include_set (str): include set hash
+        :returns (Path): path to exported set
+        """
+        path = cls.store.find(cls.hash_name, prf_nuc_include_set)
+        if path is None:
+            df = pd.DataFrame((cls.Member & {cls.hash_name: prf_nuc_include_set}).fetch(as_dict=True), columns=cls.Member.heading.names)
+            path = cls.store.write(cls.Member.__qualname__, cls.hash_name, prf_nuc_include_set, df)
+        return path
+
+    @classmethod
+    def export_all(cls):
+        """
+        Exports every include set not yet in `store`.
+
+        :returns (list): paths to newly exported sets
+        """
+        return [cls.export(h) for h in cls.fetch(cls.hash_name) if not cls.store.contains(cls.hash_name, h)]
+
+    @classmethod
+    def load(cls, prf_nuc_include_set=None, columns=None, as_table=False):
+        """
+        Loads the members of an include set from `store`, exporting it first if needed. If `store` is None, fetches them from the database.
+
+        :param prf_nuc_include_set (str): include set hash
+            default (None) -> most recent recommended include set
+        :param columns (list): columns to return
+            default (None) -> all columns
+        :param as_table (bool): If True, returns the memory-mapped pa.Table instead of a pd.DataFrame
+        """
+        prf_nuc_include_set = prf_nuc_include_set if prf_nuc_include_set is not None else cls.recommended()
+        if cls.store is None:
+            df = pd.DataFrame((cls.Member & {cls.hash_name: prf_nuc_include_set}).fetch(as_dict=True), columns=cls.Member.heading.names)
+            return df if columns is None else df[columns]
+        cls.export(prf_nuc_include_set)
+        table = cls.store.read(cls.hash_name, prf_nuc_include_set, columns=columns)
+        return table if as_table else table.to_pandas()
+
+    @classmethod
+    def current(cls, refresh=False):
+        """
+        Returns an index of the nuclei currently included in the most recent recommended include set, with their prf_method and area.
+
+        Exclusions and reinclusions recorded after the set was computed are applied. Nuclei excluded when the set was computed 
+            are not members, so they are only included again once a new set is computed. 
+        Members are read from `store` when exported. The index is built once per process and updated in place by PrfNucleusExclude.exclude and PrfNucleusReInclude.reinclude. 
+            Pass refresh=True to rebuild it, e.g. after a new recommended set or exclusions recorded by another process.
+
+        :param refresh (bool): If True, rebuilds the index from the database
+        :returns (NucleusIndex): index supporting `nucleus_id in index`, `index.contains(nucleus_ids)` and `index.lookup(nucleus_ids)`
+        """
+        if cls._current is None or refresh:
+            df = cls.load(columns=['nucleus_id', 'prf_method', 'area', 'ts_computed'])
+            df = df.sort_values('ts_computed', kind='stable').drop_duplicates('nucleus_id', keep='last')
+            index = NucleusIndex(df.nucleus_id, prf_method=df.prf_method, area=df.area)
+            index.set_active(cls.excluded_nucleus_ids(df.nucleus_id), False)
+            cls._current = index
+        return cls._current
+
+    @classmethod
+    def excluded_nucleus_ids(cls, nucleus_ids):
+        """
+        Returns the nucleus_ids among nucleus_ids that are excluded and not reincluded.
+
+        Excluded nuclei are few, so they are fetched in full and intersected with nucleus_ids locally rather than 
+            sending nucleus_ids, which may be a whole include set, to the database.
+        """
+        nucleus_ids = np.atleast_1d(nucleus_ids)
+        if len(nucleus_ids) == 0:
+            return nucleus_ids
+        excluded = (PrfNucleusExclude - PrfNucleusReInclude.proj()).fetch('nucleus_id')
+        return np.unique(nucleus_ids[np.isin(nucleus_ids, excluded)])
+
+    @classmethod
+    def update_current(cls, nucleus_ids):
+        """
+        Re-checks the exclusion of nucleus_ids and updates the current include set index in place, if it was built.
+        """
+        if cls._current is None:
+            return
+        nucleus_ids = np.atleast_1d(nucleus_ids)
+        cls._current.set_active(nucleus_ids, ~np.isin(nucleus_ids, cls.excluded_nucleus_ids(nucleus_ids)))
     
     class Member(m65mprf.PrfNucleusIncludeSet.Member):
 
         @classmethod
-        def fill(cls, prf_nuc_set_id):
+        @instrumented('fill')
+        def fill(cls, prf_nuc_set_id, server_side=True):
+            """
+            Computes an include set from a PrfNucleusSet minus excluded nuclei.
+
+            :param prf_nuc_set_id (str): hash of PrfNucleusSet made from an ExcelPrfSheet
+            :param server_side (bool): If True, only the hashed attributes are fetched, in batches, to compute the group hash, then rows 
+                are copied with one INSERT ... SELECT in the database, in the same transaction. If False, rows are fetched and inserted from the client.
+            :raises ValueError: if the set was made from CAVE, which has no prf_method or area, or if exclusions changed 
+                between fetching and copying the rows, in which case nothing is inserted
+            """
+            restr = {'prf_nuc_set': prf_nuc_set_id}
+            if (PrfNucleusSet.CAVEProofreadingStatus & restr) or (PrfNucleusSet.CAVEDelta & restr):
+                raise ValueError(f'Set {prf_nuc_set_id} was made from CAVE. Include sets require prf_method and area, which only ExcelPrfSheet sets have.')
             source = PrfNucleusSet.r1swh(prf_nuc_set_id)
             source -= (PrfNucleusExclude - PrfNucleusReInclude.proj())
-            cls.insert(source, constant_attrs=dict(ts_computed=str(datetime.utcnow()), tag=Tag.version), ignore_extra_fields=True, skip_duplicates=True, insert_to_master=True)
+            constant_attrs = dict(ts_computed=str(datetime.utcnow()), tag=Tag.version)
+            if not server_side:
+                batch_insert(cls, source, constant_attrs=constant_attrs, ignore_extra_fields=True, skip_duplicates=True, insert_to_master=True)
+                return
+
+            with shared_conn().transaction:
+                hasher = None
+                for batch in iter_nucleus_id_batches(source, 'prf_method'):
+                    batch = batch.assign(**constant_attrs)
+                    hasher = set_hasher(cls, batch) if hasher is None else hasher.add(batch)
+                if hasher is None:
+                    return
+                n_keys = len(hasher)
+                prf_nuc_include_set = hasher.hexdigest()[:cls.hash_len]
+                rows = source.proj('prf_method', 'area', **{k: f'"{v}"' for k, v in {cls.hash_name: prf_nuc_include_set, **constant_attrs}.items()})
+                cls.master.insert1({cls.hash_name: prf_nuc_include_set}, skip_duplicates=True)
+                cls.insert(rows, ignore_extra_fields=True, skip_duplicates=True, skip_hashing=True)
+                # INSERT ... SELECT reads the latest exclusions, not the snapshot keys were fetched from, so an exclusion 
+                # recorded in between would leave members that do not match the hash. Raising rolls the transaction back.
+                n_inserted = len(cls & {cls.hash_name: prf_nuc_include_set})
+                if n_inserted != n_keys:
+                    raise ValueError(f'Inserted {n_inserted} members of include set {prf_nuc_include_set}, expected {n_keys}. Exclusions of set {prf_nuc_set_id} changed during fill. Rolled back, run fill again.')
+            logger.info(f'Inserted {n_keys} members of include set {prf_nuc_include_set} from set {prf_nuc_set_id}.')
 
 
 class PrfNucleusIncludeSetRecommended(m65mprf.PrfNucleusIncludeSetRecommended):
     @classmethod
+    @instrumented('fill')
     def fill(cls, prf_nuc_include_set, description, replace=True):
         key = dict(
             prf_nuc_include_set=prf_nuc_include_set,
@@ -164,7 +1404,22 @@ class PrfNucleusIncludeSetRecommended(m65mprf.PrfNucleusIncludeSetRecommended):
 
 
 class UnitSeedProtocol(m65mprf.UnitSeedProtocol):
-    pass
+    @classmethod
+    def select(cls, nuclei, protocol_ids=None):
+        """
+        Evaluates protocols over a population of nuclei, see `selection_utils.ProtocolSelector`.
+
+        :param nuclei (pd.DataFrame, ProtocolSelector): nucleus_id, centroid x, y, z, area and unit metrics (oracle, test_corr, 
+            mean_corr, real_von_pred_adv, model_von_pred_adv), or a selector built from them to reuse its index across calls
+        :param protocol_ids (list): protocols to evaluate
+            default (None) -> all protocols
+        :returns (pd.DataFrame): protocol_id, nucleus_id of every selected nucleus
+        """
+        selector = nuclei if isinstance(nuclei, ProtocolSelector) else ProtocolSelector(nuclei)
+        protocols = lookups.rows(cls)
+        if protocol_ids is not None:
+            protocols = [p for p in protocols if p['protocol_id'] in set(protocol_ids)]
+        return selector.select_all(protocols)
 
 
 class UnitSeedGroupMethod(m65mprf.UnitSeedGroupMethod):
@@ -172,8 +1427,30 @@ class UnitSeedGroupMethod(m65mprf.UnitSeedGroupMethod):
 
 
 class PrfNucSelectionInfo(m65mprf.PrfNucSelectionInfo):
-    pass
+    @classmethod
+    def fill(cls, nuclei, group_method_id, source, protocol_ids=None, notes=None):
+        """
+        Records the protocol selecting each nucleus in bulk. Nuclei already recorded are skipped.
+
+        :param nuclei (pd.DataFrame, ProtocolSelector): see `UnitSeedProtocol.select`
+        :param group_method_id (int): UnitSeedGroupMethod of the selection
+        :param source (str): source of the selection
+        :param protocol_ids (list): protocols to evaluate in order of priority. A nucleus selected by several protocols is recorded with the first.
+            default (None) -> all protocols in order of protocol_id
+        :param notes (str): notes
+        :returns (pd.DataFrame): nucleus_id, protocol_id of selected nuclei
+        """
+        selection = UnitSeedProtocol.select(nuclei, protocol_ids=protocol_ids)
+        priority = {p: i for i, p in enumerate(protocol_ids if protocol_ids is not None else sorted(selection.protocol_id.unique()))}
+        selection = selection.assign(priority=selection.protocol_id.map(priority)).sort_values('priority', kind='stable')
+        selection = selection.drop_duplicates('nucleus_id')[['nucleus_id', 'protocol_id']].reset_index(drop=True)
+        batch_insert(cls, selection, constant_attrs=dict(group_method_id=group_method_id, source=source, notes=notes), skip_duplicates=True)
+        return selection
 
 
 class SpreadsheetLink(m65mprf.SpreadsheetLink):
-    pass
\ No newline at end of file
+    pass
+
+
+# map part tables to the master classes of this module, whether imported directly or via the package
+djp.reassign_master_attribute(sys.modules[__name__])
@@ -0,0 +1,369 @@
+"""
+Benchmarks for the make and fill paths of minnie65_manual_proofreading against a local database.
+"""
+
+import resource
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import datajoint as dj
+import datajoint_plus as djp
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from microns_manual_proofreading_api.utils.connection_utils import shared_conn
+
+from .cave_utils import AsyncCAVEFetcher
+from .instrument_utils import count_queries
+
+logger = djp.getLogger(__name__)
+
+local_hosts = ('localhost', '127.0.0.1', 'db', 'mysql', 'mariadb')
+status_vocab = ['extended', 'clean', 'non']
+
+
+def is_local_database():
+    """
+    Returns True if dj.config['database.host'] is one of `local_hosts`.
+    """
+    return dj.config['database.host'].split(':')[0] in local_hosts
+
+
+class FakeMaterializationClient:
+    """
+    Stand-in for `CAVEclient.materialize` serving in-memory tables.
+    """
+    def __init__(self, tables, version):
+        self.tables = tables
+        self.version = int(version)
+        self.n_queries = 0
+
+    def get_tables(self):
+        return list(self.tables)
+
+    def most_recent_version(self):
+        return self.version
+
+    def query_table(self, table, select_columns=None, filter_equal_dict=None, **kwargs):
+        self.n_queries += 1
+        df = self.tables[table]
+        for k, v in (filter_equal_dict or {}).items():
+            df = df[df[k] == v]
+        return (df if select_columns is None else df[list(select_columns)]).reset_index(drop=True)
+
+
+class FakeCAVEClient:
+    """
+    Stand-in for `caveclient.CAVEclient`, to register with `AsyncCAVEFetcher.add_client`.
+    """
+    def __init__(self, tables, version):
+        """
+        :param tables (dict): table_name: pd.DataFrame
+        :param version (int): materialization version
+        """
+        self.materialize = FakeMaterializationClient(tables, version)
+
+
+def synthetic_nucleus_table(n, seed=0, first_id=1):
+    """
+    Returns a synthetic nucleus_detection_v0 with n nuclei, with ids from first_id.
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'id': np.arange(first_id, first_id + n, dtype=np.int64),
+        'pt_root_id': rng.choice(2**62, n, replace=False).astype(np.int64) + 864691134884000000,
+        'volume': rng.random(n) * 500,
+    })
+
+
+def synthetic_status_table(nuc_df, fraction=0.5, seed=0):
+    """
+    Returns a synthetic proofreading status table covering a fraction of nuclei in nuc_df.
+    """
+    rng = np.random.default_rng(seed)
+    df = nuc_df.sample(frac=fraction, random_state=seed)
+    return pd.DataFrame({
+        'id': np.arange(1, len(df) + 1, dtype=np.int64),
+        'valid': rng.random(len(df)) < 0.99,
+        'pt_root_id': df.pt_root_id.to_numpy(),
+        'status_dendrite': rng.choice(status_vocab, len(df)),
+        'status_axon': rng.choice(status_vocab, len(df)),
+    })
+
+
+def synthetic_sheet(path, nucleus_ids, seed=0):
+    """
+    Writes a synthetic proofreading sheet with the headers of the exported spreadsheet, one row per nucleus_id.
+
+    :returns (Path): path to csv
+    """
+    rng = np.random.default_rng(seed)
+    n = len(nucleus_ids)
+    pd.DataFrame({
+        '#': np.arange(n),
+        'nucleus_id': nucleus_ids,
+        'Description': rng.choice(['V1', 'RL', 'AL', 'LM'], n),
+        'Proofreader': rng.choice(['p1', 'p2', 'p3'], n),
+        'time_min_den': rng.random(n) * 60,
+        'Notes': None,
+        'finished_den': rng.random(n) < 0.9,
+        'Date Finished Den (Ctrl+;)': '1/2/2022',
+        'Proofreader.1': rng.choice(['p1', 'p2', 'p3'], n),
+        'time_min_ax': rng.random(n) * 60,
+        'Notes.1': 'note',
+        'finished_ax': np.where(rng.random(n) < 0.9, 'TRUE', 'FALSE '),
+        'Date Finished Ax (Ctrl+;)': '1/3/2022',
+        'Axon in white matter': rng.random(n) < 0.5,
+    }).to_csv(path, index=False)
+    return Path(path)
+
+
+def transfer_bytes(df):
+    """
+    Returns the size of df serialized as an Arrow IPC stream, the format the materialization service returns tables in.
+    """
+    sink = pa.BufferOutputStream()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().size
+
+
+def compare_pruning(client, queries, ver=None, trace_memory=True):
+    """
+    Measures each CAVE query pruned (columns and filters applied by the service) and unpruned (whole table fetched, 
+        then filtered and selected client side).
+
+    :param client: CAVEclient or `FakeCAVEClient`
+    :param queries (list): (table_name, query kwargs) of each table, e.g. `ImportMethod.CAVE.table_queries(table_name)`
+    :param ver (int): materialization version, only used to label results
+    :param trace_memory (bool): see `measure`
+    :returns (pd.DataFrame): table_name, ver, case, n_rows, n_columns, transfer_mb, seconds and peak_alloc_mb of each query and case
+    """
+    def unpruned(table_name, select_columns=None, filter_equal_dict=None):
+        fetched = df = client.materialize.query_table(table_name)
+        for k, v in (filter_equal_dict or {}).items():
+            df = df[df[k] == v]
+        return (df if select_columns is None else df[list(select_columns)]), fetched
+
+    def pruned(table_name, **query_kws):
+        df = client.materialize.query_table(table_name, **query_kws)
+        return df, df
+
+    results = []
+    for table_name, query_kws in queries:
+        for case, fn in [('unpruned', unpruned), ('pruned', pruned)]:
+            (df, fetched), stats = measure(fn, table_name, trace_memory=trace_memory, count_sql=False, **query_kws)
+            results.append({
+                'table_name': table_name, 
+                'ver': ver, 
+                'case': case, 
+                'n_rows': len(df), 
+                'n_columns': df.shape[1], 
+                'transfer_mb': transfer_bytes(fetched) / 2**20, 
+                'seconds': stats['seconds'], 
+                'peak_alloc_mb': stats['peak_alloc_mb'],
+            })
+    return pd.DataFrame(results)
+
+
+def fill_required_attrs(table, df):
+    """
+    Adds placeholder values for required attributes of table missing from df, for inserting synthetic upstream rows.
+    """
+    df = df.copy()
+    for attr in table.heading.attributes.values():
+        if attr.name in df or attr.nullable or attr.default is not None or attr.autoincrement:
+            continue
+        if attr.numeric:
+            df[attr.name] = 0
+        elif attr.string:
+            df[attr.name] = ''
+        elif 'time' in attr.type or 'date' in attr.type:
+            df[attr.name] = str(datetime.utcnow())
+        else:
+            df[attr.name] = None
+    return df
+
+
+@contextmanager
+def foreign_key_checks_disabled(connection=None):
+    connection = connection if connection is not None else shared_conn()
+    connection.query('SET FOREIGN_KEY_CHECKS=0')
+    try:
+        yield
+    finally:
+        connection.query('SET FOREIGN_KEY_CHECKS=1')
+
+
+def measure(fn, *args, trace_memory=True, count_sql=True, **kwargs):
+    """
+    Runs fn(*args, **kwargs) and measures it.
+
+    :param trace_memory (bool): if True, records peak Python-tracked allocations with tracemalloc (slows execution)
+    :param count_sql (bool): if True, counts SQL statements sent by this thread, see `count_queries`
+    :returns: result of fn, dict with seconds, peak_alloc_mb, max_rss_mb (process peak) and n_queries
+    """
+    if trace_memory:
+        tracemalloc.start()
+    with (count_queries() if count_sql else _null_counter()) as counter:
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if trace_memory else np.nan
+            if trace_memory:
+                tracemalloc.stop()
+    return result, {
+        'seconds': seconds,
+        'peak_alloc_mb': peak / 2**20,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10,
+        'n_queries': counter['n_queries'],
+    }
+
+
+@contextmanager
+def _null_counter():
+    yield {'n_queries': np.nan}
+
+
+def compare_to_baseline(results, baseline, tolerance=0.25):
+    """
+    Flags regressions against a stored baseline.
+
+    A case regresses if its seconds or peak_alloc_mb exceed the baseline by more than tolerance, or if it sends more SQL statements.
+
+    :param results (pd.DataFrame): output of `run_suite`
+    :param baseline (str, Path, pd.DataFrame): baseline results or path to baseline json
+    :param tolerance (float): allowed relative increase
+    :returns (pd.DataFrame): results with baseline columns and a boolean "regression" column
+    """
+    if not isinstance(baseline, pd.DataFrame):
+        baseline = pd.read_json(baseline)
+    metrics = ['seconds', 'peak_alloc_mb', 'n_queries']
+    df = results.merge(baseline[['case', 'n', *metrics]], on=['case', 'n'], how='left', suffixes=('', '_baseline'))
+    df['regression'] = (
+        (df.seconds > df.seconds_baseline * (1 + tolerance)) 
+        | (df.peak_alloc_mb > df.peak_alloc_mb_baseline * (1 + tolerance)) 
+        | (df.n_queries > df.n_queries_baseline)
+    )
+    for _, row in df[df.regression].iterrows():
+        logger.warning(f'Regression in {row.case} (n={row.n}): {row.seconds:.2f} s vs {row.seconds_baseline:.2f} s, {row.n_queries} vs {row.n_queries_baseline} queries.')
+    return df
+
+
+def save_baseline(results, path):
+    Path(path).write_text(results.to_json(orient='records', indent=1))
+
+
+def run_suite(sizes=(10_000, 100_000, 1_000_000), workdir=None, baseline=None, tolerance=0.25, n_exclusions=1000, trace_memory=True, allow_remote=False):
+    """
+    Benchmarks every make and fill path at each number of nuclei with synthetic upstream data and a fake CAVE client.
+
+    Cases: ImportMethod.ExcelPrfSheet.run (versions 1 and 2, checked to import the same nuclei and prf_methods), ImportMethod.CAVE.run, both PrfNucleusSet makers, 
+        PrfNucleusIncludeSet.Member.fill and exclusion, then reinclusion, of n_exclusions nuclei one at a time 
+        (before) and in bulk (after).
+    Synthetic rows are inserted into m65mat.Nucleus and m65mat.Materialization, so dj.config must point at a local 
+        database, e.g. a MySQL container. Each size uses a new materialization version, new nucleus_ids and a new sheet, 
+        so rerunning the suite against the same database measures the same work instead of skipping existing rows. 
+    Each case checks the number of rows it inserted before it is recorded.
+
+    :param sizes (tuple): numbers of nuclei
+    :param workdir (str, Path): directory for synthetic sheets and root_id indexes
+        default (None) -> temporary directory
+    :param baseline (str, Path, pd.DataFrame): baseline to compare against, see `compare_to_baseline`
+    :param tolerance (float): allowed relative increase over baseline
+    :param n_exclusions (int): number of nuclei to exclude and reinclude in each case, capped at half of each size
+    :param trace_memory (bool): see `measure`
+    :param allow_remote (bool): if True, runs even if dj.config['database.host'] is not a local host
+    :returns (pd.DataFrame): case, n, seconds, peak_alloc_mb, max_rss_mb, n_queries (and regression if baseline provided)
+    """
+    assert allow_remote or is_local_database(), f'Benchmarks insert synthetic data. Point dj.config["database.host"] at a local database, not "{dj.config["database.host"]}".'
+
+    from ..minnie_manual_proofreading import minnie65_manual_proofreading as m65mprf
+    m65mat = m65mprf.m65mprf.m65mat
+    workdir = Path(workdir if workdir is not None else tempfile.mkdtemp())
+    results = []
+
+    def record(case, n, fn, *args, rows=None, **kwargs):
+        """
+        :param rows (tuple): relation and number of rows fn is expected to leave in it
+        """
+        result, stats = measure(fn, *args, trace_memory=trace_memory, **kwargs)
+        if rows is not None:
+            relation, expected = rows
+            assert len(relation) == expected, f'{case} (n={n}) inserted {len(relation)} rows, expected {expected}.'
+        results.append({'case': case, 'n': n, **stats})
+        logger.info(f'{case} (n={n}): {stats["seconds"]:.2f} s, {stats["n_queries"]} queries.')
+        return result
+
+    m65mprf.Tag.contents # inserts current package version
+    last_ver = (m65mat.Materialization & 'ver >= 10000').fetch('ver', order_by='ver DESC', limit=1)
+    last_id = m65mat.Nucleus.fetch('nucleus_id', order_by='nucleus_id DESC', limit=1)
+    ver = int(last_ver[0]) + 1 if len(last_ver) else 10_000
+    first_id = int(last_id[0]) + 1 if len(last_id) else 1
+    for i, n in enumerate(sizes):
+        nuc_df = synthetic_nucleus_table(n, seed=ver, first_id=first_id)
+        in_run = f'nucleus_id BETWEEN {first_id} AND {first_id + n - 1}'
+        with foreign_key_checks_disabled():
+            m65mat.Materialization.insert(fill_required_attrs(m65mat.Materialization, pd.DataFrame({'ver': [ver]})), ignore_extra_fields=True, allow_direct_insert=True)
+            m65mat.Nucleus.insert(fill_required_attrs(m65mat.Nucleus, nuc_df[['id']].rename(columns={'id': 'nucleus_id'})), ignore_extra_fields=True, allow_direct_insert=True)
+
+        # spreadsheet import
+        path = synthetic_sheet(workdir.joinpath(f'sheet_v{ver}.csv'), nuc_df.id.to_numpy(), seed=ver)
+        imported = {}
+        for version in [1, 2]:
+            m65mprf.ImportMethod.ExcelPrfSheet.insert1({'version': version, 'path_to_csv': str(path)}, insert_to_master=True)
+            key = (m65mprf.ImportMethod.ExcelPrfSheet & {'version': version, 'path_to_csv': str(path)}).fetch1('KEY')
+            df = record(f'ImportMethod.ExcelPrfSheet.run (v{version})', n, m65mprf.ImportMethod.run, key)['df']
+            imported[version] = set(zip(df.nucleus_id.astype('int64'), df.prf_method))
+        assert imported[1] == imported[2], f'ImportMethod.ExcelPrfSheet.run versions 1 and 2 imported different nuclei or prf_methods (n={n}).'
+        record('PrfNucleusSet.ExcelPrfSheetMaker.populate', n, m65mprf.PrfNucleusSet.ExcelPrfSheetMaker.populate, key, rows=(m65mprf.PrfNucleusSet.ExcelPrfSheet & in_run, len(df)))
+
+        # CAVE import
+        table_name = 'proofreading_status_synthetic'
+        CAVE = m65mprf.ImportMethod.CAVE
+        saved = {attr: getattr(CAVE, attr) for attr in ['cache', 'fetcher', 'index_dir', '_root_indexes']}
+        CAVE.cache, CAVE.fetcher, CAVE.index_dir, CAVE._root_indexes = None, AsyncCAVEFetcher(), workdir.joinpath('indexes'), {}
+        CAVE.fetcher.add_client(FakeCAVEClient({'nucleus_detection_v0': nuc_df, table_name: synthetic_status_table(nuc_df, seed=ver)}, ver))
+        try:
+            CAVE.insert1({'table_name': table_name, 'ver': ver, 'tag': m65mprf.Tag.version}, insert_to_master=True)
+            key = (CAVE & {'table_name': table_name, 'ver': ver}).fetch1('KEY')
+            df = record('ImportMethod.CAVE.run', n, m65mprf.ImportMethod.run, key)['df']
+            record('PrfNucleusSet.CAVEMaker.populate', n, m65mprf.PrfNucleusSet.CAVEMaker.populate, key, rows=(m65mprf.PrfNucleusSet.CAVEProofreadingStatus & in_run, len(df)))
+        finally:
+            for attr, value in saved.items():
+                setattr(CAVE, attr, value)
+
+        # include set and exclusions
+        prf_nuc_set = unique_set(m65mprf.PrfNucleusSet.ExcelPrfSheetMaker * m65mprf.ImportMethod.ExcelPrfSheet & {'version': 2, 'path_to_csv': str(path)})
+        n_members = len(m65mprf.PrfNucleusSet.ExcelPrfSheet & {'prf_nuc_set': prf_nuc_set})
+        record('PrfNucleusIncludeSet.Member.fill', n, m65mprf.PrfNucleusIncludeSet.Member.fill, prf_nuc_set, rows=(m65mprf.PrfNucleusIncludeSet.Member & in_run, n_members))
+
+        m65mprf.ExclusionMethod.Manual.insert1({'exclusion_method_name': 'benchmark'}, insert_to_master=True, skip_duplicates=True)
+        exclusion_method_id = m65mprf.ExclusionMethod.Manual.method_id('benchmark')
+        # distinct nuclei for each path, as nuclei already excluded are skipped
+        k = min(n_exclusions, n // 2)
+        single, many = nuc_df.id.to_numpy()[:k], nuc_df.id.to_numpy()[k:2 * k]
+        record('PrfNucleusExclude.exclude', len(single), lambda: [m65mprf.PrfNucleusExclude.exclude({'nucleus_id': int(nid)}, exclusion_method_id, 'benchmark') for nid in single], rows=(m65mprf.PrfNucleusExclude & f'nucleus_id BETWEEN {first_id} AND {first_id + k - 1}', k))
+        record('PrfNucleusExclude.exclude_many', len(many), m65mprf.PrfNucleusExclude.exclude_many, many, exclusion_method_id, 'benchmark', rows=(m65mprf.PrfNucleusExclude & f'nucleus_id BETWEEN {first_id + k} AND {first_id + 2 * k - 1}', k))
+        record('PrfNucleusReInclude.reinclude', len(single), lambda: [m65mprf.PrfNucleusReInclude.reinclude({'nucleus_id': int(nid)}, 'benchmark') for nid in single], rows=(m65mprf.PrfNucleusReInclude & f'nucleus_id BETWEEN {first_id} AND {first_id + k - 1}', k))
+        record('PrfNucleusReInclude.reinclude_many', len(many), m65mprf.PrfNucleusReInclude.reinclude_many, many, 'benchmark', rows=(m65mprf.PrfNucleusReInclude & f'nucleus_id BETWEEN {first_id + k} AND {first_id + 2 * k - 1}', k))
+        ver, first_id = ver + 1, first_id + n
+
+    results = pd.DataFrame(results)
+    return results if baseline is None else compare_to_baseline(results, baseline, tolerance=tolerance)
+
+
+def unique_set(relation):
+    """
+    Returns the single prf_nuc_set hash in relation.
+    """
+    prf_nuc_set = np.unique(relation.fetch('prf_nuc_set'))
+    assert len(prf_nuc_set) == 1, f'Expected one prf_nuc_set, found {len(prf_nuc_set)}.'
+    return prf_nuc_set[0]
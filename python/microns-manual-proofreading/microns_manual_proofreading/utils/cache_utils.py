@@ -0,0 +1,152 @@
+"""
+Local disk cache for CAVE materialization tables.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import datajoint_plus as djp
+import pandas as pd
+
+logger = djp.getLogger(__name__)
+
+default_cache_dir = Path(os.environ.get('MICRONS_MANUAL_PROOFREADING_CACHE_DIR', Path.home().joinpath('.cache', 'microns-manual-proofreading')))
+default_max_bytes = int(os.environ.get('MICRONS_MANUAL_PROOFREADING_CACHE_MAX_BYTES', 20 * 2**30))
+
+
+class TableCache:
+    """
+    Content-addressed, size-bounded LRU cache of DataFrames stored as Parquet files.
+
+    Entries are keyed by (datastack, table_name, ver) and any query parameters, e.g. selected columns and filters. A materialization 
+        version of a datastack never changes, so entries never need invalidating and are only removed by least-recently-used eviction once the cache 
+        exceeds `max_bytes`.
+    Threads (e.g. `ImportMethod.CAVE.prefetch`) and processes may share a cache, so any file may be evicted by another 
+        reader or writer at any time. A file that disappears is treated as a cache miss.
+    """
+    suffix = '.parquet'
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        """
+        :param cache_dir (str, Path): directory to store cached tables
+            default (None) -> `default_cache_dir`, set with env variable MICRONS_MANUAL_PROOFREADING_CACHE_DIR
+        :param max_bytes (int): maximum total size of cached tables in bytes
+            default (None) -> `default_max_bytes`, set with env variable MICRONS_MANUAL_PROOFREADING_CACHE_MAX_BYTES
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else default_cache_dir
+        self.max_bytes = max_bytes if max_bytes is not None else default_max_bytes
+        self._evict_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(datastack, table_name, ver, **query):
+        """
+        Returns the content address of (datastack, table_name, ver) and query parameters.
+        """
+        return hashlib.sha256(json.dumps({'datastack': datastack, 'table_name': table_name, 'ver': int(ver), **query}, sort_keys=True, default=str).encode()).hexdigest()
+
+    def path(self, key):
+        return self.cache_dir.joinpath(key + self.suffix)
+
+    def contains(self, datastack, table_name, ver, **query):
+        return self.path(self.make_key(datastack, table_name, ver, **query)).exists()
+
+    def get(self, datastack, table_name, ver, **query):
+        """
+        Returns the cached table or None if not cached. 
+        """
+        path = self.path(self.make_key(datastack, table_name, ver, **query))
+        if not path.exists():
+            return
+        try:
+            df = pd.read_parquet(path)
+        except FileNotFoundError: # evicted since checked
+            return
+        except Exception:
+            logger.warning(f'Could not read cached table {table_name} of {datastack} (ver {ver}). Removing {path}.')
+            path.unlink(missing_ok=True)
+            return
+        try:
+            os.utime(path) # mark as recently used
+        except FileNotFoundError:
+            pass
+        return df
+
+    def put(self, datastack, table_name, ver, df, **query):
+        """
+        Caches df as (datastack, table_name, ver) then evicts least recently used tables if the cache exceeds `max_bytes`. 
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self.path(self.make_key(datastack, table_name, ver, **query))
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        except Exception:
+            logger.warning(f'Could not cache table {table_name} of {datastack} (ver {ver}).')
+            tmp_path.unlink(missing_ok=True)
+            return
+        self.evict()
+
+    def fetch_many(self, datastack, queries, ver, fetch):
+        """
+        Returns cached tables where available and fetches the rest with one call to fetch, caching the results.
+
+        :param datastack (str): datastack the tables are queried from, part of the cache key
+        :param queries (list): (table_name, query kwargs) of each table, query kwargs are part of the cache key
+        :param ver (int): materialization version
+        :param fetch (callable): called with the (table_name, query kwargs) of the missing tables and ver, returns their pd.DataFrames
+        :returns (list): pd.DataFrame of each query
+        """
+        dfs = [self.get(datastack, name, ver, **query_kws) for name, query_kws in queries]
+        missing = [i for i, df in enumerate(dfs) if df is None]
+        if missing:
+            logger.info(f'Cache miss for tables {[queries[i][0] for i in missing]} of {datastack} (ver {ver}).')
+            for i, df in zip(missing, fetch([queries[i] for i in missing], ver)):
+                self.put(datastack, queries[i][0], ver, df, **queries[i][1])
+                dfs[i] = df
+        return dfs
+
+    def _stats(self):
+        """
+        Returns (path, os.stat_result) of cached files ordered from least to most recently used, skipping files removed while listing.
+        """
+        if not self.cache_dir.exists():
+            return []
+        stats = []
+        for path in self.cache_dir.glob('*' + self.suffix):
+            try:
+                stats.append((path, path.stat()))
+            except FileNotFoundError:
+                continue
+        return sorted(stats, key=lambda s: s[1].st_mtime)
+
+    def entries(self):
+        """
+        Returns cached files ordered from least to most recently used.
+        """
+        return [path for path, _ in self._stats()]
+
+    @property
+    def size(self):
+        return sum(stat.st_size for _, stat in self._stats())
+
+    def evict(self):
+        """
+        Removes least recently used tables until the cache is within `max_bytes`.
+        """
+        with self._evict_lock:
+            stats = self._stats()
+            total = sum(stat.st_size for _, stat in stats)
+            for path, stat in stats:
+                if total <= self.max_bytes:
+                    break
+                total -= stat.st_size
+                path.unlink(missing_ok=True)
+                logger.info(f'Evicted {path.name} from cache.')
+
+    def clear(self):
+        for path in self.entries():
+            path.unlink(missing_ok=True)
@@ -0,0 +1,169 @@
+"""
+Concurrent fetching of CAVE materialization tables with asyncio.
+"""
+
+import asyncio
+import inspect
+import os
+import random
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import datajoint_plus as djp
+import microns_utils.ap_utils as apu
+import requests
+
+logger = djp.getLogger(__name__)
+
+_fetchers = weakref.WeakSet() # every AsyncCAVEFetcher, reset in forked child processes
+
+
+def default_datastack():
+    """
+    Returns the datastack `apu.CAVEClient.set_client` uses by default.
+    """
+    return inspect.signature(apu.CAVEClient.set_client).parameters['datastack'].default
+
+
+class AsyncCAVEFetcher:
+    """
+    Fetches CAVE materialization tables concurrently, reusing one client (and its HTTP session) per materialization version.
+
+    CAVEclient is synchronous, so queries run in a thread pool driven by an asyncio event loop. Transient errors 
+        (connection errors, timeouts and HTTP 429/5xx) are retried with exponential backoff and jitter.
+    Pass caveclient_kws, e.g. {'server_address': 'http://localhost:8000'}, to point the fetcher at a local stand-in 
+        for the materialization service.
+
+    The thread pool, lock and clients (with their HTTP sessions) of a parent process are unusable after a fork, so they are 
+        recreated in the child, where clients added with `add_client` must be added again.
+    """
+    transient_status_codes = {429, 500, 502, 503, 504}
+
+    def __init__(self, datastack=None, caveclient_kws=None, max_concurrency=4, retries=4, backoff=1., max_backoff=30.):
+        """
+        :param datastack (str): datastack passed to `apu.set_CAVEclient`
+            default (None) -> `default_datastack`
+        :param caveclient_kws (dict): kwargs passed to CAVEclient
+        :param max_concurrency (int): maximum number of concurrent queries
+        :param retries (int): maximum number of retries of a query after a transient error
+        :param backoff (float): delay before the first retry in seconds, doubled for each further retry
+        :param max_backoff (float): maximum delay between retries in seconds
+        """
+        self.datastack = datastack if datastack is not None else default_datastack()
+        self.caveclient_kws = caveclient_kws or {}
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_concurrency = max_concurrency
+        self._reset()
+        _fetchers.add(self)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._executor = None
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _check_pid(self):
+        if self._pid != os.getpid(): # forked without `reset_after_fork`, e.g. by os.fork on a platform without fork hooks
+            self._reset()
+
+    @property
+    def executor(self):
+        """
+        Thread pool running queries, created on first use in each process.
+        """
+        self._check_pid()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_concurrency, thread_name_prefix='cave')
+            return self._executor
+
+    def client(self, ver=None):
+        """
+        Returns the client of materialization version ver, creating it on first use.
+
+        :param ver (int): materialization version
+            default (None) -> latest version
+        """
+        self._check_pid()
+        with self._lock:
+            if ver is not None and int(ver) in self._clients:
+                return self._clients[int(ver)]
+            client = apu.set_CAVEclient(datastack=self.datastack, ver=ver, caveclient_kws=self.caveclient_kws)
+            if ver is not None:
+                assert client.materialize.version == int(ver), f'Materialization version mismatch. Requires {ver}. Client version: {client.materialize.version}'
+            return self._clients.setdefault(int(client.materialize.version), client)
+
+    def add_client(self, client):
+        """
+        Registers a client for its materialization version, e.g. a stand-in client.
+        """
+        self._check_pid()
+        with self._lock:
+            self._clients[int(client.materialize.version)] = client
+
+    def is_transient(self, error):
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+        response = getattr(error, 'response', None)
+        return response is not None and response.status_code in self.transient_status_codes
+
+    def _query(self, table_name, ver, query_kws):
+        return self.client(ver).materialize.query_table(table_name, **query_kws)
+
+    async def query_table(self, table_name, ver, **query_kws):
+        """
+        Queries a table, retrying transient errors.
+
+        :param table_name (str): name of CAVE table
+        :param ver (int): materialization version
+        :param query_kws: kwargs passed to `client.materialize.query_table`
+        :returns (pd.DataFrame): table
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            try:
+                return await loop.run_in_executor(self.executor, partial(self._query, table_name, ver, query_kws))
+            except Exception as e:
+                if attempt == self.retries or not self.is_transient(e):
+                    raise
+                delay = min(self.backoff * 2**attempt, self.max_backoff) * random.uniform(0.5, 1)
+                logger.warning(f'Transient error querying {table_name} (ver {ver}): {e!r}. Retrying in {delay:.1f} s.')
+                await asyncio.sleep(delay)
+
+    async def query_tables(self, queries, ver):
+        """
+        Queries tables concurrently.
+
+        :param queries (list): (table_name, query kwargs) of each table
+        :param ver (int): materialization version
+        :returns (list): pd.DataFrame of each query
+        """
+        return await asyncio.gather(*[self.query_table(name, ver, **query_kws) for name, query_kws in queries])
+
+    def fetch(self, queries, ver):
+        """
+        Synchronous wrapper of `query_tables`. Safe to call from threads and from within a running event loop (e.g. Jupyter).
+        """
+        coro = self.query_tables(queries, ver)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+        with ThreadPoolExecutor(1) as executor:
+            return executor.submit(asyncio.run, coro).result()
+
+
+def reset_after_fork():
+    """
+    Recreates the thread pool, lock and clients of every fetcher. Runs automatically in forked child processes.
+    """
+    for fetcher in list(_fetchers):
+        fetcher._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_after_fork)
@@ -0,0 +1,95 @@
+"""
+Local columnar export of proofreading sets to Arrow IPC files.
+"""
+
+import os
+from pathlib import Path
+
+import datajoint_plus as djp
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+logger = djp.getLogger(__name__)
+
+default_export_dir = Path(os.environ.get('MICRONS_MANUAL_PROOFREADING_EXPORT_DIR', Path.home().joinpath('.cache', 'microns-manual-proofreading', 'sets')))
+
+
+class SetStore:
+    """
+    Partitioned store of sets keyed by hash, written as uncompressed Arrow IPC files and read by memory-mapping.
+
+    Files are laid out as `export_dir/<table_name>/<hash_name>=<hash>/part-0.arrow`, so a whole table can also be scanned 
+        as a hive-partitioned dataset. A set hash identifies its contents, so exports never need invalidating.
+    """
+    filename = 'part-0.arrow'
+
+    def __init__(self, export_dir=None):
+        """
+        :param export_dir (str, Path): directory to export sets to
+            default (None) -> `default_export_dir`, set with env variable MICRONS_MANUAL_PROOFREADING_EXPORT_DIR
+        """
+        self.export_dir = Path(export_dir) if export_dir is not None else default_export_dir
+
+    def path(self, table_name, hash_name, hash):
+        return self.export_dir.joinpath(table_name, f'{hash_name}={hash}', self.filename)
+
+    def find(self, hash_name, hash):
+        """
+        Returns the path of an exported set in any table or None if not exported.
+        """
+        return next(iter(self.export_dir.glob(f'*/{hash_name}={hash}/{self.filename}')), None)
+
+    def contains(self, hash_name, hash):
+        return self.find(hash_name, hash) is not None
+
+    def write(self, table_name, hash_name, hash, df):
+        """
+        Exports df as set hash of table_name. Does nothing if already exported.
+
+        :param df (pd.DataFrame): rows of set
+        :returns (Path): path to exported set
+        """
+        path = self.path(table_name, hash_name, hash)
+        if path.exists():
+            return path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pandas(df.drop(columns=hash_name, errors='ignore'), preserve_index=False)
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        try:
+            with pa.OSFile(str(tmp_path), 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        logger.info(f'Exported {len(df)} rows of {hash_name} {hash} to {path}.')
+        return path
+
+    def read(self, hash_name, hash, columns=None):
+        """
+        Memory-maps an exported set. 
+        
+        Columns are not copied into memory until accessed, and numeric columns without nulls convert to NumPy without copying, 
+            e.g. `store.read(...).column('nucleus_id').chunk(0).to_numpy()`.
+
+        :param columns (list): columns to return
+            default (None) -> all columns
+        :returns (pa.Table): set, or None if not exported
+        """
+        path = self.find(hash_name, hash)
+        if path is None:
+            return
+        table = pa.ipc.open_file(pa.memory_map(str(path), 'r')).read_all()
+        return table if columns is None else table.select(columns)
+
+    def dataset(self, table_name):
+        """
+        Returns every exported set of table_name as a dataset partitioned by hash.
+        """
+        return ds.dataset(self.export_dir.joinpath(table_name), format='ipc', partitioning='hive')
+
+    def hashes(self, table_name, hash_name):
+        """
+        Returns hashes of the exported sets of table_name.
+        """
+        return [p.parent.name.split('=', 1)[1] for p in self.export_dir.joinpath(table_name).glob(f'{hash_name}=*/{self.filename}')]
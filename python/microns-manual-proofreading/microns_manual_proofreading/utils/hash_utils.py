@@ -0,0 +1,133 @@
+"""
+Vectorized set hashing compatible with datajoint_plus group hashes.
+"""
+
+import hashlib
+import inspect
+
+import datajoint as dj
+import numpy as np
+import pandas as pd
+import simplejson
+from datajoint_plus.utils import format_rows_to_df
+
+_json_safe = r'^[ !#-\[\]-~]*$' # printable ascii except '"' and '\', encoded by json as-is
+
+
+def encode_column(values):
+    """
+    Encodes a column as JSON values exactly as simplejson encodes the elements of `df.to_dict(orient='records')`.
+
+    Integer and boolean columns are encoded in bulk. Other columns are factorized and only their unique values are encoded, 
+        in bulk for plain ascii strings and with simplejson otherwise. Missing values are encoded with simplejson too, so None 
+        is encoded as null and float NaN as NaN, or raises ValueError where simplejson does not allow NaN.
+
+    :param values (pd.Series): column to encode
+    :returns (np.ndarray): encoded values
+    """
+    if pd.api.types.is_bool_dtype(values) and not pd.api.types.is_extension_array_dtype(values):
+        return np.where(values.to_numpy(), 'true', 'false').astype(object)
+    if pd.api.types.is_integer_dtype(values) and not pd.api.types.is_extension_array_dtype(values):
+        return values.to_numpy().astype(str).astype(object)
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=object)
+    if uniques.map(type).eq(str).all() and uniques.str.match(_json_safe).all():
+        encoded = ('"' + uniques + '"').to_numpy()
+    else:
+        encoded = np.array([simplejson.dumps(v) for v in uniques.tolist()], dtype=object)
+    encoded = np.append(encoded, None)[codes] # missing values have code -1
+    missing = codes == -1
+    if missing.any():
+        if pd.api.types.is_float_dtype(values):
+            encoded[missing] = simplejson.dumps(float('nan'))
+        else:
+            encoded[missing] = [simplejson.dumps(v) for v in values.to_numpy(dtype=object)[missing].tolist()]
+    return encoded
+
+
+def encode_rows(df):
+    """
+    Encodes each row of df as a JSON object, with keys in column order.
+
+    :param df (pd.DataFrame): rows to encode
+    :returns (np.ndarray): encoded rows
+    """
+    template = '{' + ', '.join(simplejson.dumps(col).replace('%', '%%') + ': %s' for col in df.columns) + '}'
+    return np.array([template % row for row in zip(*[encode_column(df[col]) for col in df.columns])], dtype=object)
+
+
+class SetHasher:
+    """
+    Hashes a set of rows in bulk, giving the same result as `datajoint_plus.generate_hash`. 
+
+    Rows are encoded once and kept sorted, so rows can be added or removed without re-encoding the rest of the set.
+    """
+    def __init__(self, rows, add_constant_columns=None):
+        """
+        :param rows (pd.DataFrame, list, tuple): rows to hash
+        :param add_constant_columns (dict): columns added to every row before hashing, see `datajoint_plus.generate_hash`
+        """
+        self.constant_columns = add_constant_columns if add_constant_columns is not None else {}
+        df = self._prepare(rows)
+        self.columns = df.columns.tolist()
+        self._df = self._sort(df.assign(_encoded=encode_rows(df)))
+
+    def _prepare(self, rows):
+        df = pd.DataFrame(rows)
+        for k, v in self.constant_columns.items():
+            df[k] = v
+        return df.sort_index(axis=1)
+
+    def _sort(self, df):
+        return df.sort_values(by=self.columns).reset_index(drop=True)
+
+    def __len__(self):
+        return len(self._df)
+
+    def add(self, rows):
+        """
+        Adds rows to the set.
+        """
+        df = self._prepare(rows)[self.columns]
+        self._df = self._sort(pd.concat([self._df, df.assign(_encoded=encode_rows(df))], ignore_index=True))
+        return self
+
+    def remove(self, rows):
+        """
+        Removes all rows of the set equal to any of rows.
+        """
+        df = self._prepare(rows)[self.columns].drop_duplicates()
+        merged = self._df.merge(df, on=self.columns, how='left', indicator=True)
+        self._df = self._df[(merged._merge == 'left_only').to_numpy()].reset_index(drop=True)
+        return self
+
+    def hexdigest(self):
+        dhash = hashlib.md5()
+        dhash.update(('[' + ', '.join(self._df._encoded.tolist()) + ']').encode())
+        return dhash.hexdigest()
+
+
+def hash_set(table, rows):
+    """
+    Computes the group hash of rows for a datajoint_plus table with `hash_group = True`, 
+        identical to `table.hash1(rows, unique=True)`.
+
+    :param table (djp table): table with hashing enabled
+    :param rows (pd.DataFrame, QueryExpression, list, tuple): rows containing the hashed attributes of table
+    :returns (str): hash
+    """
+    return set_hasher(table, rows).hexdigest()[:table.hash_len]
+
+
+def set_hasher(table, rows):
+    """
+    Returns a SetHasher over the hashed attributes of rows for a datajoint_plus table, for incremental updates. 
+    
+    The hash of the table is `set_hasher(table, rows).hexdigest()[:table.hash_len]`.
+    """
+    table_cls = table if inspect.isclass(table) else table.__class__
+    assert table_cls.hashed_attrs is not None, 'Table must have hashed_attrs defined. Check if hashing was enabled for this table.'
+    assert table_cls.hash_group, 'Table must have hash_group = True.'
+    hash_table_name = table_cls.hash_table_name or (issubclass(table_cls, dj.Part) and getattr(table_cls.master, 'hash_part_table_names', False))
+    rows = format_rows_to_df(rows)
+    return SetHasher(rows[[*table_cls.hashed_attrs]], add_constant_columns={'table_id': table_cls.table_id} if hash_table_name else None)
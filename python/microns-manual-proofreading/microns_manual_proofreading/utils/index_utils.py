@@ -0,0 +1,290 @@
+"""
+In-memory indexes over nucleus_ids.
+"""
+
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+default_index_dir = Path(os.environ.get('MICRONS_MANUAL_PROOFREADING_INDEX_DIR', Path.home().joinpath('.cache', 'microns-manual-proofreading', 'indexes')))
+
+
+class NucleusIndex:
+    """
+    Sorted index of nucleus_ids with per-nucleus attributes.
+
+    Supports O(1) membership checks for single nuclei and vectorized lookups for arrays of nucleus_ids. 
+    Nuclei can be deactivated and reactivated in place, e.g. when exclusions or reinclusions are recorded.
+    """
+    def __init__(self, nucleus_ids, **attrs):
+        """
+        :param nucleus_ids (array-like): unique nucleus_ids
+        :param attrs: attribute name: array-like of values aligned with nucleus_ids
+        """
+        nucleus_ids = np.asarray(nucleus_ids, dtype=np.uint64)
+        order = np.argsort(nucleus_ids, kind='stable')
+        self.nucleus_ids = nucleus_ids[order]
+        assert (np.diff(self.nucleus_ids) > 0).all(), 'nucleus_ids must be unique.'
+        self.attrs = {k: np.asarray(v)[order] for k, v in attrs.items()}
+        self.active = np.ones(len(self.nucleus_ids), dtype=bool)
+        self._positions = dict(zip(self.nucleus_ids.tolist(), range(len(self.nucleus_ids))))
+
+    def __len__(self):
+        return int(self.active.sum())
+
+    def __contains__(self, nucleus_id):
+        position = self._positions.get(int(nucleus_id))
+        return position is not None and bool(self.active[position])
+
+    def positions(self, nucleus_ids):
+        """
+        Returns the position of each nucleus_id in the index, or -1 if not indexed.
+        """
+        nucleus_ids = np.asarray(nucleus_ids, dtype=np.uint64)
+        positions = np.searchsorted(self.nucleus_ids, nucleus_ids)
+        clipped = np.minimum(positions, max(len(self.nucleus_ids) - 1, 0))
+        found = (positions < len(self.nucleus_ids)) & (self.nucleus_ids[clipped] == nucleus_ids) if len(self.nucleus_ids) else np.zeros(len(nucleus_ids), dtype=bool)
+        return np.where(found, positions, -1)
+
+    def contains(self, nucleus_ids):
+        """
+        Returns a boolean array, True where the nucleus_id is indexed and active.
+        """
+        positions = self.positions(nucleus_ids)
+        return (positions >= 0) & self.active[np.maximum(positions, 0)] if len(self.active) else np.zeros(len(positions), dtype=bool)
+
+    def lookup(self, nucleus_ids):
+        """
+        Returns the attributes of each nucleus_id.
+
+        :returns (pd.DataFrame): nucleus_id, included and attributes, with attributes set to None where not included
+        """
+        nucleus_ids = np.asarray(nucleus_ids, dtype=np.uint64)
+        positions = self.positions(nucleus_ids)
+        included = self.contains(nucleus_ids)
+        df = pd.DataFrame({'nucleus_id': nucleus_ids, 'included': included})
+        for k, v in self.attrs.items():
+            df[k] = pd.Series(v[np.maximum(positions, 0)], dtype=object).where(included, None) if len(v) else None
+        return df
+
+    def set_active(self, nucleus_ids, active):
+        """
+        Activates or deactivates indexed nuclei. Nuclei not in the index are ignored.
+
+        :param nucleus_ids (array-like): nucleus_ids to update
+        :param active (bool, array-like): new state of each nucleus
+        """
+        positions = self.positions(np.atleast_1d(nucleus_ids))
+        found = positions >= 0
+        self.active[positions[found]] = np.broadcast_to(active, positions.shape)[found]
+
+    def to_frame(self):
+        """
+        Returns active nuclei and their attributes.
+        """
+        return pd.DataFrame({'nucleus_id': self.nucleus_ids, **self.attrs})[self.active].reset_index(drop=True)
+
+
+class StatusIndex:
+    """
+    Sorted index of nucleus_ids with statuses stored as small-integer codes into a shared vocabulary.
+
+    Filters such as `index.select(status_axon='extended', status_dendrite='clean')` compare integer codes rather than strings.
+    """
+    missing = -1 # code of missing statuses
+
+    def __init__(self, nucleus_ids, **statuses):
+        """
+        :param nucleus_ids (array-like): unique nucleus_ids
+        :param statuses: status attribute name: array-like of statuses aligned with nucleus_ids, None where missing
+        """
+        nucleus_ids = np.asarray(nucleus_ids, dtype=np.uint64)
+        order = np.argsort(nucleus_ids, kind='stable')
+        self.nucleus_ids = nucleus_ids[order]
+        assert (np.diff(self.nucleus_ids) > 0).all(), 'nucleus_ids must be unique.'
+        values = {k: pd.Series(np.asarray(v, dtype=object)[order]) for k, v in statuses.items()}
+        self.vocabulary = np.array(sorted(set().union(*[set(v.dropna()) for v in values.values()])), dtype=str)
+        dtype = np.int8 if len(self.vocabulary) < 2**7 else np.int16 if len(self.vocabulary) < 2**15 else np.int32
+        self.codes = {k: self._encode(v.to_numpy(), dtype) for k, v in values.items()}
+
+    def _encode(self, values, dtype):
+        notnull = pd.notnull(values)
+        codes = np.full(len(values), self.missing, dtype=dtype)
+        codes[notnull] = np.searchsorted(self.vocabulary, values[notnull].astype(str))
+        return codes
+
+    @classmethod
+    def from_frame(cls, df, attrs):
+        """
+        :param df (pd.DataFrame): nucleus_id and attrs
+        :param attrs (list): status attributes
+        """
+        return cls(df.nucleus_id, **{attr: df[attr] for attr in attrs})
+
+    def __len__(self):
+        return len(self.nucleus_ids)
+
+    @property
+    def nbytes(self):
+        return self.nucleus_ids.nbytes + sum(c.nbytes for c in self.codes.values()) + self.vocabulary.nbytes
+
+    def code(self, status):
+        """
+        Returns the code of status, or None if not in the vocabulary.
+        """
+        if status is None:
+            return self.missing
+        position = np.searchsorted(self.vocabulary, status)
+        return int(position) if position < len(self.vocabulary) and self.vocabulary[position] == status else None
+
+    def mask(self, **conditions):
+        """
+        Returns a boolean array over nucleus_ids, True where every condition holds.
+
+        :param conditions: status attribute name: status or list of statuses (None matches missing statuses)
+        """
+        mask = np.ones(len(self.nucleus_ids), dtype=bool)
+        for attr, statuses in conditions.items():
+            statuses = statuses if isinstance(statuses, (list, tuple, set, np.ndarray)) else [statuses]
+            codes = [c for c in (self.code(s) for s in statuses) if c is not None]
+            mask &= np.isin(self.codes[attr], codes)
+        return mask
+
+    def select(self, **conditions):
+        """
+        Returns the nucleus_ids where every condition holds, see `mask`.
+        """
+        return self.nucleus_ids[self.mask(**conditions)]
+
+    def statuses(self, attr):
+        """
+        Returns the decoded statuses of attr, None where missing.
+        """
+        codes = self.codes[attr]
+        return np.where(codes == self.missing, None, self.vocabulary[np.maximum(codes, 0)] if len(self.vocabulary) else None)
+
+    def to_frame(self):
+        return pd.DataFrame({'nucleus_id': self.nucleus_ids, **{attr: self.statuses(attr) for attr in self.codes}})
+
+    def save(self, path):
+        """
+        Saves the index to an uncompressed .npz file.
+        """
+        np.savez(path, nucleus_ids=self.nucleus_ids, vocabulary=self.vocabulary, **{f'codes_{k}': v for k, v in self.codes.items()})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            index = cls.__new__(cls)
+            index.nucleus_ids = f['nucleus_ids']
+            index.vocabulary = f['vocabulary']
+            index.codes = {k[len('codes_'):]: f[k] for k in f.files if k.startswith('codes_')}
+        return index
+
+
+class RootIdIndex:
+    """
+    Bidirectional index between nucleus_ids and segment root_ids of one materialization version of a datastack.
+
+    Holds two pairs of aligned uint64 arrays, one sorted by root_id and one sorted by nucleus_id, so lookups in either 
+        direction are bulk binary searches. Saved as .npy files and memory-mapped when loaded.
+    """
+    arrays = ['root_ids', 'nucleus_ids_by_root', 'nucleus_ids', 'root_ids_by_nucleus']
+
+    def __init__(self, nucleus_ids, root_ids):
+        """
+        :param nucleus_ids (array-like): unique nucleus_ids
+        :param root_ids (array-like): root_id of each nucleus
+        """
+        nucleus_ids = np.asarray(nucleus_ids, dtype=np.uint64)
+        root_ids = np.asarray(root_ids, dtype=np.uint64)
+        by_root = np.lexsort([nucleus_ids, root_ids])
+        by_nucleus = np.argsort(nucleus_ids, kind='stable')
+        self.root_ids, self.nucleus_ids_by_root = root_ids[by_root], nucleus_ids[by_root]
+        self.nucleus_ids, self.root_ids_by_nucleus = nucleus_ids[by_nucleus], root_ids[by_nucleus]
+        assert (np.diff(self.nucleus_ids) > 0).all(), 'nucleus_ids must be unique.'
+
+    @classmethod
+    def from_arrays(cls, **arrays):
+        index = cls.__new__(cls)
+        for name in cls.arrays:
+            setattr(index, name, arrays[name])
+        return index
+
+    def __len__(self):
+        return len(self.nucleus_ids)
+
+    def join_root_ids(self, root_ids):
+        """
+        Resolves root_ids to nucleus_ids like an inner join: root_ids without a nucleus are dropped and root_ids with 
+            several nuclei are repeated.
+
+        :param root_ids (array-like): root_ids to resolve
+        :returns: positions in root_ids (np.ndarray), nucleus_id of each position (np.ndarray)
+        """
+        root_ids = np.asarray(root_ids, dtype=np.uint64)
+        start = np.searchsorted(self.root_ids, root_ids, side='left')
+        stop = np.searchsorted(self.root_ids, root_ids, side='right')
+        counts = stop - start
+        positions = np.repeat(np.arange(len(root_ids)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return positions, self.nucleus_ids_by_root[np.repeat(start, counts) + offsets]
+
+    def root_ids_of(self, nucleus_ids):
+        """
+        Resolves nucleus_ids to root_ids.
+
+        :returns (np.ndarray): root_id of each nucleus_id, 0 where the nucleus_id is not indexed
+        """
+        nucleus_ids = np.asarray(nucleus_ids, dtype=np.uint64)
+        positions = np.minimum(np.searchsorted(self.nucleus_ids, nucleus_ids), max(len(self.nucleus_ids) - 1, 0))
+        if not len(self.nucleus_ids):
+            return np.zeros(len(nucleus_ids), dtype=np.uint64)
+        return np.where(self.nucleus_ids[positions] == nucleus_ids, self.root_ids_by_nucleus[positions], np.uint64(0))
+
+    @staticmethod
+    def path(datastack, ver, index_dir=None):
+        """
+        Returns the path of the index of materialization version ver of datastack. Versions of different datastacks are unrelated.
+
+        :param datastack (str): name of CAVE datastack
+        :param ver (int): materialization version
+        :param index_dir (str, Path): directory of saved indexes
+            default (None) -> `default_index_dir`, set with env variable MICRONS_MANUAL_PROOFREADING_INDEX_DIR
+        """
+        return Path(index_dir if index_dir is not None else default_index_dir).joinpath(f'root_id_index_{datastack}_v{int(ver)}')
+
+    def save(self, path):
+        """
+        Saves the index to a directory of .npy files. The directory is written atomically and never overwritten.
+        """
+        path = Path(path)
+        if path.exists():
+            return path
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        tmp_path.mkdir(parents=True, exist_ok=True)
+        try:
+            for name in self.arrays:
+                np.save(tmp_path.joinpath(f'{name}.npy'), getattr(self, name))
+            os.replace(tmp_path, path)
+        except OSError:
+            if not path.exists():
+                raise
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return path
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads a saved index, or returns None if there is none at path.
+
+        :param mmap (bool): If True, arrays are memory-mapped read-only instead of read into memory
+        """
+        path = Path(path)
+        if not path.exists():
+            return
+        return cls.from_arrays(**{name: np.load(path.joinpath(f'{name}.npy'), mmap_mode='r' if mmap else None) for name in cls.arrays})
@@ -0,0 +1,77 @@
+"""
+Batched inserts for DataJoint tables.
+"""
+
+import os
+import time
+
+import datajoint_plus as djp
+from datajoint_plus.utils import format_rows_to_df
+from microns_manual_proofreading_api.utils.connection_utils import shared_conn
+
+from .hash_utils import hash_set
+
+logger = djp.getLogger(__name__)
+
+default_batch_size = int(os.environ.get('MICRONS_MANUAL_PROOFREADING_INSERT_BATCH_SIZE', 10000))
+
+
+def batch_insert(table, rows, batch_size=None, insert_to_master=False, insert_to_master_kws=None, constant_attrs=None, skip_hashing=False, overwrite_rows=False, atomic=True, **insert_kws):
+    """
+    Inserts rows to a DataJointPlus table in batches.
+
+    Constant attributes and hashes are added to all rows before batching, so group hashes are identical to a single insert. 
+    If insert_to_master, unique master keys are deduplicated client-side and inserted once before the batches, 
+        instead of sending every row to the master table.
+
+    :param table (djp table): table to insert to
+    :param rows (pd.DataFrame, QueryExpression, list, tuple): rows to insert
+    :param batch_size (int): number of rows per insert statement
+        default (None) -> `default_batch_size`, set with env variable MICRONS_MANUAL_PROOFREADING_INSERT_BATCH_SIZE
+    :param insert_to_master (bool): whether to insert unique master keys before inserting to part
+    :param insert_to_master_kws (dict): kwargs to pass to master table insert
+        default (None) -> {'ignore_extra_fields': True, 'skip_duplicates': True}
+    :param constant_attrs (dict): Python dictionary to add to every row in rows
+    :param skip_hashing (bool): If True, hashing will be skipped if hashing is enabled
+    :param overwrite_rows (bool): Whether to overwrite key/ values in rows
+    :param atomic (bool): If True, all batches are inserted in one transaction (joins the current transaction if one is open). 
+        If False, each batch is committed separately.
+    :param insert_kws: kwargs to pass to table insert, e.g. skip_duplicates, ignore_extra_fields
+    
+    :returns (dict): n_rows, seconds, rows_per_sec
+    """
+    batch_size = batch_size if batch_size is not None else default_batch_size
+    assert batch_size > 0, 'batch_size must be a positive integer.'
+    
+    rows = format_rows_to_df(rows)
+    if constant_attrs:
+        rows = table.add_constant_attrs_to_rows(rows, constant_attrs, overwrite_rows=overwrite_rows)
+    if getattr(table, 'enable_hashing', False) and not skip_hashing:
+        if table.hash_group and table.hash_name not in rows:
+            rows[table.hash_name] = hash_set(table, rows)
+        else:
+            rows = table.add_hash_to_rows(rows, overwrite_rows=overwrite_rows)
+    if insert_kws.get('skip_duplicates'):
+        if insert_kws.get('ignore_extra_fields'):
+            rows = rows[[c for c in rows.columns if c in table.heading.names]]
+        rows = rows.drop_duplicates()
+
+    def insert():
+        if insert_to_master:
+            master_keys = rows[[c for c in rows.columns if c in table.master.heading.names]].drop_duplicates()
+            table.master.insert(master_keys, **insert_to_master_kws if insert_to_master_kws is not None else {'ignore_extra_fields': True, 'skip_duplicates': True})
+        for start in range(0, len(rows), batch_size):
+            table.insert(rows.iloc[start:start + batch_size], skip_hashing=True, **insert_kws)
+
+    start = time.perf_counter()
+    connection = shared_conn()
+    if atomic and not connection.in_transaction:
+        with connection.transaction:
+            insert()
+    else:
+        insert()
+    seconds = time.perf_counter() - start
+
+    stats = {'n_rows': len(rows), 'seconds': seconds, 'rows_per_sec': len(rows) / seconds if seconds > 0 else float('inf')}
+    logger.info(f'Inserted {stats["n_rows"]} rows to {table.class_name} in {seconds:.2f} s ({stats["rows_per_sec"]:.0f} rows/s).')
+    return stats
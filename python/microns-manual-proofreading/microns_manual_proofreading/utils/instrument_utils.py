@@ -0,0 +1,217 @@
+"""
+Instrumentation of the stages of run, make and fill methods.
+
+Instrumentation is off unless a block is wrapped in `instrumentation`, in which case each stage records its 
+duration, number of rows and number of SQL statements to the table's Log and optionally to a JSON lines file 
+and a Prometheus textfile. Like `count_queries`, instrumentation is per thread: only stages run by the thread 
+that entered the block are recorded, and threads may instrument their own blocks concurrently.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+
+import datajoint_plus as djp
+from microns_manual_proofreading_api.utils.connection_utils import shared_conn
+
+logger = djp.getLogger(__name__)
+
+metric_prefix = 'microns_manual_proofreading_stage'
+
+_runs = threading.local() # active InstrumentationRun of each thread, see `active_run`
+_counters = threading.local() # counters of the active count_queries blocks of each thread
+_count_lock = threading.Lock()
+_write_lock = threading.Lock() # serializes appends to JSON lines files shared by runs of several threads
+
+
+def active_run():
+    """
+    Returns the InstrumentationRun of the calling thread, None when instrumentation is off.
+    """
+    return getattr(_runs, 'run', None)
+
+
+class InstrumentationRun:
+    """
+    Collects stage records while instrumentation is on.
+    """
+    def __init__(self, json_path=None, prometheus_path=None, count_sql=True, log=True):
+        self.json_path = Path(json_path) if json_path is not None else None
+        self.prometheus_path = Path(prometheus_path) if prometheus_path is not None else None
+        self.count_sql = count_sql
+        self.log = log
+        self.records = []
+        self.stack = [] # stages in progress, only used by the thread that entered the block
+
+    def add(self, table, record):
+        self.records.append(record)
+        if self.log:
+            msg = f'{record["path"]}: {record["seconds"]:.3f} s, {record["n_rows"]} rows, {record["n_queries"]} queries.'
+            try:
+                table.Log('info', msg)
+            except Exception:
+                logger.info(msg)
+        if self.json_path is not None:
+            with _write_lock, open(self.json_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+    def summary(self):
+        """
+        Returns totals of seconds, rows, SQL statements and calls per (table, stage).
+        """
+        totals = {}
+        for r in self.records:
+            t = totals.setdefault((r['table'], r['stage']), {'seconds': 0., 'rows': 0, 'sql_queries': 0, 'calls': 0})
+            t['seconds'] += r['seconds']
+            t['rows'] += r['n_rows'] or 0
+            t['sql_queries'] += r['n_queries'] or 0
+            t['calls'] += 1
+        return totals
+
+    def write_prometheus(self):
+        """
+        Writes stage totals in Prometheus text format, replacing the file atomically for the node_exporter textfile collector.
+
+        Totals are of this run only and the file is replaced by the next run, so they are gauges, not counters.
+        """
+        lines = []
+        for metric, desc in [('seconds', 'Wall time in stage during the last run'), ('rows', 'Rows processed in stage during the last run'), ('sql_queries', 'SQL statements sent in stage during the last run'), ('calls', 'Calls of stage during the last run')]:
+            name = f'{metric_prefix}_{metric}'
+            lines += [f'# HELP {name} {desc}.', f'# TYPE {name} gauge']
+            for (table, stage), t in self.summary().items():
+                lines.append(f'{name}{{table="{table}",stage="{stage}"}} {t[metric]}')
+        tmp = self.prometheus_path.with_name(f'.{self.prometheus_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp.write_text('\n'.join(lines) + '\n')
+        os.replace(tmp, self.prometheus_path)
+
+
+@contextmanager
+def instrumentation(json_path=None, prometheus_path=None, count_sql=True, log=True):
+    """
+    Turns instrumentation on for the duration of the block, for the calling thread.
+
+    :param json_path (str, Path): file to append one JSON record per stage to
+        default (None) -> no JSON output
+    :param prometheus_path (str, Path): Prometheus textfile to write stage totals to on exit
+        default (None) -> no Prometheus output
+    :param count_sql (bool): if True, counts SQL statements sent in each stage
+    :param log (bool): if True, writes each stage to the table's Log
+    :yields (InstrumentationRun): run with collected records
+    """
+    previous = active_run()
+    run = _runs.run = InstrumentationRun(json_path=json_path, prometheus_path=prometheus_path, count_sql=count_sql, log=log)
+    try:
+        yield run
+    finally:
+        _runs.run = previous
+        if run.prometheus_path is not None:
+            run.write_prometheus()
+
+
+class _NullStage:
+    """
+    Stage used when instrumentation is off. Yields a new dict on each use, so records written by concurrent or 
+        successive stages are discarded rather than shared.
+    """
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, *exc):
+        return False
+
+
+_null_stage = _NullStage()
+
+
+def stage(table, name):
+    """
+    Context manager timing a stage of a method of table. 
+    
+    Set "n_rows" on the yielded dict to record rows processed. When instrumentation is off in the calling thread, nothing is recorded.
+
+    :param table (class or instance): table the stage belongs to
+    :param name (str): name of stage
+    """
+    run = active_run()
+    if run is None:
+        return _null_stage
+    return _stage(run, table, name)
+
+
+@contextmanager
+def _stage(run, table, name):
+    table_name = table.__qualname__ if isinstance(table, type) else type(table).__qualname__
+    run.stack.append(f'{table_name}.{name}')
+    record = {'table': table_name, 'stage': name, 'path': ' > '.join(run.stack), 'n_rows': None, 'n_queries': None, 'ts': str(datetime.utcnow())}
+    start = time.perf_counter()
+    try:
+        if run.count_sql:
+            with count_queries() as counter:
+                yield record
+            record['n_queries'] = counter['n_queries']
+        else:
+            yield record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        run.stack.pop()
+        run.add(table, record)
+
+
+def instrumented(name):
+    """
+    Decorator recording a method as a stage. Apply beneath @classmethod.
+
+    :param name (str): name of stage
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(table, *args, **kwargs):
+            if active_run() is None:
+                return method(table, *args, **kwargs)
+            with stage(table, name):
+                return method(table, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _count_queries_of(connection):
+    """
+    Wraps the query method of connection, once, to add each statement to the active counters of the calling thread.
+    """
+    with _count_lock:
+        if getattr(connection.query, 'counts_queries', False):
+            return
+        query = connection.query
+
+        def counted_query(*args, **kwargs):
+            for counter in getattr(_counters, 'active', ()):
+                counter['n_queries'] += 1
+            return query(*args, **kwargs)
+
+        counted_query.counts_queries = True
+        connection.query = counted_query
+
+
+@contextmanager
+def count_queries(connection=None):
+    """
+    Counts SQL statements sent through a DataJoint connection by the calling thread.
+
+    Statements sent by other threads sharing the connection are not counted. Blocks may be nested, in which case 
+        statements count towards every enclosing block.
+
+    :yields (dict): {'n_queries': count}, updated as statements are sent
+    """
+    _count_queries_of(connection if connection is not None else shared_conn())
+    counter = {'n_queries': 0}
+    active = _counters.__dict__.setdefault('active', [])
+    active.append(counter)
+    try:
+        yield counter
+    finally:
+        del active[next(i for i, c in enumerate(active) if c is counter)] # not remove, counters with equal counts compare equal
@@ -0,0 +1,121 @@
+"""
+Process-local read-through cache of small Lookup tables.
+"""
+
+import json
+import threading
+import time
+
+import datajoint_plus as djp
+from microns_manual_proofreading_api.utils.connection_utils import shared_conn
+
+logger = djp.getLogger(__name__)
+
+
+class LookupCache:
+    """
+    Read-through cache of the rows of small Lookup tables, hashes of rows and package versions.
+
+    Each table is loaded with one query on first use. Once `ttl` seconds have passed since a table was last checked, 
+        its CHECKSUM TABLE is compared to the cached one and the table is reloaded if it changed. A lookup that matches 
+        no cached row reloads the table once, so rows inserted by other processes are found. Hashes and package 
+        versions do not change within a process, so they are computed once.
+    """
+    def __init__(self, ttl=60.):
+        """
+        :param ttl (float): seconds before a cached table is checked for changes
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._tables = {}
+        self._hashes = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'refreshes': self.refreshes, 'tables': len(self._tables), 'hashes': len(self._hashes)}
+
+    @staticmethod
+    def checksum(table):
+        return shared_conn().query(f'CHECKSUM TABLE {table.full_table_name}').fetchone()[1]
+
+    def _load(self, table):
+        entry = {'checksum': self.checksum(table), 'rows': table.fetch(as_dict=True), 'checked': time.monotonic()}
+        self._tables[table.full_table_name] = entry
+        return entry
+
+    def rows(self, table, refresh=False):
+        """
+        Returns the rows of table as a list of dicts.
+
+        :param table (dj table): Lookup table
+        :param refresh (bool): If True, reloads the table
+        """
+        with self._lock:
+            entry = self._tables.get(table.full_table_name)
+            if entry is None or refresh:
+                self.misses += 1
+                entry = self._load(table)
+            elif time.monotonic() - entry['checked'] > self.ttl:
+                if self.checksum(table) != entry['checksum']:
+                    self.refreshes += 1
+                    entry = self._load(table)
+                else:
+                    self.hits += 1
+                    entry['checked'] = time.monotonic()
+            else:
+                self.hits += 1
+            return entry['rows']
+
+    def lookup(self, table, **restr):
+        """
+        Returns the cached rows of table matching every attribute: value in restr. Reloads the table once if none match.
+        """
+        matches = [r for r in self.rows(table) if all(r.get(k) == v for k, v in restr.items())]
+        if not matches:
+            matches = [r for r in self.rows(table, refresh=True) if all(r.get(k) == v for k, v in restr.items())]
+        return matches
+
+    def lookup1(self, table, **restr):
+        """
+        Returns the single cached row of table matching restr, see `lookup`.
+        """
+        matches = self.lookup(table, **restr)
+        assert len(matches) == 1, f'Expected one row of {table.class_name} matching {restr}, found {len(matches)}.'
+        return matches[0]
+
+    def hash1(self, table, row):
+        """
+        Returns `table.hash1(row)`, computed once per process.
+        """
+        key = (table.full_table_name, json.dumps(row, sort_keys=True, default=str))
+        with self._lock:
+            if key in self._hashes:
+                self.hits += 1
+                return self._hashes[key]
+            self.misses += 1
+        return self._hashes.setdefault(key, table.hash1(row))
+
+    def version(self, table):
+        """
+        Returns the package version of a VersionLookup table, checked once per process.
+        """
+        with self._lock:
+            if table.package in self._versions:
+                self.hits += 1
+                return self._versions[table.package]
+            self.misses += 1
+        return self._versions.setdefault(table.package, table.version)
+
+    def invalidate(self, table=None):
+        """
+        Drops the cached rows of table, or of every table if None. Hashes and versions are kept.
+        """
+        with self._lock:
+            if table is None:
+                self._tables.clear()
+            else:
+                self._tables.pop(table.full_table_name, None)
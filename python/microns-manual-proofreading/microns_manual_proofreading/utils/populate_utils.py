@@ -0,0 +1,72 @@
+"""
+Concurrent populate of DataJoint tables with job reservation.
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import datajoint_plus as djp
+import pandas as pd
+from microns_manual_proofreading_api.utils.connection_utils import shared_conn
+
+from .cave_utils import reset_after_fork
+
+logger = djp.getLogger(__name__)
+
+
+def _init_worker():
+    # workers are forked, so state holding sockets, threads or locks of the parent is recreated
+    shared_conn.after_fork()
+    reset_after_fork()
+
+
+def populate_key(table, key, **populate_kws):
+    """
+    Populates one key with job reservation.
+
+    populate skips keys reserved by another worker (or marked as errors in the jobs table), so a key is only reported as 
+        populated if it is in the table afterwards.
+
+    :returns (dict): table, key, seconds, status ("success", "reserved" if skipped or "error") and error
+    """
+    start = time.perf_counter()
+    status, error = 'success', None
+    try:
+        table.populate(key, reserve_jobs=True, **populate_kws)
+        if not (table & key):
+            status = 'reserved'
+    except Exception as e:
+        status, error = 'error', repr(e)
+        logger.exception(f'Error populating {table.class_name} with key {key}.')
+    return {'table': table.class_name, 'key': key, 'seconds': time.perf_counter() - start, 'status': status, 'error': error}
+
+
+def populate_keys(table, keys, processes=1, **populate_kws):
+    """
+    Populates keys one at a time with job reservation, logging progress and per-key timing.
+
+    Reserved keys are skipped, so several workers or nodes can populate the same keys at once without duplicating work.
+
+    :param table (dj table class): table to populate
+    :param keys (list): keys to populate
+    :param processes (int): number of worker processes. If 1, keys are populated in this process. 
+    :param populate_kws: kwargs to pass to populate
+    :returns (pd.DataFrame): table, key, seconds, status and error of each key
+    """
+    results = []
+
+    def log_progress(result):
+        results.append(result)
+        logger.info(f'{table.class_name}: {len(results)}/{len(keys)} keys done. Key {result["key"]} {result["status"]} in {result["seconds"]:.2f} s.')
+
+    if processes > 1 and len(keys) > 1:
+        shared_conn.close() # child processes must open their own connections, this process reconnects on its next query
+        with ProcessPoolExecutor(min(processes, len(keys)), initializer=_init_worker) as executor:
+            futures = [executor.submit(populate_key, table, key, **populate_kws) for key in keys]
+            for future in as_completed(futures):
+                log_progress(future.result())
+    else:
+        for key in keys:
+            log_progress(populate_key(table, key, **populate_kws))
+
+    return pd.DataFrame(results, columns=['table', 'key', 'seconds', 'status', 'error'])
@@ -0,0 +1,138 @@
+"""
+Pre-aggregated proofreading throughput.
+"""
+
+import datajoint_plus as djp
+import numpy as np
+import pandas as pd
+
+logger = djp.getLogger(__name__)
+
+compartments = {'dendrite': 'den', 'axon': 'ax'} # compartment: suffix of ExcelPrfSheet columns
+group_attrs = ['compartment', 'proofreader', 'area', 'prf_method', 'week']
+bin_width_min = 1 # width of time_min histogram bins (min)
+n_bins = 600 # number of time_min histogram bins, the last bin counts every time_min above (n_bins - 1) * bin_width_min
+unknown = 'unknown' # proofreader or week of rows without one
+date_format_kws = {'format': 'mixed'} if int(pd.__version__.split('.')[0]) >= 2 else {} # pandas 2 infers one format from the first date unless told each may differ
+
+
+def parse_week(dates):
+    """
+    Returns the Monday of the week of each date as 'YYYY-MM-DD', `unknown` where the date is missing or unparseable.
+
+    Each date is parsed on its own, so dates in different formats, e.g. '1/3/2022' and '2022-01-05', are all parsed. 
+        The number of dates that could not be parsed is logged.
+    """
+    values = pd.Series(dates, dtype=object)
+    dates = pd.to_datetime(values, errors='coerce', **date_format_kws)
+    n_unparsed = (dates.isnull() & values.notnull() & (values.astype(str).str.strip() != '')).sum()
+    if n_unparsed:
+        logger.warning(f'Could not parse {n_unparsed} of {len(values)} dates, their week is "{unknown}".')
+    weeks = (dates - pd.to_timedelta(dates.dt.weekday, unit='D')).dt.strftime('%Y-%m-%d')
+    return weeks.where(dates.notnull(), unknown).to_numpy(dtype=object)
+
+
+def normalize(values, upper=False):
+    """
+    Returns values stripped and casefolded (or upper-cased), `unknown` where missing or blank. 
+
+    Rollup attributes are compared by MySQL case- and trailing space-insensitively, so values pandas groups separately, 
+        e.g. 'Alice' and 'alice ', would otherwise collide on the primary key of PrfThroughput.Rollup.
+    """
+    values = pd.Series(values, dtype=object)
+    normalized = values.astype(str).str.strip()
+    normalized = normalized.str.upper() if upper else normalized.str.casefold()
+    return normalized.where(values.notnull() & (normalized != ''), unknown).to_numpy(dtype=object)
+
+
+def time_bins(times):
+    """
+    Returns the `bin_width_min` histogram bin of each time, -1 where missing or negative.
+    """
+    times = np.asarray(times, dtype=float)
+    valid = np.isfinite(times) & (times >= 0)
+    return np.where(valid, np.minimum(np.floor_divide(np.where(valid, times, 0), bin_width_min), n_bins - 1), -1).astype(np.int64)
+
+
+def throughput(df):
+    """
+    Aggregates ExcelPrfSheet rows per compartment, proofreader, area, prf_method and week finished.
+
+    Only rows with a proofreader or marked finished count towards a compartment. Proofreader names are stripped and 
+        casefolded and areas stripped and upper-cased, see `normalize`.
+
+    :param df (pd.DataFrame): ExcelPrfSheet rows
+    :returns (pd.DataFrame): `group_attrs`, n_nuclei, n_finished, n_timed, time_min_total and time_hist of each group
+    """
+    frames = []
+    for compartment, suffix in compartments.items():
+        proofreader = df[f'proofreader_{suffix}'].where(df[f'proofreader_{suffix}'].notnull() & (df[f'proofreader_{suffix}'].astype(str).str.strip() != ''))
+        finished = pd.to_numeric(df[f'finished_{suffix}'], errors='coerce').fillna(0).astype(bool)
+        worked = proofreader.notnull() | finished
+        frames.append(pd.DataFrame({
+            'compartment': compartment,
+            'proofreader': normalize(proofreader[worked]),
+            'area': normalize(df.loc[worked, 'area'], upper=True),
+            'prf_method': df.loc[worked, 'prf_method'],
+            'week': parse_week(df.loc[worked, f'date_finished_{suffix}']),
+            'finished': finished[worked],
+            'time_min': pd.to_numeric(df.loc[worked, f'time_min_{suffix}'], errors='coerce'),
+        }))
+    rows = pd.concat(frames, ignore_index=True)
+    if rows.empty:
+        return pd.DataFrame(columns=[*group_attrs, 'n_nuclei', 'n_finished', 'n_timed', 'time_min_total', 'time_hist'])
+    grouped = rows.groupby(group_attrs, sort=True)
+    df = grouped.agg(
+        n_nuclei=('finished', 'size'),
+        n_finished=('finished', 'sum'),
+        n_timed=('time_min', 'count'),
+        time_min_total=('time_min', 'sum'),
+    ).reset_index()
+    groups, bins = grouped.ngroup().to_numpy(), time_bins(rows.time_min)
+    timed = bins >= 0
+    hists = np.bincount(groups[timed] * n_bins + bins[timed], minlength=len(df) * n_bins).reshape(len(df), n_bins).astype(np.uint32)
+    df['time_hist'] = list(hists)
+    return df
+
+
+def percentile(hist, q):
+    """
+    Returns the q-th percentile of the times counted in hist, interpolated within its bin, or NaN if hist is empty.
+    """
+    total = hist.sum()
+    if not total:
+        return np.nan
+    cumsum = np.cumsum(hist)
+    target = q / 100 * total
+    b = min(int(np.searchsorted(cumsum, target, side='left')), len(hist) - 1)
+    below = cumsum[b] - hist[b]
+    return (b + (target - below) / hist[b] if hist[b] else b) * bin_width_min
+
+
+def combine(rollups, by=('proofreader',), percentiles=(50, 90)):
+    """
+    Combines throughput rows into totals and time_min percentiles per group.
+
+    :param rollups (pd.DataFrame): rows returned by `throughput`
+    :param by (list): attributes of `group_attrs` to group by
+    :param percentiles (list): time_min percentiles to compute
+    :returns (pd.DataFrame): by, n_nuclei, n_finished, n_timed, time_min_total, time_min_mean and time_min_p<q> of each group
+    """
+    by = list(by)
+    columns = [*by, 'n_nuclei', 'n_finished', 'n_timed', 'time_min_total', 'time_min_mean', *[f'time_min_p{q}' for q in percentiles]]
+    if rollups.empty:
+        return pd.DataFrame(columns=columns)
+    rows = []
+    for values, group in rollups.groupby(by, sort=True) if by else [((), rollups)]:
+        hist = np.sum(np.stack(group.time_hist.to_numpy()), axis=0)
+        row = dict(zip(by, values if isinstance(values, tuple) else (values,)))
+        row.update({
+            'n_nuclei': int(group.n_nuclei.sum()),
+            'n_finished': int(group.n_finished.sum()),
+            'n_timed': int(group.n_timed.sum()),
+            'time_min_total': float(group.time_min_total.sum()),
+        })
+        row['time_min_mean'] = row['time_min_total'] / row['n_timed'] if row['n_timed'] else np.nan
+        row.update({f'time_min_p{q}': percentile(hist, q) for q in percentiles})
+        rows.append(row)
+    return pd.DataFrame(rows, columns=columns)
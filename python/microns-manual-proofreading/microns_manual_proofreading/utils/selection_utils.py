@@ -0,0 +1,144 @@
+"""
+Vectorized evaluation of UnitSeedProtocol selections over nucleus centroids and unit metrics.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+
+class ProtocolSelector:
+    """
+    Evaluates UnitSeedProtocol rows over a population of nuclei.
+
+    Cylinder queries use a uniform grid over the cylinder plane and box queries use an index sorted on x, so only 
+        candidate nuclei are tested exactly. Functional thresholds are vectorized comparisons over unit metrics.
+    A nucleus may appear on several rows, e.g. one per matched functional unit, and is selected if any of its rows passes.
+    """
+    cylinder_axes = ('x', 'y') # centroid axes of the cylinder plane, the cylinder extends along the remaining axis
+    metric_thresholds = {
+        'oracle_min': 'oracle',
+        'test_corr_min': 'test_corr',
+        'mean_corr_min': 'mean_corr',
+        'real_von_pred_adv_min': 'real_von_pred_adv',
+        'model_von_pred_adv_min': 'model_von_pred_adv',
+    }
+    box_bounds = {'x': ('xmin', 'xmax'), 'y': ('ymin', 'ymax'), 'z': ('zmin', 'zmax')}
+
+    def __init__(self, nuclei, n_cells=64):
+        """
+        :param nuclei (pd.DataFrame): nucleus_id, centroid x, y, z and optionally area and the metrics in `metric_thresholds`
+        :param n_cells (int): number of grid cells along each axis of the cylinder plane
+        """
+        missing = [c for c in ['nucleus_id', 'x', 'y', 'z'] if c not in nuclei]
+        if missing:
+            raise ValueError(f'nuclei is missing columns: {missing}.')
+        self.nuclei = nuclei.reset_index(drop=True)
+        self.nucleus_ids = self.nuclei.nucleus_id.to_numpy(dtype=np.uint64)
+        self.coords = {axis: self.nuclei[axis].to_numpy(dtype=float) for axis in 'xyz'}
+        self.x_order = np.argsort(self.coords['x'], kind='stable')
+        self.x_sorted = self.coords['x'][self.x_order]
+
+        u, v = (self.coords[a] for a in self.cylinder_axes)
+        self.grid_origin = np.array([np.nanmin(u), np.nanmin(v)]) if len(u) else np.zeros(2)
+        extent = np.array([np.nanmax(u), np.nanmax(v)]) - self.grid_origin if len(u) else np.ones(2)
+        self.cell_size = np.maximum(extent / n_cells, np.finfo(float).eps)
+        self.n_cells = n_cells
+        cells = self._cells(u, v)
+        self.cell_order = np.argsort(cells, kind='stable')
+        self.cell_starts = np.searchsorted(cells[self.cell_order], np.arange(n_cells * n_cells + 1))
+
+    def _cells(self, u, v):
+        iu = np.clip(((u - self.grid_origin[0]) // self.cell_size[0]).astype(int), 0, self.n_cells - 1)
+        iv = np.clip(((v - self.grid_origin[1]) // self.cell_size[1]).astype(int), 0, self.n_cells - 1)
+        return iu * self.n_cells + iv
+
+    def cylinder(self, cx, cy, r):
+        """
+        Returns the positions of nuclei within radius r of (cx, cy) in the cylinder plane.
+        """
+        lo = np.clip(((np.array([cx, cy]) - r - self.grid_origin) // self.cell_size).astype(int), 0, self.n_cells - 1)
+        hi = np.clip(((np.array([cx, cy]) + r - self.grid_origin) // self.cell_size).astype(int), 0, self.n_cells - 1)
+        rows = np.arange(lo[0], hi[0] + 1) * self.n_cells
+        # cells of each grid row in range are contiguous, so each row is one slice of cell_order
+        candidates = np.concatenate([self.cell_order[self.cell_starts[row + lo[1]]:self.cell_starts[row + hi[1] + 1]] for row in rows]) if len(rows) else np.array([], dtype=int)
+        u, v = (self.coords[a][candidates] for a in self.cylinder_axes)
+        return candidates[(u - cx)**2 + (v - cy)**2 <= r**2]
+
+    def box(self, bounds):
+        """
+        Returns a boolean mask of nuclei within bounds.
+
+        :param bounds (dict): axis: (min, max), with None for an open bound
+        """
+        mask = np.zeros(len(self.nucleus_ids), dtype=bool)
+        xmin, xmax = bounds.get('x', (None, None))
+        start = 0 if xmin is None else np.searchsorted(self.x_sorted, xmin, side='left')
+        stop = len(self.x_sorted) if xmax is None else np.searchsorted(self.x_sorted, xmax, side='right')
+        mask[self.x_order[start:stop]] = True
+        for axis in 'yz':
+            amin, amax = bounds.get(axis, (None, None))
+            if amin is not None:
+                mask &= self.coords[axis] >= amin
+            if amax is not None:
+                mask &= self.coords[axis] <= amax
+        return mask
+
+    @staticmethod
+    def _value(protocol, attr):
+        value = protocol.get(attr)
+        return None if value is None or (isinstance(value, float) and np.isnan(value)) else value
+
+    def required_columns(self, protocol):
+        """
+        Returns the columns of `nuclei` needed to evaluate the non-null criteria of protocol, beyond nucleus_id and centroids.
+        """
+        columns = [metric for threshold, metric in self.metric_thresholds.items() if self._value(protocol, threshold) is not None]
+        if self._value(protocol, 'brain_areas') is not None:
+            columns.append('area')
+        return columns
+
+    def mask(self, protocol):
+        """
+        Returns a boolean mask of the rows of `nuclei` passing every non-null criterion of protocol.
+
+        :param protocol (dict): UnitSeedProtocol row
+        :raises ValueError: if `nuclei` is missing a column needed by protocol, see `required_columns`
+        """
+        missing = [c for c in self.required_columns(protocol) if c not in self.nuclei]
+        if missing:
+            raise ValueError(f'Protocol {protocol.get("protocol_id")} requires columns missing from nuclei: {missing}.')
+        mask = np.ones(len(self.nucleus_ids), dtype=bool)
+        cylinder = [self._value(protocol, f'cylinder_{k}') for k in ['x', 'y', 'r']]
+        if all(c is not None for c in cylinder):
+            in_cylinder = np.zeros(len(mask), dtype=bool)
+            in_cylinder[self.cylinder(*cylinder)] = True
+            mask &= in_cylinder
+        bounds = {axis: tuple(self._value(protocol, b) for b in attrs) for axis, attrs in self.box_bounds.items()}
+        if any(b is not None for bs in bounds.values() for b in bs):
+            mask &= self.box(bounds)
+        for threshold, metric in self.metric_thresholds.items():
+            value = self._value(protocol, threshold)
+            if value is not None:
+                mask &= self.nuclei[metric].to_numpy(dtype=float) >= value
+        areas = self._value(protocol, 'brain_areas')
+        if areas is not None:
+            mask &= self.nuclei.area.isin(re.findall(r'\w+', areas)).to_numpy()
+        return mask
+
+    def select(self, protocol):
+        """
+        Returns the unique nucleus_ids selected by protocol.
+        """
+        return np.unique(self.nucleus_ids[self.mask(protocol)])
+
+    def select_all(self, protocols):
+        """
+        Evaluates every protocol.
+
+        :param protocols (list): UnitSeedProtocol rows
+        :returns (pd.DataFrame): protocol_id, nucleus_id of every selected nucleus
+        """
+        selections = [pd.DataFrame({'protocol_id': p['protocol_id'], 'nucleus_id': self.select(p)}) for p in protocols]
+        return pd.concat(selections, ignore_index=True) if selections else pd.DataFrame(columns=['protocol_id', 'nucleus_id'])
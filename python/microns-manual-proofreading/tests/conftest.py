@@ -0,0 +1,57 @@
+"""
+Shared fixtures. Tests needing the database schemas are skipped when they cannot be imported, e.g. without a database, 
+    or when dj.config does not point at a local database, as they declare tables and insert rows.
+"""
+
+import os
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+os.environ.setdefault('MICRONS_MANUAL_PROOFREADING_LAZY', '1') # no package version checks against Github
+
+fixture_dir = Path(__file__).parent.joinpath('fixtures')
+
+
+def read_cave_fixture(table_name):
+    """
+    Reads a CAVE table from fixtures, with `valid` as the boolean the materialization service returns.
+    """
+    df = pd.read_csv(fixture_dir.joinpath(f'{table_name}.csv'))
+    df['valid'] = df['valid'] == 't'
+    return df
+
+
+def import_schema():
+    """
+    Returns the minnie65_manual_proofreading methods module, skipping the test if dj.config does not point at a local 
+        database (see `bench_utils.is_local_database`) or its schemas cannot be loaded.
+    """
+    dj = pytest.importorskip('datajoint')
+    bench_utils = pytest.importorskip('microns_manual_proofreading.utils.bench_utils')
+    if not bench_utils.is_local_database():
+        pytest.skip(f'dj.config["database.host"] is not a local database: {dj.config["database.host"]!r}')
+    try:
+        from microns_manual_proofreading.minnie_manual_proofreading import minnie65_manual_proofreading as m65mprf
+    except Exception as e:
+        pytest.skip(f'Schemas unavailable: {e!r}')
+    return m65mprf
+
+
+@pytest.fixture
+def cave_tables():
+    return {name: read_cave_fixture(name) for name in ['nucleus_detection_v0', 'proofreading_status']}
+
+
+@pytest.fixture
+def delete_after():
+    """
+    Yields a function registering relations to delete, with what depends on them, after the test.
+    """
+    relations = []
+    yield relations.append
+    import datajoint as dj
+    with dj.config(safemode=False):
+        for relation in reversed(relations):
+            relation.delete(verbose=False)
@@ -0,0 +1,90 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+cache_utils = pytest.importorskip('microns_manual_proofreading.utils.cache_utils')
+
+
+def table(i, n=1000):
+    return pd.DataFrame({'id': np.arange(n) + i, 'pt_root_id': np.arange(n) * i})
+
+
+def test_table_cache_evicts_least_recently_used(tmp_path):
+    cache = cache_utils.TableCache(tmp_path)
+    for i, name in enumerate(['a', 'b']):
+        cache.put('ds', name, 1, table(i))
+        path = cache.path(cache.make_key('ds', name, 1))
+        os.utime(path, (1000 + i, 1000 + i)) # b more recent than a
+    cache.max_bytes = int(cache.size * 1.5) # room for two tables, not three
+
+    pd.testing.assert_frame_equal(cache.get('ds', 'a', 1), table(0)) # a becomes the most recently used
+    cache.put('ds', 'c', 1, table(2))
+    assert cache.contains('ds', 'a', 1) and cache.contains('ds', 'c', 1)
+    assert not cache.contains('ds', 'b', 1)
+    assert cache.get('ds', 'b', 1) is None
+    assert cache.size <= cache.max_bytes
+
+
+def test_table_cache_key_includes_query(tmp_path):
+    cache = cache_utils.TableCache(tmp_path)
+    cache.put('ds', 'a', 1, table(0), select_columns=['id'])
+    assert cache.contains('ds', 'a', 1, select_columns=['id'])
+    assert not cache.contains('ds', 'a', 1)
+    assert not cache.contains('ds', 'a', 2, select_columns=['id'])
+
+
+def test_table_cache_key_includes_datastack(tmp_path):
+    cache = cache_utils.TableCache(tmp_path)
+    cache.put('ds', 'a', 1, table(0))
+    assert cache.get('other_ds', 'a', 1) is None # same table and version of another datastack
+    cache.put('other_ds', 'a', 1, table(1))
+    pd.testing.assert_frame_equal(cache.get('ds', 'a', 1), table(0))
+    pd.testing.assert_frame_equal(cache.get('other_ds', 'a', 1), table(1))
+
+
+def test_table_cache_concurrent_get_put_evict(tmp_path):
+    cache = cache_utils.TableCache(tmp_path)
+    cache.put('ds', 'a', 1, table(0))
+    cache.max_bytes = int(cache.size * 2.5) # every few puts evict tables other threads are reading
+    tables = {i: table(i) for i in range(8)}
+
+    def work(seed):
+        rng = np.random.default_rng(seed)
+        for _ in range(100):
+            i = int(rng.integers(len(tables)))
+            action = rng.integers(3)
+            if action == 0:
+                cache.put('ds', f't{i}', 1, tables[i])
+            elif action == 1:
+                df = cache.get('ds', f't{i}', 1)
+                if df is not None:
+                    pd.testing.assert_frame_equal(df, tables[i])
+            else:
+                cache.evict()
+                cache.entries()
+
+    with ThreadPoolExecutor(8) as executor:
+        for future in [executor.submit(work, seed) for seed in range(8)]:
+            future.result() # raises any error of the thread, e.g. FileNotFoundError
+    assert cache.size <= cache.max_bytes
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_table_cache_fetch_many_fetches_only_missing(tmp_path):
+    cache = cache_utils.TableCache(tmp_path)
+    cache.put('ds', 'a', 1, table(0))
+    calls = []
+
+    def fetch(queries, ver):
+        calls.append([name for name, _ in queries])
+        return [table(ord(name)) for name, _ in queries]
+
+    dfs = cache.fetch_many('ds', [('a', {}), ('b', {})], 1, fetch)
+    assert calls == [['b']]
+    pd.testing.assert_frame_equal(dfs[0], table(0))
+    pd.testing.assert_frame_equal(dfs[1], table(ord('b')))
+    cache.fetch_many('ds', [('a', {}), ('b', {})], 1, fetch)
+    assert calls == [['b']]
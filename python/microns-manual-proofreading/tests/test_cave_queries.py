@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip('datajoint_plus')
+
+from conftest import import_schema
+from microns_manual_proofreading.utils.bench_utils import FakeCAVEClient, compare_pruning
+
+
+def test_status_query_filters_valid(cave_tables):
+    m65mprf = import_schema()
+    client = FakeCAVEClient(cave_tables, 1)
+    [(table_name, query_kws)] = m65mprf.ImportMethod.CAVE.table_queries('proofreading_status')
+    df = client.materialize.query_table(table_name, **query_kws)
+    expected = cave_tables['proofreading_status'].query('valid')[query_kws['select_columns']].reset_index(drop=True)
+    assert 0 < len(df) < len(cave_tables['proofreading_status'])
+    assert df.equals(expected)
+
+
+def test_pruned_queries_transfer_less(cave_tables):
+    m65mprf = import_schema()
+    queries = m65mprf.ImportMethod.CAVE.table_queries('proofreading_status') + [m65mprf.ImportMethod.CAVE.nucleus_query]
+    results = compare_pruning(FakeCAVEClient(cave_tables, 1), queries).set_index(['table_name', 'case'])
+    for table_name, _ in queries:
+        pruned, unpruned = results.loc[(table_name, 'pruned')], results.loc[(table_name, 'unpruned')]
+        assert pruned.n_rows == unpruned.n_rows
+        assert pruned.transfer_mb < unpruned.transfer_mb
+        assert pruned.peak_alloc_mb < unpruned.peak_alloc_mb
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import multiprocessing
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+import requests
+
+cave_utils = pytest.importorskip('microns_manual_proofreading.utils.cave_utils')
+bench_utils = pytest.importorskip('microns_manual_proofreading.utils.bench_utils')
+
+queries = [
+    ('proofreading_status', dict(select_columns=['pt_root_id', 'status_dendrite', 'status_axon'], filter_equal_dict={'valid': True})),
+    ('nucleus_detection_v0', dict(select_columns=['id', 'pt_root_id'])),
+]
+
+
+class FlakyMaterializationClient(bench_utils.FakeMaterializationClient):
+    """
+    Fails the first n_failures queries with error.
+    """
+    def __init__(self, tables, version, n_failures, error):
+        super().__init__(tables, version)
+        self.n_failures = n_failures
+        self.error = error
+
+    def query_table(self, table, **kwargs):
+        if self.n_failures:
+            self.n_failures -= 1
+            raise self.error
+        return super().query_table(table, **kwargs)
+
+
+def flaky_client(tables, n_failures, error):
+    client = bench_utils.FakeCAVEClient(tables, 1)
+    client.materialize = FlakyMaterializationClient(tables, 1, n_failures, error)
+    return client
+
+
+class LocalMaterializationServer:
+    """
+    Local HTTP stand-in for the info and materialization services, serving in-memory tables to a real CAVEclient.
+    """
+    def __init__(self, tables, version):
+        self.tables = tables
+        self.version = int(version)
+        self.datastacks = set() # datastacks requested
+        self.n_queries = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def handle_request(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                status, content_type, content = server.respond(self.path.split('?')[0], body)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.address = f'http://127.0.0.1:{self.httpd.server_port}'
+        self.caveclient_kws = {'server_address': self.address, 'auth_token': 'test', 'write_server_cache': False}
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def respond(self, path, body):
+        as_json = lambda obj: (200, 'application/json', json.dumps(obj).encode())
+        match = re.search(r'/datastack/(?:full/)?(\w+)', path)
+        if match:
+            self.datastacks.add(match.group(1))
+        if path == '/info/version':
+            return as_json('4.0.0')
+        if re.fullmatch(r'/info/api/v2/datastack/full/\w+', path):
+            return as_json({'aligned_volume': {'name': 'test', 'image_source': f'precomputed://{self.address}', 'id': 1, 'description': ''}, 'segmentation_source': f'graphene://{self.address}/segmentation/table/test', 'synapse_table': None, 'soma_table': 'nucleus_detection_v0', 'local_server': self.address, 'viewer_site': self.address, 'analysis_database': None, 'viewer_resolution_x': 4, 'viewer_resolution_y': 4, 'viewer_resolution_z': 40})
+        if path == '/materialize/api/versions':
+            return as_json([2, 3])
+        if path == '/materialize/version':
+            return as_json('5.13.0')
+        if re.fullmatch(r'/materialize/api/v\d/datastack/\w+/versions', path):
+            return as_json([self.version])
+        if re.fullmatch(r'/materialize/api/v\d/datastack/\w+/version/\d+/tables', path):
+            return as_json(list(self.tables))
+        match = re.fullmatch(r'/materialize/api/v\d/datastack/\w+/version/\d+/table/(\w+)/(metadata|query)', path)
+        if match and match.group(2) == 'metadata':
+            return as_json({'table_name': match.group(1), 'reference_table': None, 'voxel_resolution_x': 4., 'voxel_resolution_y': 4., 'voxel_resolution_z': 40.})
+        if match:
+            self.n_queries += 1
+            table_name, query = match.group(1), json.loads(body or '{}')
+            df = self.tables[table_name]
+            for k, v in query.get('filter_equal_dict', {}).get(table_name, {}).items():
+                df = df[df[k] == v]
+            select_columns = query.get('select_columns')
+            if isinstance(select_columns, dict):
+                select_columns = select_columns.get(table_name)
+            df = df if select_columns is None else df[list(select_columns)]
+            sink = pa.BufferOutputStream()
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return 200, 'data.arrow', sink.getvalue().to_pybytes()
+        return 404, 'application/json', b'{}'
+
+
+def expected(tables):
+    return [bench_utils.FakeCAVEClient(tables, 1).materialize.query_table(name, **query_kws) for name, query_kws in queries]
+
+
+def test_fetch(cave_tables):
+    fetcher = cave_utils.AsyncCAVEFetcher()
+    client = bench_utils.FakeCAVEClient(cave_tables, 1)
+    fetcher.add_client(client)
+    for df, exp in zip(fetcher.fetch(queries, 1), expected(cave_tables)):
+        pd.testing.assert_frame_equal(df, exp)
+    assert client.materialize.n_queries == len(queries)
+    assert fetcher.client(1) is client
+
+
+def test_fetch_through_caveclient(cave_tables):
+    pytest.importorskip('caveclient')
+    with LocalMaterializationServer(cave_tables, 1) as server:
+        fetcher = cave_utils.AsyncCAVEFetcher(caveclient_kws=server.caveclient_kws)
+        for df, exp in zip(fetcher.fetch(queries, 1), expected(cave_tables)):
+            pd.testing.assert_frame_equal(df, exp)
+        assert server.n_queries == len(queries)
+        assert fetcher.client(1) is fetcher.client(1) # one client per version
+    assert fetcher.datastack == cave_utils.default_datastack()
+    assert server.datastacks == {getattr(cave_utils.apu, fetcher.datastack, fetcher.datastack)}
+
+
+def test_fetch_in_running_event_loop(cave_tables):
+    fetcher = cave_utils.AsyncCAVEFetcher()
+    fetcher.add_client(bench_utils.FakeCAVEClient(cave_tables, 1))
+
+    async def main():
+        return fetcher.fetch(queries, 1)
+
+    for df, exp in zip(asyncio.run(main()), expected(cave_tables)):
+        pd.testing.assert_frame_equal(df, exp)
+
+
+def test_transient_errors_are_retried(cave_tables):
+    fetcher = cave_utils.AsyncCAVEFetcher(retries=3, backoff=0)
+    fetcher.add_client(flaky_client(cave_tables, 3, requests.ConnectionError('reset')))
+    pd.testing.assert_frame_equal(fetcher.fetch(queries[:1], 1)[0], expected(cave_tables)[0])
+
+
+def test_retries_are_bounded(cave_tables):
+    fetcher = cave_utils.AsyncCAVEFetcher(retries=2, backoff=0)
+    fetcher.add_client(flaky_client(cave_tables, 3, requests.Timeout('timeout')))
+    with pytest.raises(requests.Timeout):
+        fetcher.fetch(queries[:1], 1)
+
+
+def test_other_errors_are_raised(cave_tables):
+    fetcher = cave_utils.AsyncCAVEFetcher(retries=3, backoff=0)
+    client = flaky_client(cave_tables, 1, KeyError('no such table'))
+    fetcher.add_client(client)
+    with pytest.raises(KeyError):
+        fetcher.fetch(queries[:1], 1)
+    assert client.materialize.n_failures == 0
+
+
+def fetch_in_child(fetcher, tables):
+    fetcher.add_client(bench_utils.FakeCAVEClient(tables, 1)) # clients of the parent are not inherited
+    fetcher.fetch(queries, 1)
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='requires fork')
+def test_fetch_after_fork(cave_tables):
+    fetcher = cave_utils.AsyncCAVEFetcher(max_concurrency=2)
+    fetcher.add_client(bench_utils.FakeCAVEClient(cave_tables, 1))
+    fetcher.fetch(queries * 4, 1) # the parent's thread pool is started and saturated before forking
+    process = multiprocessing.get_context('fork').Process(target=fetch_in_child, args=(fetcher, cave_tables))
+    process.start()
+    process.join(timeout=60)
+    if process.is_alive():
+        process.kill()
+        pytest.fail('fetch hung in forked child process')
+    assert process.exitcode == 0
@@ -0,0 +1,180 @@
+import threading
+import time
+
+import pytest
+
+connection_utils = pytest.importorskip('microns_manual_proofreading_api.utils.connection_utils')
+
+
+class FakeConnection:
+    """
+    Stand-in for a DataJoint connection whose queries block until released.
+    """
+    def __init__(self):
+        self.is_connected = True
+        self._in_transaction = False
+        self.n_connects = 0
+        self.closed_during_query = False
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.n_running = 0
+        self.max_running = 0
+        self.statements = []
+
+    def query(self, sql, block=False, delay=0):
+        if not self.is_connected:
+            raise ConnectionError('query on a closed connection')
+        self.n_running += 1
+        self.max_running = max(self.max_running, self.n_running)
+        self.statements.append(sql)
+        try:
+            if block:
+                self.started.set()
+                self.release.wait(10)
+            time.sleep(delay)
+            if not self.is_connected:
+                self.closed_during_query = True
+            return sql
+        finally:
+            self.n_running -= 1
+
+    def start_transaction(self):
+        if self._in_transaction:
+            raise RuntimeError('Nested connections are not supported.')
+        self.query('START TRANSACTION')
+        self._in_transaction = True
+
+    def commit_transaction(self):
+        self.query('COMMIT')
+        self._in_transaction = False
+
+    def cancel_transaction(self):
+        self.query('ROLLBACK')
+        self._in_transaction = False
+
+    def close(self):
+        self.is_connected = False
+
+    def connect(self):
+        self.is_connected = True
+        self.n_connects += 1
+
+
+@pytest.fixture
+def shared():
+    conn = connection_utils.SharedConnection(idle_timeout=0) # no reaper thread
+    fake = FakeConnection()
+    conn._connection = conn._track(fake)
+    return conn, fake
+
+
+def test_close_waits_for_query_in_progress(shared):
+    conn, fake = shared
+    query = threading.Thread(target=fake.query, args=('SELECT 1',), kwargs={'block': True})
+    query.start()
+    assert fake.started.wait(10)
+    assert not conn.reap(idle_timeout=0) # the reaper skips a connection in a query
+
+    closed = []
+    closer = threading.Thread(target=lambda: closed.append(conn.close()))
+    closer.start()
+    time.sleep(0.2)
+    assert not closed and fake.is_connected # waiting for the query
+    fake.release.set()
+    query.join(10), closer.join(10)
+    assert closed == [True]
+    assert not fake.closed_during_query
+    assert not fake.is_connected
+
+
+def test_close_timeout(shared):
+    conn, fake = shared
+    query = threading.Thread(target=fake.query, args=('SELECT 1',), kwargs={'block': True})
+    query.start()
+    assert fake.started.wait(10)
+    assert not conn.close(timeout=0.1)
+    assert fake.is_connected
+    fake.release.set()
+    query.join(10)
+
+
+def test_close_skips_transaction(shared):
+    conn, fake = shared
+    fake._in_transaction = True
+    assert not conn.close(timeout=0)
+    assert fake.is_connected
+
+
+def test_query_after_close_reconnects(shared):
+    conn, fake = shared
+    assert conn.close()
+    assert conn.stats['open'] is False
+    assert fake.query('SELECT 1') == 'SELECT 1'
+    assert fake.n_connects == 1 and conn.n_reconnects == 1
+
+
+def test_concurrent_queries_and_reaping(shared):
+    conn, fake = shared
+    stop = threading.Event()
+
+    def reap():
+        while not stop.is_set():
+            conn.reap(idle_timeout=0)
+
+    reaper = threading.Thread(target=reap)
+    reaper.start()
+    errors = []
+
+    def work():
+        try:
+            for _ in range(500):
+                fake.query('SELECT 1')
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=work) for _ in range(4)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join(30)
+    stop.set()
+    reaper.join(10)
+    assert not errors
+    assert not fake.closed_during_query
+
+
+def test_queries_of_threads_do_not_overlap(shared):
+    conn, fake = shared
+
+    def work():
+        for _ in range(50):
+            fake.query('SELECT 1', delay=0.001)
+
+    workers = [threading.Thread(target=work) for _ in range(4)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join(30)
+    assert len(fake.statements) == 200
+    assert fake.max_running == 1
+
+
+def test_transaction_blocks_queries_of_other_threads(shared):
+    conn, fake = shared
+    fake.start_transaction()
+    fake.query('INSERT 1')
+    other = threading.Thread(target=fake.query, args=('SELECT 2',))
+    other.start()
+    other.join(0.2)
+    assert other.is_alive() # waiting for the transaction
+    fake.query('INSERT 3') # the thread in the transaction is not blocked
+    fake.commit_transaction()
+    other.join(10)
+    assert fake.statements == ['START TRANSACTION', 'INSERT 1', 'INSERT 3', 'COMMIT', 'SELECT 2']
+
+    fake.start_transaction() # the lock is released after rollback too
+    fake.cancel_transaction()
+    other = threading.Thread(target=fake.query, args=('SELECT 4',))
+    other.start()
+    other.join(10)
+    assert not other.is_alive()
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+export_utils = pytest.importorskip('microns_manual_proofreading.utils.export_utils')
+
+from conftest import import_schema
+from datajoint_plus.hash import generate_hash
+
+
+def set_rows(n=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'nucleus_id': rng.choice(10**6, n, replace=False).astype(np.int64),
+        'prf_method': rng.choice(['a1b2c3', 'd4e5f6'], n),
+        'area': rng.choice(['V1', 'RL', None], n),
+        'time_min_den': np.where(rng.random(n) < 0.1, np.nan, rng.random(n) * 60),
+        'finished_den': rng.random(n) < 0.9,
+        'ts_computed': pd.Timestamp('2022-01-02 03:04:05') + pd.to_timedelta(rng.integers(0, 10**6, n), unit='s'),
+    })
+
+
+def set_hash(df):
+    df = df.astype({'ts_computed': str}).astype(object)
+    return generate_hash(df.where(df.notnull(), None))
+
+
+def test_set_store_round_trip(tmp_path):
+    store = export_utils.SetStore(tmp_path)
+    df = set_rows()
+    prf_nuc_set = set_hash(df)
+    path = store.write('ExcelPrfSheet', 'prf_nuc_set', prf_nuc_set, df.assign(prf_nuc_set=prf_nuc_set))
+    assert store.find('prf_nuc_set', prf_nuc_set) == path
+    assert store.contains('prf_nuc_set', prf_nuc_set)
+
+    loaded = store.read('prf_nuc_set', prf_nuc_set).to_pandas()
+    pd.testing.assert_frame_equal(loaded, df) # the hash column is dropped, it is the partition
+    assert set_hash(loaded) == prf_nuc_set
+    pd.testing.assert_frame_equal(store.read('prf_nuc_set', prf_nuc_set, columns=['nucleus_id', 'area']).to_pandas(), df[['nucleus_id', 'area']])
+
+
+def test_set_store_never_overwrites(tmp_path):
+    store = export_utils.SetStore(tmp_path)
+    df = set_rows()
+    path = store.write('ExcelPrfSheet', 'prf_nuc_set', 'abc', df)
+    assert store.write('ExcelPrfSheet', 'prf_nuc_set', 'abc', df.iloc[:10]) == path
+    assert store.read('prf_nuc_set', 'abc').num_rows == len(df)
+    assert not list(tmp_path.rglob('*.tmp'))
+
+
+def test_set_store_missing_and_dataset(tmp_path):
+    store = export_utils.SetStore(tmp_path)
+    assert store.find('prf_nuc_set', 'abc') is None
+    assert store.read('prf_nuc_set', 'abc') is None
+    frames = {h: set_rows(n=100, seed=i) for i, h in enumerate(['abc', 'def'])}
+    for h, df in frames.items():
+        store.write('ExcelPrfSheet', 'prf_nuc_set', h, df)
+    store.write('Member', 'prf_nuc_include_set', 'ghi', set_rows(n=10))
+    assert sorted(store.hashes('ExcelPrfSheet', 'prf_nuc_set')) == ['abc', 'def']
+    table = store.dataset('ExcelPrfSheet').to_table().to_pandas()
+    assert len(table) == 200
+    assert table.groupby('prf_nuc_set').size().to_dict() == {'abc': 100, 'def': 100}
+
+
+@pytest.fixture
+def m65mprf():
+    return import_schema()
+
+
+def sort(df):
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def test_prf_nucleus_set_export_load(m65mprf, monkeypatch, tmp_path):
+    PrfNucleusSet = m65mprf.PrfNucleusSet
+    hashes = PrfNucleusSet.ExcelPrfSheet.fetch('prf_nuc_set', limit=1)
+    if not len(hashes):
+        pytest.skip('No ExcelPrfSheet sets to export.')
+    monkeypatch.setattr(PrfNucleusSet, 'store', export_utils.SetStore(tmp_path))
+    table_name, expected = PrfNucleusSet.fetch_set(hashes[0])
+
+    path = PrfNucleusSet.export(hashes[0])
+    assert PrfNucleusSet.store.find('prf_nuc_set', hashes[0]) == path
+    assert PrfNucleusSet.store.hashes(table_name, 'prf_nuc_set') == [hashes[0]]
+    loaded = PrfNucleusSet.load(hashes[0])
+    pd.testing.assert_frame_equal(sort(loaded), sort(expected), check_dtype=False)
+    assert PrfNucleusSet.export(hashes[0]) == path
+
+
+def test_prf_nucleus_include_set_export_load(m65mprf, monkeypatch, tmp_path):
+    PrfNucleusIncludeSet = m65mprf.PrfNucleusIncludeSet
+    hashes = PrfNucleusIncludeSet.Member.fetch('prf_nuc_include_set', limit=1)
+    if not len(hashes):
+        pytest.skip('No include sets to export.')
+    monkeypatch.setattr(PrfNucleusIncludeSet, 'store', export_utils.SetStore(tmp_path))
+    restr = {'prf_nuc_include_set': hashes[0]}
+    expected = pd.DataFrame((PrfNucleusIncludeSet.Member & restr).fetch(as_dict=True)).drop(columns='prf_nuc_include_set')
+
+    path = PrfNucleusIncludeSet.export(hashes[0])
+    assert PrfNucleusIncludeSet.store.find('prf_nuc_include_set', hashes[0]) == path
+    pd.testing.assert_frame_equal(sort(PrfNucleusIncludeSet.load(hashes[0])), sort(expected), check_dtype=False)
+    monkeypatch.setattr(PrfNucleusIncludeSet, 'store', None) # read from the database
+    pd.testing.assert_frame_equal(sort(PrfNucleusIncludeSet.load(hashes[0]).drop(columns='prf_nuc_include_set')), sort(expected), check_dtype=False)
@@ -0,0 +1,116 @@
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+import simplejson
+
+pytest.importorskip('datajoint_plus')
+
+from conftest import import_schema
+from datajoint_plus.hash import generate_hash
+from microns_manual_proofreading.utils.hash_utils import SetHasher, hash_set, set_hasher
+
+
+def sample_rows(dtype, n=500, seed=0):
+    """
+    Returns rows with a nucleus_id column of dtype and string columns, including quotes, backslashes and non-ascii characters.
+    """
+    rng = np.random.default_rng(seed)
+    nucleus_ids = pd.Series(rng.choice(10**6, n, replace=False)).astype(dtype)
+    return pd.DataFrame({
+        'nucleus_id': nucleus_ids,
+        'prf_method': rng.choice(['a1b2c3', 'd4"e5', 'f6\\g7', 'é8h9'], n),
+        'ts_computed': '2022-01-02 03:04:05.678901',
+    })
+
+
+dtypes = ['int64', 'float64', 'object']
+
+
+@pytest.mark.parametrize('dtype', dtypes)
+@pytest.mark.parametrize('constant_columns', [None, {'table_id': 'abc123'}])
+def test_set_hasher_matches_generate_hash(dtype, constant_columns):
+    rows = sample_rows(dtype)
+    assert SetHasher(rows, add_constant_columns=constant_columns).hexdigest() == generate_hash(rows, add_constant_columns=constant_columns)
+
+
+@pytest.mark.parametrize('dtype', dtypes)
+@pytest.mark.parametrize('constant_columns', [None, {'table_id': 'abc123'}])
+def test_set_hasher_add_remove_matches_generate_hash(dtype, constant_columns):
+    rows = sample_rows(dtype)
+    hasher = SetHasher(rows.iloc[:400], add_constant_columns=constant_columns).add(rows.iloc[400:])
+    assert hasher.hexdigest() == generate_hash(rows, add_constant_columns=constant_columns)
+    hasher.remove(rows.iloc[:100])
+    assert len(hasher) == 400
+    assert hasher.hexdigest() == generate_hash(rows.iloc[100:], add_constant_columns=constant_columns)
+
+
+def rows_with_nan(dtype):
+    """
+    Returns sample_rows with a NaN in every tenth nucleus_id, and None in object columns as well.
+    """
+    rows = sample_rows('float64')
+    rows.loc[::10, 'nucleus_id'] = np.nan
+    rows = rows.astype({'nucleus_id': dtype})
+    if dtype == 'object':
+        rows.loc[5::10, 'nucleus_id'] = None
+    return rows
+
+
+def hash_or_error(hash_fn, *args, **kwargs):
+    try:
+        return hash_fn(*args, **kwargs)
+    except ValueError as e:
+        return str(e)
+
+
+@pytest.mark.parametrize('dtype', ['float64', 'object'])
+@pytest.mark.parametrize('allow_nan', [True, False]) # simplejson 3 writes NaN, simplejson 4 raises ValueError by default
+def test_set_hasher_matches_generate_hash_with_nan(monkeypatch, dtype, allow_nan):
+    monkeypatch.setattr(simplejson, 'dumps', partial(simplejson.dumps, allow_nan=allow_nan))
+    rows = rows_with_nan(dtype)
+    expected = hash_or_error(generate_hash, rows)
+    assert hash_or_error(lambda rows: SetHasher(rows).hexdigest(), rows) == expected
+    if allow_nan:
+        assert expected != generate_hash(rows.fillna(-1)) # NaN is hashed, not dropped
+
+
+def group_tables(m65mprf):
+    return {
+        'ExcelPrfSheetMaker': (m65mprf.PrfNucleusSet.ExcelPrfSheetMaker, ['nucleus_id', 'import_method']),
+        'Member': (m65mprf.PrfNucleusIncludeSet.Member, ['nucleus_id', 'prf_method', 'ts_computed']),
+    }
+
+
+def table_rows(columns, dtype):
+    return sample_rows(dtype).rename(columns={'prf_method': 'import_method'} if 'import_method' in columns else {})[columns]
+
+
+@pytest.mark.parametrize('table_name', ['ExcelPrfSheetMaker', 'Member'])
+@pytest.mark.parametrize('dtype', dtypes)
+@pytest.mark.parametrize('hash_table_name', [False, True])
+def test_hash_set_matches_hash1(monkeypatch, table_name, dtype, hash_table_name):
+    table, columns = group_tables(import_schema())[table_name]
+    monkeypatch.setattr(table, 'hash_table_name', hash_table_name) # True adds the table_id constant column
+    rows = table_rows(columns, dtype)
+    assert hash_set(table, rows) == table.hash1(rows, unique=True)
+
+
+@pytest.mark.parametrize('allow_nan', [True, False])
+def test_hash_set_matches_hash1_with_nan(monkeypatch, allow_nan):
+    monkeypatch.setattr(simplejson, 'dumps', partial(simplejson.dumps, allow_nan=allow_nan))
+    table, columns = group_tables(import_schema())['Member']
+    rows = rows_with_nan('float64')[columns]
+    assert hash_or_error(hash_set, table, rows) == hash_or_error(table.hash1, rows, unique=True)
+
+
+@pytest.mark.parametrize('table_name', ['ExcelPrfSheetMaker', 'Member'])
+@pytest.mark.parametrize('dtype', dtypes)
+@pytest.mark.parametrize('hash_table_name', [False, True])
+def test_set_hasher_add_remove_matches_hash1(monkeypatch, table_name, dtype, hash_table_name):
+    table, columns = group_tables(import_schema())[table_name]
+    monkeypatch.setattr(table, 'hash_table_name', hash_table_name)
+    rows = table_rows(columns, dtype)
+    hasher = set_hasher(table, rows.iloc[:400]).add(rows.iloc[400:]).remove(rows.iloc[:100])
+    assert hasher.hexdigest()[:table.hash_len] == table.hash1(rows.iloc[100:], unique=True)
@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+index_utils = pytest.importorskip('microns_manual_proofreading.utils.index_utils')
+
+
+@pytest.fixture
+def tables():
+    rng = np.random.default_rng(0)
+    n = 5000
+    nuc_df = pd.DataFrame({'id': rng.choice(10**6, n, replace=False), 'pt_root_id': rng.integers(0, 2000, n).astype(np.int64) + 864691134884000000})
+    nuc_df.loc[:50, 'pt_root_id'] = 0 # nuclei without a segment
+    root_ids = np.r_[nuc_df.pt_root_id.to_numpy(), rng.integers(1, 10**6, 500) + 864691134884000000] # some root_ids have no nucleus
+    status_df = pd.DataFrame({'pt_root_id': rng.choice(root_ids, 3000), 'status_axon': rng.choice(['extended', 'clean', 'non'], 3000)})
+    return nuc_df, status_df
+
+
+def join(index, status_df):
+    positions, nucleus_ids = index.join_root_ids(status_df.pt_root_id.to_numpy())
+    df = status_df.iloc[positions].reset_index(drop=True)
+    df['nucleus_id'] = nucleus_ids.astype(np.int64)
+    return df
+
+
+def sort(df):
+    return df[['nucleus_id', 'pt_root_id', 'status_axon']].sort_values(['nucleus_id', 'pt_root_id', 'status_axon']).reset_index(drop=True)
+
+
+def test_join_root_ids_matches_merge(tables):
+    nuc_df, status_df = tables
+    expected = status_df.merge(nuc_df, on='pt_root_id').rename(columns={'id': 'nucleus_id'})
+    result = join(index_utils.RootIdIndex(nuc_df.id, nuc_df.pt_root_id), status_df)
+    assert len(result) == len(expected)
+    pd.testing.assert_frame_equal(sort(result), sort(expected))
+
+
+def test_saved_index_matches(tables, tmp_path):
+    nuc_df, status_df = tables
+    index = index_utils.RootIdIndex(nuc_df.id, nuc_df.pt_root_id)
+    loaded = index_utils.RootIdIndex.load(index.save(index_utils.RootIdIndex.path('m65_internal', 1, tmp_path)))
+    pd.testing.assert_frame_equal(sort(join(loaded, status_df)), sort(join(index, status_df)))
+    assert index_utils.RootIdIndex.load(index_utils.RootIdIndex.path('m65_internal', 2, tmp_path)) is None
+    assert index_utils.RootIdIndex.load(index_utils.RootIdIndex.path('minnie65_public', 1, tmp_path)) is None # versions of other datastacks are unrelated
+
+
+def test_root_ids_of(tables):
+    nuc_df, _ = tables
+    index = index_utils.RootIdIndex(nuc_df.id, nuc_df.pt_root_id)
+    missing = np.setdiff1d(np.arange(10), nuc_df.id)[:3]
+    root_ids = index.root_ids_of(np.r_[nuc_df.id.to_numpy(), missing])
+    assert (root_ids[:len(nuc_df)] == nuc_df.pt_root_id.to_numpy(dtype=np.uint64)).all()
+    assert (root_ids[len(nuc_df):] == 0).all()
+
+
+def test_empty_index():
+    index = index_utils.RootIdIndex([], [])
+    positions, nucleus_ids = index.join_root_ids([1, 2])
+    assert len(positions) == len(nucleus_ids) == 0
+    assert (index.root_ids_of([1]) == 0).all()
+
+
+@pytest.fixture
+def nuclei():
+    rng = np.random.default_rng(1)
+    n = 1000
+    return pd.DataFrame({
+        'nucleus_id': rng.choice(10**6, n, replace=False),
+        'prf_method': rng.choice(['a1b2c3', 'd4e5f6'], n),
+        'area': rng.choice(['V1', 'RL', 'AL'], n),
+        'status_dendrite': rng.choice(['extended', 'clean', None], n),
+        'status_axon': rng.choice(['extended', 'clean', 'non', None], n),
+    })
+
+
+def test_nucleus_index_contains_and_lookup(nuclei):
+    index = index_utils.NucleusIndex(nuclei.nucleus_id, prf_method=nuclei.prf_method, area=nuclei.area)
+    missing = np.setdiff1d(np.arange(2000), nuclei.nucleus_id)[:100]
+    query = np.r_[nuclei.nucleus_id.to_numpy()[::-3], missing]
+    included = np.isin(query, nuclei.nucleus_id)
+    assert (index.contains(query) == included).all()
+    assert all((nid in index) == inc for nid, inc in zip(query, included))
+
+    df = index.lookup(query)
+    expected = pd.DataFrame({'nucleus_id': query}).merge(nuclei[['nucleus_id', 'prf_method', 'area']], how='left')
+    assert (df.nucleus_id.to_numpy() == query).all()
+    assert (df.included.to_numpy() == included).all()
+    for attr in ['prf_method', 'area']:
+        assert df[attr].tolist() == expected[attr].astype(object).where(expected[attr].notnull(), None).tolist()
+
+
+def test_nucleus_index_set_active(nuclei):
+    index = index_utils.NucleusIndex(nuclei.nucleus_id, area=nuclei.area)
+    excluded = nuclei.nucleus_id.to_numpy()[:10]
+    index.set_active(np.r_[excluded, 10**7], False) # nucleus_ids not in the index are ignored
+    assert len(index) == len(nuclei) - 10
+    assert not index.contains(excluded).any()
+    assert excluded[0] not in index
+    assert index.lookup(excluded).area.isnull().all()
+    assert not np.isin(index.to_frame().nucleus_id, excluded).any()
+
+    index.set_active(excluded[:5], [True, False, True, False, True])
+    assert index.contains(excluded[:5]).tolist() == [True, False, True, False, True]
+    assert len(index) == len(nuclei) - 7
+
+
+def test_empty_nucleus_index():
+    index = index_utils.NucleusIndex([], area=[])
+    assert len(index) == 0
+    assert 1 not in index
+    assert not index.contains([1, 2]).any()
+    df = index.lookup([1, 2])
+    assert not df.included.any() and df.area.isnull().all()
+    index.set_active([1], False)
+    assert index.to_frame().empty
+
+
+def test_nucleus_index_rejects_duplicates():
+    with pytest.raises(AssertionError):
+        index_utils.NucleusIndex([1, 2, 2])
+
+
+@pytest.mark.parametrize('conditions', [
+    dict(status_axon='extended'),
+    dict(status_axon='extended', status_dendrite='clean'),
+    dict(status_axon=['clean', 'non'], status_dendrite=None),
+    dict(status_axon='unknown'),
+    dict(),
+])
+def test_status_index_select(nuclei, conditions):
+    attrs = ['status_dendrite', 'status_axon']
+    index = index_utils.StatusIndex.from_frame(nuclei, attrs)
+    expected = nuclei
+    for attr, statuses in conditions.items():
+        statuses = statuses if isinstance(statuses, list) else [statuses]
+        expected = expected[expected[attr].isin([s for s in statuses if s is not None]) | (expected[attr].isnull() & (None in statuses))]
+    assert (index.select(**conditions) == np.sort(expected.nucleus_id.to_numpy()).astype(np.uint64)).all()
+
+
+def test_status_index_save_load(nuclei, tmp_path):
+    attrs = ['status_dendrite', 'status_axon']
+    index = index_utils.StatusIndex.from_frame(nuclei, attrs)
+    index.save(tmp_path.joinpath('index.npz'))
+    loaded = index_utils.StatusIndex.load(tmp_path.joinpath('index.npz'))
+    pd.testing.assert_frame_equal(loaded.to_frame(), index.to_frame())
+    expected = nuclei[['nucleus_id', *attrs]].sort_values('nucleus_id').reset_index(drop=True)
+    pd.testing.assert_frame_equal(loaded.to_frame().astype({'nucleus_id': np.int64}), expected.astype({'nucleus_id': np.int64}))
+    assert (loaded.select(status_axon='clean', status_dendrite='extended') == index.select(status_axon='clean', status_dendrite='extended')).all()
+    assert loaded.nbytes == index.nbytes
+
+
+def test_empty_status_index(tmp_path):
+    index = index_utils.StatusIndex([], status_axon=[])
+    assert len(index) == 0 and len(index.select(status_axon='clean')) == 0
+    index.save(tmp_path.joinpath('index.npz'))
+    assert index_utils.StatusIndex.load(tmp_path.joinpath('index.npz')).to_frame().empty
@@ -0,0 +1,157 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+insert_utils = pytest.importorskip('microns_manual_proofreading.utils.insert_utils')
+
+
+class FakeConnection:
+    """
+    Stand-in for a DataJoint connection. Rows inserted in a transaction are stored only if it commits.
+    """
+    def __init__(self):
+        self.in_transaction = False
+        self.n_transactions = 0
+        self.pending = []
+
+    @property
+    @contextmanager
+    def transaction(self):
+        self.in_transaction = True
+        self.n_transactions += 1
+        try:
+            yield
+        except Exception:
+            self.pending = []
+            raise
+        else:
+            for table, rows in self.pending:
+                table.stored.append(rows)
+            self.pending = []
+        finally:
+            self.in_transaction = False
+
+
+class FakeTable:
+    """
+    Stand-in for a DataJoint table recording each insert statement.
+    """
+    enable_hashing = False
+
+    def __init__(self, connection, names, master=None, fail_on=None):
+        self.connection = connection
+        self.heading = SimpleNamespace(names=names)
+        self.master = master
+        self.class_name = 'FakeTable'
+        self.fail_on = fail_on # number of the insert statement that raises
+        self.calls = []
+        self.stored = []
+
+    def insert(self, rows, **kwargs):
+        self.calls.append((pd.DataFrame(rows), kwargs))
+        if self.fail_on is not None and len(self.calls) == self.fail_on:
+            raise RuntimeError('insert failed')
+        if self.connection.in_transaction:
+            self.connection.pending.append((self, pd.DataFrame(rows)))
+        else:
+            self.stored.append(pd.DataFrame(rows))
+
+    @property
+    def n_stored(self):
+        return sum(len(rows) for rows in self.stored)
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    connection = FakeConnection()
+    monkeypatch.setattr(insert_utils, 'shared_conn', lambda: connection)
+    return connection
+
+
+def part_rows(n=1000, n_sets=3, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'prf_nuc_set': rng.choice([f'set{i}' for i in range(n_sets)], n),
+        'nucleus_id': np.arange(n),
+        'area': rng.choice(['V1', 'RL'], n),
+    })
+
+
+def make_tables(connection, fail_on=None):
+    master = FakeTable(connection, ['prf_nuc_set'])
+    return FakeTable(connection, ['prf_nuc_set', 'nucleus_id', 'area'], master=master, fail_on=fail_on), master
+
+
+def test_batch_insert_dedups_master_keys(connection):
+    part, master = make_tables(connection)
+    rows = part_rows()
+    stats = insert_utils.batch_insert(part, rows, batch_size=128, insert_to_master=True)
+
+    assert len(master.calls) == 1
+    master_keys, master_kws = master.calls[0]
+    assert sorted(master_keys.prf_nuc_set) == sorted(rows.prf_nuc_set.unique())
+    assert master_kws == {'ignore_extra_fields': True, 'skip_duplicates': True}
+
+    assert [len(batch) for batch, _ in part.calls] == [128] * 7 + [1000 - 7 * 128]
+    assert all(kws == {'skip_hashing': True} for _, kws in part.calls)
+    pd.testing.assert_frame_equal(pd.concat(part.stored, ignore_index=True), rows)
+    assert connection.n_transactions == 1
+    assert stats['n_rows'] == len(rows)
+
+
+def test_batch_insert_passes_master_kws(connection):
+    part, master = make_tables(connection)
+    insert_utils.batch_insert(part, part_rows(), insert_to_master=True, insert_to_master_kws={'skip_duplicates': True})
+    assert master.calls[0][1] == {'skip_duplicates': True}
+
+
+def test_batch_insert_skip_duplicates_drops_duplicate_rows(connection):
+    part, _ = make_tables(connection)
+    rows = part_rows(n=100)
+    insert_utils.batch_insert(part, pd.concat([rows, rows.assign(extra=1)]), ignore_extra_fields=True, skip_duplicates=True)
+    pd.testing.assert_frame_equal(pd.concat(part.stored, ignore_index=True), rows)
+
+
+def test_batch_insert_rolls_back_failed_batch(connection):
+    part, master = make_tables(connection, fail_on=3)
+    with pytest.raises(RuntimeError, match='insert failed'):
+        insert_utils.batch_insert(part, part_rows(), batch_size=128, insert_to_master=True)
+    assert part.n_stored == 0 and master.n_stored == 0 # every batch and the master keys rolled back
+    assert not connection.in_transaction
+
+
+def test_batch_insert_not_atomic_keeps_committed_batches(connection):
+    part, _ = make_tables(connection, fail_on=3)
+    with pytest.raises(RuntimeError, match='insert failed'):
+        insert_utils.batch_insert(part, part_rows(), batch_size=128, atomic=False)
+    assert part.n_stored == 2 * 128
+    assert connection.n_transactions == 0
+
+
+def test_batch_insert_joins_open_transaction(connection):
+    part, _ = make_tables(connection)
+    with connection.transaction:
+        insert_utils.batch_insert(part, part_rows(), batch_size=128)
+        assert part.n_stored == 0 # committed with the enclosing transaction
+    assert connection.n_transactions == 1
+    assert part.n_stored == 1000
+
+
+def test_batch_insert_rate(connection, monkeypatch):
+    part, _ = make_tables(connection)
+    clock = iter([10., 12.5])
+    monkeypatch.setattr(insert_utils.time, 'perf_counter', lambda: next(clock))
+    stats = insert_utils.batch_insert(part, part_rows())
+    assert stats == {'n_rows': 1000, 'seconds': 2.5, 'rows_per_sec': 400.}
+
+    clock = iter([10., 10.])
+    assert insert_utils.batch_insert(part, part_rows())['rows_per_sec'] == float('inf')
+
+
+def test_batch_insert_rejects_batch_size(connection):
+    part, _ = make_tables(connection)
+    with pytest.raises(AssertionError):
+        insert_utils.batch_insert(part, part_rows(), batch_size=0)
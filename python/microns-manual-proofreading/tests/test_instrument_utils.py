@@ -0,0 +1,89 @@
+import json
+import threading
+
+import pytest
+
+instrument_utils = pytest.importorskip('microns_manual_proofreading.utils.instrument_utils')
+
+
+class FakeConnection:
+    def query(self, sql):
+        return sql
+
+
+class Table:
+    @classmethod
+    @instrument_utils.instrumented('fill')
+    def fill(cls, connection, n_stages, barrier=None):
+        for i in range(n_stages):
+            with instrument_utils.stage(cls, f'stage{i}') as record:
+                if barrier is not None:
+                    barrier.wait(10) # every thread is inside a stage at once
+                connection.query('SELECT 1')
+                record['n_rows'] = i
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    connection = FakeConnection()
+    monkeypatch.setattr(instrument_utils, 'shared_conn', lambda: connection)
+    return connection
+
+
+def test_stages_recorded_with_paths(connection, tmp_path):
+    with instrument_utils.instrumentation(json_path=tmp_path.joinpath('stages.jsonl'), prometheus_path=tmp_path.joinpath('stages.prom'), log=False) as run:
+        Table.fill(connection, 2)
+    assert [r['path'] for r in run.records] == ['Table.fill > Table.stage0', 'Table.fill > Table.stage1', 'Table.fill']
+    assert [r['n_queries'] for r in run.records] == [1, 1, 2]
+    assert [json.loads(line)['path'] for line in tmp_path.joinpath('stages.jsonl').read_text().splitlines()] == [r['path'] for r in run.records]
+    assert 'microns_manual_proofreading_stage_calls{table="Table",stage="fill"} 1' in tmp_path.joinpath('stages.prom').read_text()
+    assert instrument_utils.active_run() is None
+
+
+def test_instrumentation_off(connection):
+    assert instrument_utils.stage(Table, 'stage0') is instrument_utils._null_stage
+    Table.fill(connection, 2)
+    with instrument_utils.stage(Table, 'stage0') as record:
+        record['n_rows'] = 10
+    with instrument_utils.stage(Table, 'stage1') as record:
+        assert record == {} # records of earlier stages are not shared
+
+
+def test_instrumentation_is_per_thread(connection, tmp_path):
+    n_threads, n_stages = 4, 20
+    barrier = threading.Barrier(n_threads)
+    runs, errors = {}, []
+    json_path = tmp_path.joinpath('stages.jsonl')
+
+    def work(i):
+        try:
+            with instrument_utils.instrumentation(json_path=json_path, log=False) as run:
+                runs[i] = run
+                Table.fill(connection, n_stages, barrier=barrier)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(n_threads)]
+    with instrument_utils.instrumentation(log=False) as main_run: # the main thread's run records none of the threads' stages
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(30)
+    assert not errors
+    assert main_run.records == []
+    for run in runs.values():
+        assert len(run.records) == n_stages + 1
+        assert [r['path'] for r in run.records[:-1]] == [f'Table.fill > Table.stage{i}' for i in range(n_stages)]
+        assert all(r['n_queries'] == 1 for r in run.records[:-1])
+        assert run.records[-1]['n_queries'] == n_stages
+        assert run.stack == []
+    assert len([json.loads(line) for line in json_path.read_text().splitlines()]) == n_threads * (n_stages + 1)
+
+
+def test_nested_instrumentation_restores_previous(connection):
+    with instrument_utils.instrumentation(log=False) as outer:
+        with instrument_utils.instrumentation(log=False) as inner:
+            Table.fill(connection, 1)
+        assert instrument_utils.active_run() is outer
+        Table.fill(connection, 1)
+    assert len(inner.records) == len(outer.records) == 2
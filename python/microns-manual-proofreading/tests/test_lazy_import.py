@@ -0,0 +1,33 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('microns_utils')
+
+script = """
+import json, socket, sys
+
+def connect(*args, **kwargs):
+    raise OSError('network access during import')
+
+socket.socket.connect = connect # neither the database nor Github may be contacted
+
+import microns_manual_proofreading.minnie_manual_proofreading
+import microns_manual_proofreading_api.schemas
+
+schema_modules = [m for m in sys.modules if m.endswith('minnie65_manual_proofreading')]
+versions = [microns_manual_proofreading.__version__, microns_manual_proofreading_api.__version__]
+print(json.dumps({'schema_modules': schema_modules, 'versions': versions}))
+"""
+
+
+def test_lazy_import_defers_schema_modules():
+    env = {**os.environ, 'MICRONS_MANUAL_PROOFREADING_LAZY': '1', 'PYTHONPATH': os.pathsep.join(sys.path)}
+    result = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    output = json.loads(result.stdout.strip().splitlines()[-1])
+    assert output['schema_modules'] == []
+    assert all(isinstance(version, str) for version in output['versions'])
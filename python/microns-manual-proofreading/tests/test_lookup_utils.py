@@ -0,0 +1,110 @@
+import pytest
+
+lookup_utils = pytest.importorskip('microns_manual_proofreading.utils.lookup_utils')
+
+
+class FakeLookup:
+    """
+    Stand-in for a Lookup table counting the queries sent to it.
+    """
+    def __init__(self, rows, name='fake_lookup', package='fake-package', version='1.0.0'):
+        self.rows = list(rows)
+        self.full_table_name = f'`fake`.`{name}`'
+        self.class_name = name
+        self.package = package
+        self._version = version
+        self.n_fetches = 0
+        self.n_hashes = 0
+        self.n_versions = 0
+
+    def fetch(self, as_dict=True):
+        self.n_fetches += 1
+        return [dict(r) for r in self.rows]
+
+    @property
+    def checksum(self):
+        return hash(tuple(tuple(sorted(r.items())) for r in self.rows))
+
+    def hash1(self, row):
+        self.n_hashes += 1
+        return str(sorted(row.items()))[:8]
+
+    @property
+    def version(self):
+        self.n_versions += 1
+        return self._version
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.]
+    monkeypatch.setattr(lookup_utils.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def make_cache(ttl=60.):
+    cache = lookup_utils.LookupCache(ttl=ttl)
+    cache.checksum = lambda table: table.checksum # CHECKSUM TABLE
+    return cache
+
+
+def test_rows_loaded_once_within_ttl(clock):
+    table, cache = FakeLookup([{'id': 1}, {'id': 2}]), make_cache()
+    for _ in range(5):
+        assert cache.rows(table) == [{'id': 1}, {'id': 2}]
+    assert table.n_fetches == 1
+    assert (cache.misses, cache.hits) == (1, 4)
+
+
+def test_rows_reloaded_after_ttl_only_if_checksum_changed(clock):
+    table, cache = FakeLookup([{'id': 1}]), make_cache(ttl=10)
+    cache.rows(table)
+    table.rows.append({'id': 2})
+    clock[0] = 5
+    assert cache.rows(table) == [{'id': 1}] # within ttl, not checked
+    clock[0] = 11
+    assert cache.rows(table) == [{'id': 1}, {'id': 2}]
+    assert (table.n_fetches, cache.refreshes) == (2, 1)
+    clock[0] = 22
+    cache.rows(table) # checked, unchanged
+    assert (table.n_fetches, cache.refreshes) == (2, 1)
+
+
+def test_lookup_reloads_once_on_miss(clock):
+    table, cache = FakeLookup([{'id': 1, 'name': 'a'}]), make_cache()
+    assert cache.lookup1(table, name='a') == {'id': 1, 'name': 'a'}
+    table.rows.append({'id': 2, 'name': 'b'})
+    assert cache.lookup1(table, name='b') == {'id': 2, 'name': 'b'} # inserted by another process
+    assert table.n_fetches == 2
+    assert cache.lookup(table, name='c') == []
+    assert table.n_fetches == 3
+    with pytest.raises(AssertionError):
+        cache.lookup1(table, name='c')
+
+
+def test_invalidate(clock):
+    a, b, cache = FakeLookup([{'id': 1}], name='a'), FakeLookup([{'id': 1}], name='b'), make_cache()
+    cache.rows(a), cache.rows(b)
+    cache.invalidate(a)
+    cache.rows(a), cache.rows(b)
+    assert (a.n_fetches, b.n_fetches) == (2, 1)
+    cache.invalidate()
+    cache.rows(a), cache.rows(b)
+    assert (a.n_fetches, b.n_fetches) == (3, 2)
+
+
+def test_hash1_computed_once_per_row():
+    table, cache = FakeLookup([]), make_cache()
+    rows = [{'name': 'whole_cell'}, {'name': 'projection_only'}]
+    hashes = [[cache.hash1(table, dict(row)) for row in rows] for _ in range(3)]
+    assert hashes[0] == hashes[1] == hashes[2] == [table.hash1(row) for row in rows]
+    assert table.n_hashes == 2 + 2 # once per row in the cache, plus the check above
+    cache.invalidate()
+    cache.hash1(table, rows[0])
+    assert table.n_hashes == 4 # hashes are kept by invalidate
+
+
+def test_version_checked_once_per_package():
+    a, b, cache = FakeLookup([], package='a', version='1.0'), FakeLookup([], package='b', version='2.0'), make_cache()
+    assert [cache.version(t) for t in [a, b, a, b]] == ['1.0', '2.0', '1.0', '2.0']
+    assert (a.n_versions, b.n_versions) == (1, 1)
@@ -0,0 +1,297 @@
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+dj = pytest.importorskip('datajoint')
+pytest.importorskip('datajoint_plus')
+
+from conftest import import_schema
+from microns_manual_proofreading.utils.bench_utils import FakeCAVEClient, synthetic_sheet
+from microns_manual_proofreading.utils.cache_utils import TableCache
+from microns_manual_proofreading.utils.cave_utils import AsyncCAVEFetcher
+from microns_manual_proofreading.utils.instrument_utils import count_queries
+
+
+@pytest.fixture
+def m65mprf():
+    return import_schema()
+
+
+def status_sets(n_sets=6, n=2000, seed=0):
+    """
+    Returns successive CAVE status sets, each adding, removing and changing the statuses of some nuclei of the previous one.
+    """
+    rng = np.random.default_rng(seed)
+    make = lambda ids: pd.DataFrame({'nucleus_id': ids, 'status_dendrite': rng.choice(['extended', 'clean', None], len(ids)), 'status_axon': rng.choice(['extended', 'non'], len(ids))})
+    sets = [make(np.arange(n))]
+    for i in range(1, n_sets):
+        df = sets[-1].sample(frac=0.95, random_state=i).copy()
+        changed = df.sample(frac=0.05, random_state=i).index
+        df.loc[changed, 'status_axon'] = rng.choice(['clean', None], len(changed))
+        sets.append(pd.concat([df, make(np.arange(n + i * 100, n + (i + 1) * 100))], ignore_index=True))
+    return sets
+
+
+def sort_status(df):
+    return df[['nucleus_id', 'status_dendrite', 'status_axon']].fillna('').sort_values('nucleus_id').reset_index(drop=True)
+
+
+def test_cave_delta_round_trip(m65mprf):
+    PrfNucleusSet = m65mprf.PrfNucleusSet
+    sets = status_sets()
+    df = sets[0]
+    for base, new in zip(sets[:-1], sets[1:]):
+        delta = PrfNucleusSet.diff_cave_status(base, new)
+        assert set(delta.change) == {'added', 'removed', 'changed'}
+        assert len(delta) < len(new)
+        df = PrfNucleusSet.apply_cave_delta(df, delta) # reconstructs from the full set through the chain of deltas
+        pd.testing.assert_frame_equal(sort_status(df), sort_status(new))
+
+
+def test_cave_delta_of_identical_sets_is_empty(m65mprf):
+    df = status_sets(n_sets=1)[0]
+    assert m65mprf.PrfNucleusSet.diff_cave_status(df, df.sample(frac=1, random_state=0)).empty
+
+
+def test_cave_status_of_set_rejects_sets_stored_as_changes(m65mprf, delete_after):
+    PrfNucleusSet = m65mprf.PrfNucleusSet
+    sets = [{'prf_nuc_set': 'testcavebase'}, {'prf_nuc_set': 'testcavedelt'}]
+    PrfNucleusSet.insert(sets, skip_duplicates=True)
+    delete_after(PrfNucleusSet & sets)
+    PrfNucleusSet.CAVEDelta.insert1({'prf_nuc_set': 'testcavedelt', 'base_prf_nuc_set': 'testcavebase', 'chain_length': 1, 'n_added': 0, 'n_removed': 0, 'n_changed': 0})
+
+    assert not PrfNucleusSet.CAVEProofreadingStatus.of_set('testcavebase') # stored in full, with no nuclei
+    with pytest.raises(ValueError, match='stored as changes'):
+        PrfNucleusSet.CAVEProofreadingStatus.of_set('testcavedelt')
+    assert PrfNucleusSet.fetch_cave_status('testcavedelt').empty
+
+
+def normalize_sheet(df):
+    columns = ['excel_id', 'nucleus_id', 'area', 'proofreader_den', 'time_min_den', 'finished_den', 'date_finished_den', 'proofreader_ax', 'time_min_ax', 'notes_ax', 'finished_ax', 'date_finished_ax', 'axon_in_white_matter', 'prf_method']
+    df = df[columns].copy()
+    for col in ['excel_id', 'nucleus_id', 'finished_den', 'finished_ax', 'axon_in_white_matter']:
+        df[col] = pd.to_numeric(df[col]).astype(float)
+    for col in ['time_min_den', 'time_min_ax']:
+        df[col] = pd.to_numeric(df[col]).round(4)
+    return df.astype(str).sort_values('nucleus_id').reset_index(drop=True)
+
+
+def run_sheet(m65mprf, monkeypatch, path, version, logs=None):
+    table = m65mprf.ImportMethod.ExcelPrfSheet()
+    monkeypatch.setattr(table, 'fetch1', lambda: {'version': version, 'path_to_csv': str(path), 'import_method': 'test'})
+    monkeypatch.setattr(table, 'Log', lambda *args, **kwargs: logs.append(args) if logs is not None else None)
+    return table.run()['df']
+
+
+@pytest.mark.parametrize('n', [300, 5000])
+def test_excel_prf_sheet_versions_match_v1(m65mprf, monkeypatch, tmp_path, n):
+    monkeypatch.setattr(m65mprf, 'fetch_nucleus_ids', lambda relation, nucleus_ids: np.unique(nucleus_ids)) # every nucleus exists
+    monkeypatch.setattr(m65mprf.ImportMethod.ExcelPrfSheet, 'chunksize', 128) # several chunks
+    path = synthetic_sheet(tmp_path.joinpath('sheet.csv'), np.arange(1, n + 1), seed=n)
+    sheet = pd.read_csv(path)
+    pd.concat([sheet.iloc[:10], pd.DataFrame([[None] * sheet.shape[1]], columns=sheet.columns), sheet.iloc[10:]]).to_csv(path, index=False) # a row without a nucleus_id
+
+    expected = normalize_sheet(run_sheet(m65mprf, monkeypatch, path, 1))
+    assert len(expected)
+    for version in [2, 3]:
+        pd.testing.assert_frame_equal(normalize_sheet(run_sheet(m65mprf, monkeypatch, path, version)), expected)
+
+
+def test_excel_prf_sheet_versions_match_v1_with_duplicate_nucleus_ids(m65mprf, monkeypatch, tmp_path):
+    monkeypatch.setattr(m65mprf, 'fetch_nucleus_ids', lambda relation, nucleus_ids: np.unique(nucleus_ids))
+    monkeypatch.setattr(m65mprf.ImportMethod.ExcelPrfSheet, 'chunksize', 64)
+    path = synthetic_sheet(tmp_path.joinpath('sheet.csv'), np.arange(1, 301), seed=0)
+    sheet = pd.read_csv(path).assign(finished_den=True)
+    unfinished = sheet.iloc[[20]].assign(finished_den=False) # same nucleus_id as row 20, not finished
+    pd.concat([sheet.iloc[:30], unfinished, sheet.iloc[30:60], sheet.iloc[[40]], sheet.iloc[60:]]).to_csv(path, index=False) # with a copy of row 40, both shift the positions of the rows after them
+
+    expected = normalize_sheet(run_sheet(m65mprf, monkeypatch, path, 1))
+    assert len(expected)
+    for version in [2, 3]:
+        pd.testing.assert_frame_equal(normalize_sheet(run_sheet(m65mprf, monkeypatch, path, version)), expected)
+
+
+def test_excel_prf_sheet_v3_rejects_invalid_rows(m65mprf, monkeypatch, tmp_path):
+    monkeypatch.setattr(m65mprf, 'fetch_nucleus_ids', lambda relation, nucleus_ids: np.unique(nucleus_ids))
+    path = synthetic_sheet(tmp_path.joinpath('sheet.csv'), np.arange(1, 101))
+    expected = normalize_sheet(run_sheet(m65mprf, monkeypatch, path, 1))
+    sheet = pd.read_csv(path, dtype=str)
+    invalid = sheet.index[(sheet.finished_den.str.strip().str.lower() == 'true') & (sheet.finished_ax.str.strip().str.lower() == 'true')][:3]
+    sheet.loc[invalid, 'time_min_den'] = 'five'
+    sheet.to_csv(path, index=False)
+
+    with pytest.raises(ValueError, match='invalid rows'):
+        run_sheet(m65mprf, monkeypatch, path, 3)
+    monkeypatch.setattr(m65mprf.ImportMethod.ExcelPrfSheet, 'on_invalid', 'drop')
+    expected = expected[~expected.excel_id.isin(sheet.loc[invalid, '#'].astype(float).astype(str))].reset_index(drop=True) # finished rows that are valid
+    pd.testing.assert_frame_equal(normalize_sheet(run_sheet(m65mprf, monkeypatch, path, 3)), expected)
+
+
+@pytest.mark.parametrize('flag', ['Ture', 'yes', None])
+def test_excel_prf_sheet_v3_rejects_misspelled_finished_flag(m65mprf, monkeypatch, tmp_path, flag):
+    monkeypatch.setattr(m65mprf, 'fetch_nucleus_ids', lambda relation, nucleus_ids: np.unique(nucleus_ids))
+    path = synthetic_sheet(tmp_path.joinpath('sheet.csv'), np.arange(1, 101), seed=5)
+    sheet = pd.read_csv(path, dtype=str)
+    row = sheet.index[sheet.finished_den.str.strip().str.lower() == 'true'][0]
+    sheet.loc[row, 'finished_ax'] = flag
+    sheet.to_csv(path, index=False)
+
+    with pytest.raises(ValueError, match='1 invalid rows'): # not left out as an unfinished row
+        run_sheet(m65mprf, monkeypatch, path, 3)
+
+
+def test_excel_prf_sheet_v3_warns_on_invalid_unfinished_rows(m65mprf, monkeypatch, tmp_path):
+    monkeypatch.setattr(m65mprf, 'fetch_nucleus_ids', lambda relation, nucleus_ids: np.unique(nucleus_ids))
+    path = synthetic_sheet(tmp_path.joinpath('sheet.csv'), np.arange(1, 101), seed=4)
+    expected = normalize_sheet(run_sheet(m65mprf, monkeypatch, path, 3))
+    sheet = pd.read_csv(path, dtype=str)
+    finished = (sheet.finished_den.str.strip().str.lower() == 'true') & (sheet.finished_ax.str.strip().str.lower() == 'true')
+    unfinished = sheet.index[~finished][:3]
+    assert len(unfinished) == 3
+    sheet.loc[unfinished[0], 'time_min_den'] = 'five'
+    sheet.loc[unfinished[1], 'Description'] = None
+    sheet.loc[unfinished[2], 'nucleus_id'] = sheet.nucleus_id[finished].iloc[0] # duplicates a finished row, which stays valid
+    sheet.to_csv(path, index=False)
+
+    logs = []
+    pd.testing.assert_frame_equal(normalize_sheet(run_sheet(m65mprf, monkeypatch, path, 3, logs)), expected) # on_invalid is 'raise'
+    assert [level for level, msg in logs] == ['warning']
+    assert '2 invalid unfinished rows' in logs[0][1]
+
+
+def test_import_method_cave_run_matches_merge(m65mprf, monkeypatch, tmp_path, cave_tables):
+    CAVE = m65mprf.ImportMethod.CAVE
+    client = FakeCAVEClient(cave_tables, 1)
+    fetcher = AsyncCAVEFetcher()
+    fetcher.add_client(client)
+    monkeypatch.setattr(CAVE, 'fetcher', fetcher)
+    monkeypatch.setattr(CAVE, 'cache', TableCache(tmp_path.joinpath('cache')))
+    monkeypatch.setattr(CAVE, 'index_dir', tmp_path.joinpath('indexes'))
+    monkeypatch.setattr(CAVE, '_root_indexes', {})
+
+    status_df, nuc_df = cave_tables['proofreading_status'], cave_tables['nucleus_detection_v0']
+    expected = status_df.loc[status_df.valid, ['pt_root_id', 'status_dendrite', 'status_axon']].merge(nuc_df[['id', 'pt_root_id']], on='pt_root_id').rename(columns={'id': 'nucleus_id'})
+    expected = expected[['nucleus_id', 'status_dendrite', 'status_axon']].assign(import_method='test')
+
+    table = CAVE()
+    monkeypatch.setattr(table, 'fetch1', lambda: {'table_name': 'proofreading_status', 'ver': 1, 'tag': m65mprf.Tag.version, 'import_method': 'test'})
+    for n_queries in [2, 2]: # the second run reads the status table from cache and the root_id index from disk
+        df = table.run()['df']
+        assert client.materialize.n_queries == n_queries
+        pd.testing.assert_frame_equal(df.sort_values('nucleus_id').reset_index(drop=True), expected.sort_values('nucleus_id').reset_index(drop=True), check_dtype=False)
+
+
+def test_excel_prf_sheet_content_moved(m65mprf, monkeypatch, tmp_path, delete_after):
+    monkeypatch.setattr(m65mprf, 'fetch_nucleus_ids', lambda relation, nucleus_ids: np.unique(nucleus_ids))
+    Content = m65mprf.ImportMethod.ExcelPrfSheetContent
+    path = synthetic_sheet(tmp_path.joinpath('sheet.csv'), np.arange(1, 101), seed=1)
+    import_method = Content.fill(path)
+    delete_after(m65mprf.ImportMethod & {'import_method': import_method})
+    expected = m65mprf.ImportMethod.run({'import_method': import_method})['df']
+
+    moved = path.rename(tmp_path.joinpath('moved.csv'))
+    assert Content.fill(moved) == import_method
+    assert (Content & {'import_method': import_method}).fetch1('path_to_csv') == str(moved)
+    pd.testing.assert_frame_equal(m65mprf.ImportMethod.run({'import_method': import_method})['df'], expected)
+
+
+def test_excel_prf_sheet_content_edited(m65mprf, monkeypatch, tmp_path, delete_after):
+    monkeypatch.setattr(m65mprf, 'fetch_nucleus_ids', lambda relation, nucleus_ids: np.unique(nucleus_ids))
+    Content = m65mprf.ImportMethod.ExcelPrfSheetContent
+    path = synthetic_sheet(tmp_path.joinpath('sheet.csv'), np.arange(1, 101), seed=2)
+    import_method = Content.fill(path)
+    delete_after(m65mprf.ImportMethod & {'import_method': import_method})
+
+    synthetic_sheet(path, np.arange(1, 102), seed=2) # one more row
+    with pytest.raises(ValueError, match='changed since it was registered'):
+        m65mprf.ImportMethod.run({'import_method': import_method})
+    edited = Content.fill(path)
+    delete_after(m65mprf.ImportMethod & {'import_method': edited})
+    assert edited != import_method
+    assert (Content & {'import_method': edited}).fetch1('base_import_method') == import_method
+
+
+def test_excel_prf_sheet_maker_sends_only_changed_rows(m65mprf, monkeypatch, tmp_path, delete_after):
+    nucleus_ids = m65mprf.m65mprf.m65mat.Nucleus.fetch('nucleus_id', limit=300, order_by='nucleus_id')
+    if len(nucleus_ids) < 300:
+        pytest.skip('m65mat.Nucleus has fewer than 300 nuclei')
+    Content, Maker = m65mprf.ImportMethod.ExcelPrfSheetContent, m65mprf.PrfNucleusSet.ExcelPrfSheetMaker
+    path = synthetic_sheet(tmp_path.joinpath('sheet.csv'), nucleus_ids[:250], seed=6)
+    import_methods = [Content.fill(path)]
+    delete_after(m65mprf.ImportMethod & {'import_method': import_methods[0]})
+    Maker.populate({'import_method': import_methods[0]})
+
+    sheet = pd.read_csv(path, dtype=str)
+    sheet.loc[:4, 'Proofreader'] = 'p4' # 5 rows edited
+    sheet = pd.concat([sheet, pd.read_csv(synthetic_sheet(tmp_path.joinpath('new.csv'), nucleus_ids[250:], seed=7), dtype=str)]) # 50 rows added
+    sheet.to_csv(path, index=False)
+    import_methods.append(Content.fill(path))
+    delete_after(m65mprf.ImportMethod & {'import_method': import_methods[1]})
+    sent = []
+    batch_insert = m65mprf.batch_insert
+    monkeypatch.setattr(m65mprf, 'batch_insert', lambda table, rows, **kwargs: sent.append((table.class_name, len(rows))) or batch_insert(table, rows, **kwargs))
+    Maker.populate({'import_method': import_methods[1]})
+
+    df = m65mprf.ImportMethod.run({'import_method': import_methods[1]})['df']
+    prf_nuc_sets = [(Maker & {'import_method': i}).fetch('prf_nuc_set', limit=1)[0] for i in import_methods]
+    for prf_nuc_set in prf_nuc_sets:
+        delete_after(m65mprf.PrfNucleusSet & {'prf_nuc_set': prf_nuc_set})
+    members = pd.DataFrame((m65mprf.PrfNucleusSet.ExcelPrfSheet & {'prf_nuc_set': prf_nuc_sets[1]}).fetch(as_dict=True))
+    assert sorted(members.nucleus_id) == sorted(df.nucleus_id.astype(int))
+    is_edited = df.nucleus_id.astype(int).isin(nucleus_ids[:5])
+    assert dict(sent)[m65mprf.PrfNucleusSet.ExcelPrfSheet.class_name] == (is_edited | df.nucleus_id.astype(int).isin(nucleus_ids[250:])).sum() # unchanged rows are copied in the database
+    assert (members[members.nucleus_id.isin(df.nucleus_id[is_edited].astype(int))].proofreader_den == 'p4').all()
+
+
+def test_exclusion_method_id_is_most_recent(m65mprf, delete_after):
+    Manual = m65mprf.ExclusionMethod.Manual
+    name = f'test_{time.time_ns() % 10**9}'
+    delete_after(m65mprf.ExclusionMethod & (Manual & {'exclusion_method_name': name}).proj())
+    Manual.update_method(name, 'first description')
+    first = Manual.method_id(name)
+    time.sleep(1.1) # exclusion_method_ts has a resolution of one second
+    Manual.update_method(name, 'second description')
+    second = Manual.method_id(name)
+    assert second != first
+    assert (Manual & {'exclusion_method_id': second}).fetch1('exclusion_method_desc') == 'second description'
+
+
+def test_include_set_fill_server_side_matches_client(m65mprf, monkeypatch, tmp_path, delete_after):
+    from microns_manual_proofreading_api.utils.connection_utils import shared_conn
+    nucleus_ids = m65mprf.m65mprf.m65mat.Nucleus.fetch('nucleus_id', limit=300, order_by='nucleus_id')
+    if len(nucleus_ids) < 300:
+        pytest.skip('m65mat.Nucleus has fewer than 300 nuclei')
+    path = synthetic_sheet(tmp_path.joinpath('sheet.csv'), nucleus_ids, seed=3)
+    import_method = m65mprf.ImportMethod.ExcelPrfSheetContent.fill(path)
+    delete_after(m65mprf.ImportMethod & {'import_method': import_method})
+    m65mprf.PrfNucleusSet.ExcelPrfSheetMaker.populate({'import_method': import_method})
+    prf_nuc_set = (m65mprf.PrfNucleusSet.ExcelPrfSheetMaker & {'import_method': import_method}).fetch1('prf_nuc_set')
+    delete_after(m65mprf.PrfNucleusSet & {'prf_nuc_set': prf_nuc_set})
+
+    ts_computed = datetime(2000, 1, 1, 0, 0, time.time_ns() % 60)
+    monkeypatch.setattr(m65mprf, 'datetime', type('datetime', (), {'utcnow': staticmethod(lambda: ts_computed)}))
+    monkeypatch.setattr(m65mprf, 'nucleus_id_chunksize', 64) # several batches of keys
+    Member = m65mprf.PrfNucleusIncludeSet.Member
+    members = Member & {'ts_computed': ts_computed}
+    fetch_members = lambda: pd.DataFrame(members.fetch(as_dict=True, order_by='nucleus_id'))
+
+    Member.fill(prf_nuc_set, server_side=False)
+    expected = fetch_members()
+    assert len(expected) == len(nucleus_ids)
+    with dj.config(safemode=False):
+        (m65mprf.PrfNucleusIncludeSet & members.proj()).delete(verbose=False)
+
+    statements = []
+    connection = shared_conn()
+    query = connection.query
+    monkeypatch.setattr(connection, 'query', lambda sql, *args, **kwargs: statements.append(sql) or query(sql, *args, **kwargs))
+    with count_queries(connection) as counter:
+        Member.fill(prf_nuc_set, server_side=True)
+    delete_after(m65mprf.PrfNucleusIncludeSet & members.proj())
+    pd.testing.assert_frame_equal(fetch_members(), expected)
+    assert counter['n_queries'] == len(statements)
+    selects = [sql.split(' FROM ')[0] for sql in statements if sql.lstrip().upper().startswith('SELECT')]
+    assert not [sql for sql in selects if '`area`' in sql] # rows are copied by INSERT ... SELECT, only keys are fetched
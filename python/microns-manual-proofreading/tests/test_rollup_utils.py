@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+rollup_utils = pytest.importorskip('microns_manual_proofreading.utils.rollup_utils')
+
+
+def sheet_rows(n=2000, seed=0):
+    """
+    Returns synthetic ExcelPrfSheet rows with missing, blank and differently cased proofreaders and areas.
+    """
+    rng = np.random.default_rng(seed)
+    names = ['Alice', 'alice ', ' ALICE', 'Bob', 'bob', '', None]
+    dates = ['1/3/2022', '1/5/2022', '1/12/2022', None, 'not a date']
+    return pd.DataFrame({
+        'area': rng.choice(['V1', 'v1 ', 'RL', None], n),
+        'prf_method': rng.choice(['a1b2c3', 'd4e5f6'], n),
+        **{f'proofreader_{s}': rng.choice(names, n) for s in ['den', 'ax']},
+        **{f'time_min_{s}': np.where(rng.random(n) < 0.1, np.nan, rng.random(n) * 300) for s in ['den', 'ax']},
+        **{f'finished_{s}': rng.choice([1, 0, None], n) for s in ['den', 'ax']},
+        **{f'date_finished_{s}': rng.choice(dates, n) for s in ['den', 'ax']},
+    })
+
+
+def brute_force(df):
+    """
+    Returns one row per compartment of every row worked on, with normalized attributes.
+    """
+    rows = []
+    for compartment, s in rollup_utils.compartments.items():
+        for r in df.to_dict('records'):
+            name = r[f'proofreader_{s}']
+            name = name.strip().casefold() if name is not None and name.strip() else None
+            finished = bool(r[f'finished_{s}']) if r[f'finished_{s}'] is not None else False
+            if name is None and not finished:
+                continue
+            date = pd.to_datetime(r[f'date_finished_{s}'], errors='coerce')
+            rows.append({
+                'compartment': compartment,
+                'proofreader': name or 'unknown',
+                'area': r['area'].strip().upper() if r['area'] is not None else 'unknown',
+                'prf_method': r['prf_method'],
+                'week': (date - pd.Timedelta(days=date.weekday())).strftime('%Y-%m-%d') if not pd.isnull(date) else 'unknown',
+                'finished': finished,
+                'time_min': r[f'time_min_{s}'],
+            })
+    return pd.DataFrame(rows)
+
+
+def test_parse_week_mixed_formats(monkeypatch):
+    warnings = []
+    monkeypatch.setattr(rollup_utils.logger, 'warning', warnings.append)
+    dates = ['2023-03-01', '03/02/2023', '2023-03-03 10:00', 'March 4, 2023', '3/6/2023', 'not a date', '', None]
+    weeks = rollup_utils.parse_week(dates)
+    assert weeks.tolist() == ['2023-02-27'] * 4 + ['2023-03-06'] + [rollup_utils.unknown] * 3
+    assert len(warnings) == 1 and 'Could not parse 1 of 8 dates' in warnings[0]
+
+
+def test_throughput_matches_brute_force():
+    df = sheet_rows()
+    rollups = rollup_utils.throughput(df)
+    rows = brute_force(df)
+    expected = rows.groupby(rollup_utils.group_attrs).agg(
+        n_nuclei=('finished', 'size'),
+        n_finished=('finished', 'sum'),
+        n_timed=('time_min', 'count'),
+        time_min_total=('time_min', 'sum'),
+    ).reset_index()
+    pd.testing.assert_frame_equal(rollups.drop(columns='time_hist'), expected, check_dtype=False)
+    assert set(rollups.proofreader) == {'alice', 'bob', 'unknown'}
+    assert set(rollups.area) == {'V1', 'RL', 'unknown'}
+    assert not rollups.duplicated(rollup_utils.group_attrs).any()
+    assert [h.sum() for h in rollups.time_hist] == rollups.n_timed.tolist()
+
+
+def test_throughput_groups_collide_like_mysql():
+    """
+    No two groups differ only by case or trailing spaces, which MySQL would treat as the same primary key.
+    """
+    rollups = rollup_utils.throughput(sheet_rows())
+    keys = rollups[rollup_utils.group_attrs].astype(str).apply(lambda c: c.str.rstrip().str.lower())
+    assert not keys.duplicated().any()
+
+
+def test_throughput_empty():
+    df = sheet_rows(n=10)
+    df[['proofreader_den', 'proofreader_ax', 'finished_den', 'finished_ax']] = None
+    assert rollup_utils.throughput(df).empty
+
+
+def test_percentile():
+    hist = np.zeros(rollup_utils.n_bins, dtype=np.uint32)
+    assert np.isnan(rollup_utils.percentile(hist, 50))
+    hist[5] = 10
+    assert rollup_utils.percentile(hist, 50) == pytest.approx(5.5 * rollup_utils.bin_width_min)
+    assert rollup_utils.percentile(hist, 100) == pytest.approx(6 * rollup_utils.bin_width_min)
+    hist[:] = 1
+    for q in [10, 50, 90]:
+        assert rollup_utils.percentile(hist, q) == pytest.approx(q / 100 * rollup_utils.n_bins * rollup_utils.bin_width_min)
+
+
+@pytest.mark.parametrize('by', [(), ('proofreader',), ('compartment', 'area')])
+def test_combine_matches_raw_times(by):
+    df = sheet_rows(seed=1)
+    rows = brute_force(df)
+    combined = rollup_utils.combine(rollup_utils.throughput(df), by=by, percentiles=(50, 90))
+    groups = rows.groupby(list(by)) if by else [((), rows)]
+    assert len(combined) == len(groups)
+    for values, group in groups:
+        row = combined.iloc[0] if not by else combined.set_index(list(by)).loc[values]
+        times = group.time_min.dropna()
+        assert row.n_nuclei == len(group)
+        assert row.n_finished == group.finished.sum()
+        assert row.n_timed == len(times)
+        assert row.time_min_total == pytest.approx(times.sum())
+        assert row.time_min_mean == pytest.approx(times.mean())
+        for q in [50, 90]:
+            assert abs(row[f'time_min_p{q}'] - np.percentile(times, q)) <= rollup_utils.bin_width_min
+
+
+def test_combine_empty():
+    combined = rollup_utils.combine(rollup_utils.throughput(sheet_rows(n=0)))
+    assert combined.empty
+    assert list(combined.columns) == ['proofreader', 'n_nuclei', 'n_finished', 'n_timed', 'time_min_total', 'time_min_mean', 'time_min_p50', 'time_min_p90']
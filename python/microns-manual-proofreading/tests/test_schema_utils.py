@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+dj = pytest.importorskip('datajoint')
+djp = pytest.importorskip('datajoint_plus')
+schema_utils = pytest.importorskip('microns_manual_proofreading_api.utils.schema_utils')
+bench_utils = pytest.importorskip('microns_manual_proofreading.utils.bench_utils')
+
+from microns_manual_proofreading.utils.instrument_utils import count_queries
+
+
+class Activated(Exception):
+    pass
+
+
+class RecordingConnection:
+    """
+    Stand-in for a DataJoint connection that records and fails every query, even if the caller catches the error.
+    """
+    def __init__(self):
+        self.queries = []
+
+    def query(self, sql, *args, **kwargs):
+        self.queries.append(sql)
+        raise AssertionError(f'unexpected query: {sql}')
+
+
+def test_datajoint_checks_schema_exists_on_activation():
+    class Probe(dj.Schema):
+        @property
+        def exists(self):
+            raise Activated
+
+    with pytest.raises(Activated): # Schema.exists is answered by the lookup while activating
+        Probe('probe', connection=RecordingConnection())
+
+
+def test_existing_table_is_bound_without_queries(monkeypatch):
+    monkeypatch.setattr(schema_utils, 'lookup_supported', True) # fails if DataJoint no longer reads Table.is_declared
+    class Method(djp.Manual):
+        definition = """
+        method : varchar(10)
+        """
+
+    schema = object.__new__(schema_utils.Schema)
+    schema.database, schema.connection, schema.create_tables = 'probe', RecordingConnection(), True
+    schema.existing_tables = {Method.table_name}
+    schema.process_table_class(Method, context={})
+    assert not schema.connection.queries
+    assert 'is_declared' not in Method.__dict__
+
+
+@pytest.fixture
+def connection():
+    if not bench_utils.is_local_database():
+        pytest.skip(f'dj.config["database.host"] is not a local database: {dj.config["database.host"]!r}')
+    try:
+        return dj.conn()
+    except Exception as e:
+        pytest.skip(f'Database unavailable: {e!r}')
+
+
+@pytest.fixture
+def schema_name(connection):
+    name = f'test_microns_manual_proofreading_schema_utils_{os.getpid()}'
+    yield name
+    connection.query(f'DROP DATABASE IF EXISTS `{name}`')
+
+
+def declare(schema):
+    """
+    Binds a Lookup table with a part table to schema.
+    """
+    @schema
+    class Method(djp.Lookup):
+        definition = """
+        method : varchar(10)
+        """
+        contents = [{'method': 'a'}]
+
+        class Part(djp.Part):
+            definition = """
+            -> master
+            """
+
+    return Method
+
+
+def test_schema_declares_then_binds_existing_tables(connection, schema_name):
+    assert schema_utils.existing_tables(schema_name, connection) is None
+    Method = declare(schema_utils.Schema(schema_name, connection=connection))
+    assert {'#method', '#method__part'} <= schema_utils.existing_tables(schema_name, connection)
+    assert Method.fetch1('method') == 'a'
+
+    with count_queries(connection) as plain:
+        declare(djp.schema(schema_name, connection=connection))
+    with count_queries(connection) as counter:
+        Method = declare(schema_utils.Schema(schema_name, connection=connection))
+    assert counter['n_queries'] < plain['n_queries'] # no SHOW TABLES per table
+    assert Method.is_declared and Method.Part.is_declared # the query is no longer shadowed
+    assert Method.fetch1('method') == 'a'
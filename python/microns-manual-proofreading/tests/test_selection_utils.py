@@ -0,0 +1,88 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+selection_utils = pytest.importorskip('microns_manual_proofreading.utils.selection_utils')
+ProtocolSelector = selection_utils.ProtocolSelector
+
+areas = ['V1', 'RL', 'AL', 'LM']
+
+
+@pytest.fixture
+def nuclei():
+    rng = np.random.default_rng(0)
+    n = 3000
+    df = pd.DataFrame({
+        'nucleus_id': rng.integers(1, 2000, n), # repeated nucleus_ids, e.g. one row per matched functional unit
+        'x': rng.uniform(0, 1000, n),
+        'y': rng.uniform(0, 1000, n),
+        'z': rng.uniform(0, 500, n),
+        'area': rng.choice(areas, n),
+        **{metric: rng.random(n) for metric in ProtocolSelector.metric_thresholds.values()},
+    })
+    df.loc[rng.random(n) < 0.1, 'oracle'] = np.nan # units without a metric
+    return df
+
+
+def protocols(n=40, seed=0):
+    rng = np.random.default_rng(seed)
+    maybe = lambda value: value if rng.random() < 0.5 else None
+    rows = []
+    for protocol_id in range(n):
+        row = {'protocol_id': protocol_id}
+        if rng.random() < 0.5:
+            row.update(cylinder_x=rng.uniform(0, 1000), cylinder_y=rng.uniform(0, 1000), cylinder_r=rng.uniform(10, 400))
+        for attrs in ProtocolSelector.box_bounds.values():
+            lo, hi = np.sort(rng.uniform(0, 1000, 2))
+            row.update(dict(zip(attrs, [maybe(lo), maybe(hi)])))
+        row.update({threshold: maybe(rng.uniform(0, 0.8)) for threshold in ProtocolSelector.metric_thresholds})
+        row['brain_areas'] = maybe(','.join(rng.choice(areas, rng.integers(1, 3), replace=False)))
+        row['oracle_min'] = row['oracle_min'] if row['oracle_min'] is not None else np.nan # NaN is treated as null
+        rows.append(row)
+    return rows
+
+
+def brute_force(nuclei, protocol):
+    value = lambda attr: None if protocol.get(attr) is None or (isinstance(protocol[attr], float) and np.isnan(protocol[attr])) else protocol[attr]
+    selected = set()
+    for row in nuclei.itertuples():
+        if value('cylinder_r') is not None and (row.x - protocol['cylinder_x'])**2 + (row.y - protocol['cylinder_y'])**2 > protocol['cylinder_r']**2:
+            continue
+        if any(
+            (value(lo) is not None and getattr(row, axis) < value(lo)) or (value(hi) is not None and getattr(row, axis) > value(hi)) 
+            for axis, (lo, hi) in ProtocolSelector.box_bounds.items()
+        ):
+            continue
+        if any(value(t) is not None and not getattr(row, m) >= value(t) for t, m in ProtocolSelector.metric_thresholds.items()):
+            continue
+        if value('brain_areas') is not None and row.area not in re.findall(r'\w+', protocol['brain_areas']):
+            continue
+        selected.add(row.nucleus_id)
+    return np.array(sorted(selected), dtype=np.uint64)
+
+
+@pytest.mark.parametrize('n_cells', [1, 8, 64])
+def test_select_matches_brute_force(nuclei, n_cells):
+    selector = ProtocolSelector(nuclei, n_cells=n_cells)
+    for protocol in protocols():
+        np.testing.assert_array_equal(selector.select(protocol), brute_force(nuclei, protocol))
+
+
+def test_select_all(nuclei):
+    rows = protocols(5)
+    df = ProtocolSelector(nuclei).select_all(rows)
+    for protocol in rows:
+        np.testing.assert_array_equal(np.sort(df.nucleus_id[df.protocol_id == protocol['protocol_id']].to_numpy(dtype=np.uint64)), brute_force(nuclei, protocol))
+
+
+def test_missing_columns(nuclei):
+    with pytest.raises(ValueError, match='z'):
+        ProtocolSelector(nuclei.drop(columns='z'))
+    selector = ProtocolSelector(nuclei.drop(columns=['area', 'test_corr']))
+    with pytest.raises(ValueError, match='area'):
+        selector.select({'protocol_id': 0, 'brain_areas': 'V1'})
+    with pytest.raises(ValueError, match='test_corr'):
+        selector.select({'protocol_id': 0, 'test_corr_min': 0.5})
+    assert len(selector.select({'protocol_id': 0, 'oracle_min': 0.5}))